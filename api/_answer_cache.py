@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+from _sse import SSE_FLUSH_BYTES
+
+# --- Cache Configuration ---
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+# Maximum cosine distance (1 - similarity) between two queries that may share an answer
+ANSWER_CACHE_RADIUS = float(os.environ.get("ANSWER_CACHE_RADIUS", "0.06"))
+# Characters per replayed content frame, the same size live tokens are coalesced to
+ANSWER_REPLAY_CHUNK_CHARS = int(os.environ.get("ANSWER_REPLAY_CHUNK_CHARS", str(SSE_FLUSH_BYTES)))
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    source_documents: list
+    answer: str
+    catalog_version: str = None
+
+
+class SemanticAnswerCache:
+    """Answers keyed by query embedding, served to any query within a cosine radius.
+
+    Keys live in a fixed (max_entries, dim) float32 matrix so a lookup is one
+    matrix-vector product. Slots are recycled least-recently-used first, and
+    every entry is dropped as soon as a lookup reports a new catalog version.
+    Without a version (the index is not loaded and retrieval goes through the
+    match_workflows RPC) a sync could not be noticed, so nothing is served
+    or stored.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, radius=ANSWER_CACHE_RADIUS):
+        self.max_entries = max_entries
+        self.radius = radius
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.catalog_version = None
+        self._matrix = None
+        self._entries = [None] * max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _check_version_locked(self, catalog_version):
+        if catalog_version != self.catalog_version:
+            if self._lru:
+                print(f"Catalog changed ({self.catalog_version} -> {catalog_version}), clearing answer cache")
+            self._clear_locked()
+            self.catalog_version = catalog_version
+
+    def _clear_locked(self):
+        self._entries = [None] * self.max_entries
+        self._lru.clear()
+
+    def _nearest_locked(self, vector):
+        """Best occupied slot and its similarity, or (None, -1)."""
+        if not self._lru or self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+            return None, -1.0
+        slots = np.fromiter(self._lru.keys(), dtype=np.intp, count=len(self._lru))
+        scores = self._matrix[slots] @ vector
+        best = int(np.argmax(scores))
+        return int(slots[best]), float(scores[best])
+
+    def lookup(self, embedding, catalog_version=None):
+        """Return the CachedAnswer for a near-duplicate query, or None."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version_locked(catalog_version)
+            if catalog_version is None:
+                self.bypassed += 1
+                return None
+            if vector is None:
+                self.misses += 1
+                return None
+            slot, similarity = self._nearest_locked(vector)
+            if slot is None or 1.0 - similarity > self.radius:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot]
+
+    def store(self, embedding, query, source_documents, answer, catalog_version=None):
+        vector = self._normalize(embedding)
+        if vector is None or not answer or catalog_version is None:
+            return
+        with self._lock:
+            self._check_version_locked(catalog_version)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._clear_locked()
+
+            slot, similarity = self._nearest_locked(vector)
+            if slot is None or 1.0 - similarity > self.radius:
+                if len(self._lru) < self.max_entries:
+                    slot = next(i for i, entry in enumerate(self._entries) if entry is None)
+                else:
+                    slot, _ = self._lru.popitem(last=False)
+
+            self._matrix[slot] = vector
+            self._entries[slot] = CachedAnswer(query, source_documents, answer, catalog_version)
+            self._lru[slot] = True
+            self._lru.move_to_end(slot)
+
+    def invalidate(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._lru),
+                "max_entries": self.max_entries,
+                "radius": self.radius,
+                "catalog_version": self.catalog_version,
+            }
+
+
+def split_answer(answer, chunk_chars=ANSWER_REPLAY_CHUNK_CHARS):
+    """Split text into small chunks on whitespace boundaries, like streamed tokens."""
+    chunks = []
+    start = 0
+    while start < len(answer):
+        end = min(start + chunk_chars, len(answer))
+        if end < len(answer):
+            space = answer.rfind(" ", start + 1, end + 1)
+            if space > start:
+                end = space
+        chunks.append(answer[start:end])
+        start = end
+    return chunks
+
+
+def replay_answer_events(cached):
+    """A cached answer as the same (event_type, data) sequence a live run produces."""
+    yield ('source_documents', cached.source_documents)
+    for chunk in split_answer(cached.answer):
+        yield ('content', chunk)
+
+
+# --- Process-wide Cache ---
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from _lexical_index import hybrid_match_workflows, hybrid_match_workflows_batch
+from _resilience import CircuitOpen, breakers
+from _embedding_cache import CachedEmbeddings
+from _metrics import stage as timed_stage, observe_stage, stage_errors, fallbacks, tokens_streamed
+
+# --- Stage Timeouts (seconds) ---
+# Embedding and retrieval both have local fallbacks (lexical retrieval), so
+# their deadlines are short: past them the fallback answers sooner.
+EMBED_TIMEOUT_SECONDS = float(os.environ.get("EMBED_TIMEOUT_SECONDS", "3"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.environ.get("RETRIEVAL_TIMEOUT_SECONDS", "3"))
+FIRST_TOKEN_TIMEOUT_SECONDS = float(os.environ.get("FIRST_TOKEN_TIMEOUT_SECONDS", "20"))
+TOKEN_IDLE_TIMEOUT_SECONDS = float(os.environ.get("TOKEN_IDLE_TIMEOUT_SECONDS", "15"))
+GENERATION_TIMEOUT_SECONDS = float(os.environ.get("GENERATION_TIMEOUT_SECONDS", "90"))
+# /query/batch embeds and scores every query in one call each, so those stages get more time
+BATCH_EMBED_TIMEOUT_SECONDS = float(os.environ.get("BATCH_EMBED_TIMEOUT_SECONDS", "30"))
+BATCH_RETRIEVAL_TIMEOUT_SECONDS = float(os.environ.get("BATCH_RETRIEVAL_TIMEOUT_SECONDS", "30"))
+
+# Bounded pool for the calls that only have a blocking client (supabase-py's
+# sync PostgREST client). Keeping it small caps the threads a burst can spawn.
+BLOCKING_IO_WORKERS = int(os.environ.get("BLOCKING_IO_WORKERS", "16"))
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+
+
+class StageTimeout(Exception):
+    """A pipeline stage exceeded its deadline."""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} timed out after {timeout:g}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def with_timeout(stage, awaitable, timeout):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, timeout) from None
+
+
+async def guarded(dependency, stage, make_awaitable, timeout):
+    """Await make_awaitable() under a stage deadline through the dependency's circuit breaker."""
+    breaker = breakers[dependency]
+    if not breaker.allow():
+        raise CircuitOpen(dependency)
+    started = time.perf_counter()
+    try:
+        with timed_stage(stage):
+            result = await with_timeout(stage, make_awaitable(), timeout)
+    except asyncio.CancelledError:
+        # The caller went away, which says nothing about the dependency
+        breaker.abandon()
+        raise
+    except Exception:
+        breaker.record(False, time.perf_counter() - started)
+        raise
+    breaker.record(True, time.perf_counter() - started)
+    return result
+
+
+async def embed_query_async(embeddings, query):
+    """Embed with the native async Azure client.
+
+    Only cache misses go through the breaker, so cached queries are still
+    embedded while Azure is down and cache hits never mask its error rate.
+    """
+    guard = lambda fetch: guarded("embeddings", "embedding", fetch, EMBED_TIMEOUT_SECONDS)
+    if isinstance(embeddings, CachedEmbeddings):
+        return await embeddings.aembed_query(query, guard=guard)
+    return await guard(lambda: embeddings.aembed_query(query))
+
+
+async def embed_query_or_none(embeddings, query):
+    """Embedding, or None when the embedding service fails so retrieval can go lexical-only."""
+    try:
+        return await embed_query_async(embeddings, query)
+    except Exception as e:
+        print(f"Embedding unavailable, using lexical retrieval only: {str(e)}")
+        fallbacks.inc(kind="no_embedding")
+        return None
+
+
+async def retrieve_workflows_async(supabase, query, query_embedding, match_threshold=0.1, match_count=5):
+    """Hybrid BM25 + vector retrieval (lexical-only without an embedding), off the event loop.
+
+    If the vector side fails, times out or has its Supabase breaker open, the
+    local BM25 ranking answers instead.
+    """
+    try:
+        with timed_stage("retrieval"):
+            return await with_timeout(
+                "retrieval",
+                run_blocking(hybrid_match_workflows, supabase, query, query_embedding, match_threshold, match_count),
+                RETRIEVAL_TIMEOUT_SECONDS
+            )
+    except Exception as e:
+        if query_embedding is None:
+            raise
+        print(f"Vector retrieval unavailable, using lexical retrieval only: {str(e)}")
+        fallbacks.inc(kind="lexical_retrieval")
+        return await run_blocking(hybrid_match_workflows, supabase, query, None, match_threshold, match_count)
+
+
+async def embed_queries_or_none(embeddings, queries):
+    """One embed_documents call for every uncached query, or None if the service fails."""
+    guard = lambda fetch: guarded("embeddings", "batch_embedding", fetch, BATCH_EMBED_TIMEOUT_SECONDS)
+    try:
+        if isinstance(embeddings, CachedEmbeddings):
+            return await embeddings.aembed_queries(queries, guard=guard)
+        return await guard(lambda: embeddings.aembed_documents(list(queries)))
+    except Exception as e:
+        print(f"Batch embedding unavailable, using lexical retrieval only: {str(e)}")
+        fallbacks.inc(kind="no_embedding")
+        return None
+
+
+async def retrieve_workflows_batch_async(supabase, queries, query_embeddings, match_threshold=0.1, match_count=5):
+    """Hybrid retrieval for a batch, with the vector side as one matrix product; lexical-only on failure."""
+    try:
+        with timed_stage("batch_retrieval"):
+            return await with_timeout(
+                "batch retrieval",
+                run_blocking(hybrid_match_workflows_batch, supabase, queries, query_embeddings,
+                             match_threshold, match_count),
+                BATCH_RETRIEVAL_TIMEOUT_SECONDS
+            )
+    except Exception as e:
+        if query_embeddings is None:
+            raise
+        print(f"Batch vector retrieval unavailable, using lexical retrieval only: {str(e)}")
+        fallbacks.inc(kind="lexical_retrieval")
+        return await run_blocking(hybrid_match_workflows_batch, supabase, queries, None, match_threshold, match_count)
+
+
+async def invoke_llm_async(llm, prompt):
+    return await guarded("llm", "generation", lambda: llm.ainvoke(prompt), GENERATION_TIMEOUT_SECONDS)
+
+
+async def astream_llm(llm, prompt):
+    """Yield LLM chunks, bounding time to first token, gaps between tokens and the total.
+
+    The stream counts as one call on the llm breaker: a failure or timeout at
+    any point records an error, and an open breaker fails before any request.
+    """
+    breaker = breakers["llm"]
+    if not breaker.allow():
+        raise CircuitOpen("llm")
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    deadline = loop.time() + GENERATION_TIMEOUT_SECONDS
+    stream = llm.astream(prompt).__aiter__()
+    timeout, stage = FIRST_TOKEN_TIMEOUT_SECONDS, "first token"
+    outcome = None
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise StageTimeout("generation", GENERATION_TIMEOUT_SECONDS)
+            try:
+                chunk = await with_timeout(stage, stream.__anext__(), min(timeout, remaining))
+            except StopAsyncIteration:
+                outcome = True
+                return
+            if stage == "first token":
+                observe_stage("first_token", time.perf_counter() - started)
+                timeout, stage = TOKEN_IDLE_TIMEOUT_SECONDS, "token stream"
+            tokens_streamed.inc()
+            yield chunk
+    except Exception:
+        outcome = False
+        stage_errors.inc(stage="generation")
+        raise
+    finally:
+        if outcome is None:
+            breaker.abandon()
+        else:
+            breaker.record(outcome, time.perf_counter() - started)
+            observe_stage("generation", time.perf_counter() - started)
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import base64
+import random
+import asyncio
+import httpx
+import numpy as np
+
+# --- Direct Azure OpenAI Client ---
+# The handlers only need three calls: embed a query, complete a prompt and
+# stream a completion. Making them over plain httpx keeps langchain_openai
+# (and the openai SDK, pydantic models and tiktoken behind it) out of the
+# serverless import graph. The classes mirror the LangChain methods the code
+# already calls, so either client can sit behind _clients.py.
+
+AZURE_OPENAI_MAX_RETRIES = int(os.environ.get("AZURE_OPENAI_MAX_RETRIES", "2"))
+AZURE_OPENAI_TIMEOUT_SECONDS = float(os.environ.get("AZURE_OPENAI_TIMEOUT_SECONDS", "60"))
+_RETRY_STATUSES = frozenset((408, 409, 429, 500, 502, 503, 504))
+
+
+class ChatMessage:
+    """The part of LangChain's AIMessage / AIMessageChunk the handlers read."""
+
+    __slots__ = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+
+def _retry_delay(attempt, response=None):
+    """Retry-After from the response when Azure sends one, else jittered exponential backoff."""
+    headers = response.headers if response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return 0.5 * 2 ** attempt * (0.75 + random.random() / 2)
+
+
+class _AzureDeployment:
+    def __init__(self, endpoint, api_key, deployment, api_version, max_retries=AZURE_OPENAI_MAX_RETRIES):
+        if not endpoint:
+            raise ValueError(f"No Azure OpenAI endpoint configured for {deployment}")
+        self.url = f"{endpoint.rstrip('/')}/openai/deployments/{deployment}"
+        self.params = {"api-version": api_version}
+        self.headers = {"api-key": api_key or ""}
+        self.max_retries = max_retries
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.Client(headers=self.headers, timeout=AZURE_OPENAI_TIMEOUT_SECONDS)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(headers=self.headers, timeout=AZURE_OPENAI_TIMEOUT_SECONDS)
+        return self._async_client
+
+    def _post(self, path, body):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.post(f"{self.url}/{path}", params=self.params, json=body)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(_retry_delay(attempt))
+                continue
+            if response.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                time.sleep(_retry_delay(attempt, response))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def _apost(self, path, body):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.async_client.post(f"{self.url}/{path}", params=self.params, json=body)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+            if response.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                await asyncio.sleep(_retry_delay(attempt, response))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+
+class AzureEmbeddingsClient(_AzureDeployment):
+    """embed_query / embed_documents (and async variants) against an embeddings deployment."""
+
+    @staticmethod
+    def _vectors(payload):
+        # base64 float32 is a fraction of the size of a JSON float list and decodes in one call
+        rows = sorted(payload["data"], key=lambda row: row["index"])
+        return [np.frombuffer(base64.b64decode(row["embedding"]), dtype="<f4").tolist() for row in rows]
+
+    def embed_documents(self, texts):
+        return self._vectors(self._post("embeddings", {"input": list(texts), "encoding_format": "base64"}))
+
+    async def aembed_documents(self, texts):
+        return self._vectors(await self._apost("embeddings", {"input": list(texts), "encoding_format": "base64"}))
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class AzureChatClient(_AzureDeployment):
+    """invoke / ainvoke / astream against a chat completions deployment."""
+
+    def __init__(self, endpoint, api_key, deployment, api_version, temperature=0.7,
+                 max_retries=AZURE_OPENAI_MAX_RETRIES):
+        super().__init__(endpoint, api_key, deployment, api_version, max_retries)
+        self.temperature = temperature
+
+    def _body(self, prompt, stream=False):
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "stream": stream,
+        }
+
+    @staticmethod
+    def _message(payload):
+        return ChatMessage(payload["choices"][0]["message"].get("content") or "")
+
+    def invoke(self, prompt):
+        return self._message(self._post("chat/completions", self._body(prompt)))
+
+    async def ainvoke(self, prompt):
+        return self._message(await self._apost("chat/completions", self._body(prompt)))
+
+    async def astream(self, prompt):
+        """Yield ChatMessage chunks as the completion streams in.
+
+        Retries only happen before the first chunk, on a retryable status.
+        """
+        for attempt in range(self.max_retries + 1):
+            async with self.async_client.stream(
+                "POST", f"{self.url}/chat/completions", params=self.params, json=self._body(prompt, stream=True)
+            ) as response:
+                if response.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                    await asyncio.sleep(_retry_delay(attempt, response))
+                    continue
+                if response.status_code >= 400:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    # Azure's first chunk carries content filter results and no choices
+                    for choice in json.loads(data).get("choices") or ():
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            yield ChatMessage(content)
+                return
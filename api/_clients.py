@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+
+# --- Shared Client Registry ---
+# One Supabase client, one embeddings client and one chat client per process.
+# Each wraps a long-lived httpx session, so reusing them keeps the keep-alive
+# connection pools to Supabase and Azure warm instead of paying a TLS
+# handshake per request. Serverless handlers fetch them per request and reuse
+# them for as long as the function instance stays warm.
+#
+# Every client library is imported on first use, so a handler only pays the
+# import cost of the clients it actually calls (star_count never loads the
+# embedding or chat stack).
+
+EMBEDDING_DEPLOYMENT = "text-embedding-3-large"
+CHAT_DEPLOYMENT = "gpt-4-32k"
+OPENAI_API_VERSION = "2024-02-01"
+# "direct" calls Azure OpenAI over plain httpx (_azure_openai.py); "langchain" uses langchain_openai
+AZURE_OPENAI_CLIENT = os.environ.get("AZURE_OPENAI_CLIENT", "direct")
+
+_lock = threading.Lock()
+_supabase = None
+_embeddings = None
+_llms = {}
+
+# Readiness is tracked per dependency and updated by warm_up()
+readiness = {
+    "supabase": False,
+    "embeddings": False,
+    "started_at": time.time(),
+    "warmed_up_at": None,
+}
+
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+                _supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    return _supabase
+
+
+def get_embeddings():
+    """Shared query-embedding client, fronted by the process-wide embedding cache."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from _embedding_cache import CachedEmbeddings, query_embedding_cache
+                if AZURE_OPENAI_CLIENT == "langchain":
+                    from langchain_openai import AzureOpenAIEmbeddings
+                    client = AzureOpenAIEmbeddings(
+                        azure_deployment=EMBEDDING_DEPLOYMENT,
+                        openai_api_version=OPENAI_API_VERSION,
+                        azure_endpoint=os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT"),
+                        api_key=os.environ.get("AZURE_OPENAI_EMBEDDING_API_KEY")
+                    )
+                else:
+                    from _azure_openai import AzureEmbeddingsClient
+                    client = AzureEmbeddingsClient(
+                        os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT"),
+                        os.environ.get("AZURE_OPENAI_EMBEDDING_API_KEY"),
+                        EMBEDDING_DEPLOYMENT,
+                        OPENAI_API_VERSION
+                    )
+                _embeddings = CachedEmbeddings(client, query_embedding_cache, namespace=EMBEDDING_DEPLOYMENT)
+    return _embeddings
+
+
+def get_llm(streaming=False):
+    """Shared chat client; streaming and non-streaming variants are cached separately."""
+    llm = _llms.get(streaming)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(streaming)
+            if llm is None:
+                if AZURE_OPENAI_CLIENT == "langchain":
+                    from langchain_openai import AzureChatOpenAI
+                    llm = AzureChatOpenAI(
+                        deployment_name=CHAT_DEPLOYMENT,
+                        openai_api_version=OPENAI_API_VERSION,
+                        azure_endpoint=os.environ.get("AZURE_OPENAI_CHAT_ENDPOINT"),
+                        api_key=os.environ.get("AZURE_OPENAI_CHAT_API_KEY"),
+                        temperature=0.7,
+                        streaming=streaming
+                    )
+                else:
+                    # One client serves both: invoke() and astream() pick the mode per call
+                    from _azure_openai import AzureChatClient
+                    llm = AzureChatClient(
+                        os.environ.get("AZURE_OPENAI_CHAT_ENDPOINT"),
+                        os.environ.get("AZURE_OPENAI_CHAT_API_KEY"),
+                        CHAT_DEPLOYMENT,
+                        OPENAI_API_VERSION,
+                        temperature=0.7
+                    )
+                _llms[streaming] = llm
+    return llm
+
+
+def warm_up():
+    """Open the Supabase and Azure embedding connections before the first real request."""
+    try:
+        get_supabase().rpc('get_star_count').execute()
+        readiness["supabase"] = True
+    except Exception as e:
+        readiness["supabase"] = False
+        print(f"Supabase warm-up failed: {str(e)}")
+
+    try:
+        # Goes through the cache, so this costs one embedding call per process at most
+        get_embeddings().embed_query("n8n workflow")
+        readiness["embeddings"] = True
+    except Exception as e:
+        readiness["embeddings"] = False
+        print(f"Embedding warm-up failed: {str(e)}")
+
+    # Constructing the chat clients up front keeps their setup off the first query
+    get_llm(streaming=True)
+    get_llm(streaming=False)
+    readiness["warmed_up_at"] = time.time()
+    return is_ready()
+
+
+def is_ready():
+    return readiness["supabase"] and readiness["embeddings"]
@@ -0,0 +1,247 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# --- Cache Configuration ---
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+# Optional SQLite file so the cache survives restarts (e.g. /tmp/embedding_cache.db)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, punctuation and whitespace so trivially different queries share a key."""
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """Bounded LRU + TTL cache of query embeddings, optionally backed by SQLite.
+
+    Vectors are held as float32 arrays (12 KB for text-embedding-3-large)
+    rather than Python float lists, which are roughly ten times larger.
+
+    The in-memory LRU is read on the caller's thread. All SQLite work runs on
+    one dedicated thread: aget() awaits disk lookups there, and put() only
+    queues the row, which that thread writes with one commit per batch.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL, path=EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk = None
+        # Rows put() has queued for the disk thread, newest value per key
+        self._pending_writes = {}
+        self._write_scheduled = False
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, created_at REAL NOT NULL, embedding BLOB NOT NULL)"
+                )
+                self._db.commit()
+                self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            except sqlite3.Error as e:
+                print(f"Embedding cache disk store unavailable, using memory only: {str(e)}")
+                self._db = None
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    # --- Disk Thread ---
+    def _load_from_disk(self, key, now):
+        try:
+            row = self._db.execute(
+                "SELECT created_at, embedding FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            created_at, blob = row
+            if self._expired(created_at, now):
+                self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            return created_at, np.frombuffer(blob, dtype=np.float32)
+        except sqlite3.Error as e:
+            print(f"Embedding cache read failed: {str(e)}")
+            return None
+
+    def _write_pending(self):
+        with self._lock:
+            rows = [(key, created_at, blob) for key, (created_at, blob) in self._pending_writes.items()]
+            self._pending_writes.clear()
+            self._write_scheduled = False
+        if not rows:
+            return
+        try:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, created_at, embedding) VALUES (?, ?, ?)", rows
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Embedding cache write of {len(rows)} rows failed: {str(e)}")
+
+    # --- Memory ---
+    def _remember(self, key, created_at, vector):
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _from_memory(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0], now):
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def _found(self, key, entry):
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, *entry)
+            self.hits += 1
+            return entry[1].tolist()
+
+    def get(self, key):
+        """Return the cached embedding as a list of floats, or None; blocks on a disk lookup."""
+        now = time.time()
+        with self._lock:
+            entry = self._from_memory(key, now)
+        if entry is None and self._disk is not None:
+            entry = self._disk.submit(self._load_from_disk, key, now).result()
+        return self._found(key, entry)
+
+    async def aget(self, key):
+        """get() for the event loop: a memory miss awaits the disk thread instead of blocking."""
+        now = time.time()
+        with self._lock:
+            entry = self._from_memory(key, now)
+        if entry is None and self._disk is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(self._disk, self._load_from_disk, key, now)
+        return self._found(key, entry)
+
+    def put(self, key, embedding):
+        now = time.time()
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, now, vector)
+            if self._disk is None:
+                return
+            self._pending_writes[key] = (now, vector.tobytes())
+            if self._write_scheduled:
+                return
+            self._write_scheduled = True
+        self._disk.submit(self._write_pending)
+
+    def flush(self):
+        """Block until every queued write has reached SQLite."""
+        if self._disk is not None:
+            self._disk.submit(self._write_pending).result()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending_writes.clear()
+        if self._disk is not None:
+            def clear_disk():
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+            self._disk.submit(clear_disk).result()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._db is not None,
+                "pending_writes": len(self._pending_writes),
+            }
+
+
+class CachedEmbeddings:
+    """Wraps an embeddings client so embed_query is served from an EmbeddingCache.
+
+    Keys include the deployment name so switching models never serves
+    vectors from the old embedding space.
+    """
+
+    def __init__(self, embeddings, cache, namespace="text-embedding-3-large"):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = namespace
+
+    def cache_key(self, text):
+        return f"{self.namespace}:{normalize_query(text)}"
+
+    def embed_query(self, text):
+        key = self.cache_key(text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.put(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text, guard=None):
+        """guard, if given, wraps the service call on a miss (e.g. a circuit breaker)."""
+        key = self.cache_key(text)
+        embedding = await self.cache.aget(key)
+        if embedding is None:
+            fetch = lambda: self.embeddings.aembed_query(text)
+            embedding = await (guard(fetch) if guard is not None else fetch())
+            self.cache.put(key, embedding)
+        return embedding
+
+    async def aembed_queries(self, texts, guard=None):
+        """Embeddings for many queries: cache hits plus one embed_documents call for the misses.
+
+        Texts that normalize to the same key are embedded once.
+        """
+        keys = [self.cache_key(text) for text in texts]
+        found = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            embedding = await self.cache.aget(key)
+            if embedding is None:
+                missing[key] = text
+            else:
+                found[key] = embedding
+        if missing:
+            fetch = lambda: self.embeddings.aembed_documents(list(missing.values()))
+            vectors = await (guard(fetch) if guard is not None else fetch())
+            for key, embedding in zip(missing, vectors):
+                self.cache.put(key, embedding)
+                found[key] = embedding
+        return [found[key] for key in keys]
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+
+# --- Process-wide Cache ---
+query_embedding_cache = EmbeddingCache()
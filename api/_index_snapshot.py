@@ -0,0 +1,169 @@
+import os
+import mmap
+import struct
+import numpy as np
+
+# --- Snapshot Format ---
+# One file holding everything VectorIndex needs, laid out so it can be
+# memory-mapped and used in place:
+#
+#   header       magic, format version, dims, row count, catalog version and
+#                the byte offset of every block below (HEADER, little-endian)
+#   ids          int64[rows]
+#   embeddings   float32[rows, dim], L2-normalized, 64-byte aligned
+#   offsets      uint64[rows * 3 + 1]; field f of row i is the metadata
+#                bytes offsets[3 * i + f] .. offsets[3 * i + f + 1]
+#   metadata     name, description and link of every row, packed UTF-8
+#
+# Every worker that maps the same file shares its pages through the OS page
+# cache, and opening it costs no JSON decoding. Writers build the file next
+# to the target and os.replace() it into place, so a reader either sees the
+# old snapshot or the complete new one; mappings of the old file stay valid
+# until they are dropped.
+SNAPSHOT_MAGIC = b"N8NWFIDX"
+SNAPSHOT_FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQ8sQQQQQ")
+FIELDS = ("name", "description", "link")
+_ALIGNMENT = 64
+
+WORKFLOW_INDEX_SNAPSHOT_PATH = os.environ.get(
+    "WORKFLOW_INDEX_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflow_index.snapshot")
+)
+
+
+def _aligned(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_snapshot(index, path=WORKFLOW_INDEX_SNAPSHOT_PATH):
+    """Write a VectorIndex to path atomically; returns the number of bytes written."""
+    rows, dim = len(index), index.dim
+    matrix = np.ascontiguousarray(index.matrix, dtype=np.float32)
+    ids = np.asarray([row_id if row_id is not None else -1 for row_id in index.ids], dtype=np.int64)
+
+    metadata = bytearray()
+    offsets = np.empty(rows * len(FIELDS) + 1, dtype=np.uint64)
+    columns = (index.names, index.descriptions, index.links)
+    for i in range(rows):
+        for f, column in enumerate(columns):
+            offsets[i * len(FIELDS) + f] = len(metadata)
+            metadata += (column[i] or "").encode("utf-8")
+    offsets[-1] = len(metadata)
+
+    ids_offset = _aligned(HEADER.size)
+    embeddings_offset = _aligned(ids_offset + ids.nbytes)
+    offsets_offset = _aligned(embeddings_offset + matrix.nbytes)
+    metadata_offset = _aligned(offsets_offset + offsets.nbytes)
+    header = HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, dim, rows, bytes.fromhex(index.version),
+        ids_offset, embeddings_offset, offsets_offset, metadata_offset, len(metadata)
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            for offset, block in ((0, header), (ids_offset, ids.tobytes()), (embeddings_offset, matrix.tobytes()),
+                                  (offsets_offset, offsets.tobytes()), (metadata_offset, bytes(metadata))):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(block)
+            size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+
+class _PackedColumn:
+    """Read-only sequence of one metadata field, decoded from the mapping on access."""
+
+    def __init__(self, snapshot, field):
+        self._snapshot = snapshot
+        self._field = field
+
+    def __len__(self):
+        return self._snapshot.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(self._snapshot.rows)[i]]
+        return self._snapshot.field(range(self._snapshot.rows)[i], self._field)
+
+    def __iter__(self):
+        for i in range(self._snapshot.rows):
+            yield self._snapshot.field(i, self._field)
+
+
+class _IdColumn(_PackedColumn):
+    def __init__(self, snapshot):
+        super().__init__(snapshot, None)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(self._snapshot.rows)[i]]
+        row_id = int(self._snapshot.ids[range(self._snapshot.rows)[i]])
+        return row_id if row_id >= 0 else None
+
+    def __iter__(self):
+        for i in range(self._snapshot.rows):
+            yield self[i]
+
+
+class IndexSnapshot:
+    """A snapshot file mapped read-only; arrays are views into the mapping."""
+
+    def __init__(self, path=WORKFLOW_INDEX_SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size:
+                raise ValueError(f"{path} is too small to be an index snapshot")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies this exact file, so a swapped-in replacement is noticed
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        (magic, format_version, dim, rows, version, ids_offset, embeddings_offset,
+         offsets_offset, metadata_offset, metadata_size) = HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        if format_version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {format_version}, expected {SNAPSHOT_FORMAT_VERSION}")
+        if metadata_offset + metadata_size > stat.st_size:
+            raise ValueError(f"{path} is truncated")
+
+        self.rows = rows
+        self.dim = dim
+        self.version = version.hex()
+        self.ids = np.frombuffer(self._map, dtype=np.int64, count=rows, offset=ids_offset)
+        self.matrix = np.frombuffer(
+            self._map, dtype=np.float32, count=rows * dim, offset=embeddings_offset
+        ).reshape(rows, dim)
+        self.offsets = np.frombuffer(self._map, dtype=np.uint64, count=rows * len(FIELDS) + 1, offset=offsets_offset)
+        self._metadata_offset = metadata_offset
+
+    def field(self, i, f):
+        k = i * len(FIELDS) + f
+        start = self._metadata_offset + int(self.offsets[k])
+        end = self._metadata_offset + int(self.offsets[k + 1])
+        return self._map[start:end].decode("utf-8")
+
+    def column(self, name):
+        return _PackedColumn(self, FIELDS.index(name))
+
+    def id_column(self):
+        return _IdColumn(self)
+
+
+def snapshot_identity(path=WORKFLOW_INDEX_SNAPSHOT_PATH):
+    """(inode, mtime, size) of the snapshot file, or None when there is none."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
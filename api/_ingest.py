@@ -0,0 +1,345 @@
+import os
+import csv
+import time
+import shutil
+import hashlib
+import random
+import asyncio
+
+# --- Ingestion Configuration ---
+# Token budget per embed_documents request and the hard cap on inputs per request
+INGEST_BATCH_TOKENS = int(os.environ.get("INGEST_BATCH_TOKENS", "16000"))
+INGEST_BATCH_MAX_ITEMS = int(os.environ.get("INGEST_BATCH_MAX_ITEMS", "128"))
+# Batches in flight at once
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+# Azure deployment quota in tokens per minute; the limiter adapts below this on 429s
+INGEST_TOKENS_PER_MINUTE = int(os.environ.get("INGEST_TOKENS_PER_MINUTE", "350000"))
+INGEST_MAX_RETRIES = int(os.environ.get("INGEST_MAX_RETRIES", "6"))
+# Rows per insert request; keeps each PostgREST payload to a few MB of vectors
+INSERT_CHUNK_SIZE = int(os.environ.get("INSERT_CHUNK_SIZE", "50"))
+# sync_workflows.py refuses to delete more than this share of the table
+# unless run with --allow-mass-delete
+SYNC_MAX_DELETE_FRACTION = float(os.environ.get("SYNC_MAX_DELETE_FRACTION", "0.2"))
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when available, ~4 characters per token otherwise."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def _parse_score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_workflows_csv(csv_file_path):
+    """Read the templates CSV into {name, description, link, score} rows.
+
+    score is the CSV's quality rating (None when blank); it is not stored in
+    n8n_workflows, only used to rank typeahead suggestions.
+    """
+    workflows = []
+    with open(csv_file_path, mode='r', encoding='utf-8') as file:
+        csv_reader = csv.DictReader(file)
+        for row in csv_reader:
+            workflows.append({
+                "name": row["name"],
+                "description": row["description"],
+                "link": row["url"],  # Map 'url' from CSV to 'link' in database
+                "score": _parse_score(row.get("score"))
+            })
+    return workflows
+
+
+def content_hash(workflow):
+    """Stable hash of the fields that feed a catalog row (name + description + url)."""
+    payload = "\x1f".join((workflow["name"], workflow["description"], workflow["link"]))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_sync(csv_workflows, db_rows, allow_mass_delete=False, max_delete_fraction=SYNC_MAX_DELETE_FRACTION):
+    """Split the CSV against the table into rows to embed, hashes to backfill and ids to delete.
+
+    Raises ValueError rather than plan deleting the catalog: for a CSV with
+    no rows, or, without allow_mass_delete, when more than
+    max_delete_fraction of the table's workflows would go.
+    """
+    if not csv_workflows:
+        raise ValueError(f"CSV has no workflows; refusing to sync against {len(db_rows)} rows")
+
+    wanted = {}
+    for workflow in csv_workflows:
+        wanted[workflow["link"]] = dict(workflow, content_hash=content_hash(workflow))
+
+    existing = {}
+    duplicate_ids = []
+    for row in db_rows:
+        if row["link"] in existing:
+            duplicate_ids.append(row["id"])
+        else:
+            existing[row["link"]] = row
+
+    to_embed, to_backfill = [], []
+    for link, workflow in wanted.items():
+        row = existing.get(link)
+        if row is None:
+            to_embed.append(workflow)
+            continue
+        stored_hash = row.get("content_hash") or content_hash(row)
+        if stored_hash != workflow["content_hash"]:
+            to_embed.append(workflow)
+        elif row.get("content_hash") is None:
+            # Rows from before the hash column existed: content is unchanged, just record the hash
+            to_backfill.append(workflow)
+
+    # Duplicate rows are always safe to drop; only workflows missing from the CSV count
+    stale_ids = [row["id"] for link, row in existing.items() if link not in wanted]
+    if not allow_mass_delete and len(stale_ids) > max_delete_fraction * len(existing):
+        raise ValueError(
+            f"Sync would delete {len(stale_ids)} of {len(existing)} workflows (limit {max_delete_fraction:.0%}); "
+            f"check the CSV or pass --allow-mass-delete"
+        )
+    return to_embed, to_backfill, stale_ids + duplicate_ids
+
+
+def make_batches(items, text_key="description", max_tokens=INGEST_BATCH_TOKENS, max_items=INGEST_BATCH_MAX_ITEMS):
+    """Group items into batches that stay under a token budget and an item cap."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for item in items:
+        tokens = estimate_tokens(item[text_key])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches
+
+
+class AdaptiveTokenBucket:
+    """Async token bucket sized in tokens per minute.
+
+    A 429 halves the refill rate and pauses every caller until Retry-After
+    has passed; each success then wins back 5% of the configured rate.
+    """
+
+    def __init__(self, tokens_per_minute=INGEST_TOKENS_PER_MINUTE, min_fraction=0.1):
+        self.max_rate = tokens_per_minute / 60.0
+        self.min_rate = self.max_rate * min_fraction
+        self.rate = self.max_rate
+        self.capacity = float(tokens_per_minute)
+        self.available = self.capacity
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / self.rate)
+
+    def on_rate_limited(self, retry_after=None):
+        self.rate = max(self.min_rate, self.rate / 2)
+        pause = retry_after if retry_after is not None else 15.0
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self.available = 0.0
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000 if header == "retry-after-ms" else seconds
+    return None
+
+
+class BatchEmbedder:
+    """Embeds catalog rows in token-budgeted batches under an adaptive rate limit.
+
+    Rate-limited, server-side and network failures are retried with
+    exponential backoff. A rejected request (any other 4xx) splits the batch
+    in half so a single bad row cannot sink its neighbours. Rows that still
+    fail are reported in `failed`.
+    """
+
+    def __init__(self, embeddings_model, concurrency=INGEST_CONCURRENCY, tokens_per_minute=INGEST_TOKENS_PER_MINUTE,
+                 max_retries=INGEST_MAX_RETRIES, text_key="description"):
+        self.embeddings_model = embeddings_model
+        self.concurrency = concurrency
+        self.bucket = AdaptiveTokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.text_key = text_key
+        self.failed = []
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def _embed_with_retry(self, batch, tokens):
+        texts = [item[self.text_key] for item in batch]
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(tokens)
+            try:
+                self.requests += 1
+                vectors = await self.embeddings_model.aembed_documents(texts)
+                self.bucket.on_success()
+                return vectors
+            except Exception as e:
+                status = _status_code(e)
+                if status is not None and status != 429 and 400 <= status < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                retry_after = _retry_after(e)
+                if status == 429:
+                    self.rate_limited += 1
+                    self.bucket.on_rate_limited(retry_after)
+                delay = retry_after if retry_after is not None else min(60, 2 ** attempt) * (0.5 + random.random())
+                print(f"Embedding batch of {len(batch)} failed ({status or type(e).__name__}), "
+                      f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _run_batch(self, batch, tokens, semaphore):
+        async with semaphore:
+            try:
+                return [(batch, await self._embed_with_retry(batch, tokens))]
+            except Exception as e:
+                status = _status_code(e)
+                bad_input = status is not None and status != 429 and 400 <= status < 500
+                if len(batch) == 1 or not bad_input:
+                    # Retries are exhausted (or a lone row was rejected); record and move on
+                    print(f"Giving up on a batch of {len(batch)} rows: {e}")
+                    self.failed.extend((item, str(e)) for item in batch)
+                    return []
+                error = e
+        # Split outside the semaphore so the halves can run concurrently
+        print(f"Batch of {len(batch)} failed ({error}), splitting to isolate the bad rows")
+        middle = len(batch) // 2
+        halves = [batch[:middle], batch[middle:]]
+        results = await asyncio.gather(*[
+            self._run_batch(half, sum(estimate_tokens(item[self.text_key]) for item in half), semaphore)
+            for half in halves
+        ])
+        return [pair for result in results for pair in result]
+
+    async def embed(self, items):
+        """Yield (rows, vectors) pairs as batches complete, in completion order."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [
+            asyncio.ensure_future(self._run_batch(batch, tokens, semaphore))
+            for batch, tokens in make_batches(items, self.text_key)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for batch, vectors in await next_done:
+                    yield batch, vectors
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def insert_workflows(supabase, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Insert embedded rows into n8n_workflows in chunks; returns how many were inserted."""
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            response = await asyncio.to_thread(supabase.table("n8n_workflows").insert(chunk).execute)
+            inserted += len(response.data or [])
+        except Exception as e:
+            print(f"Failed to insert {len(chunk)} workflows starting with '{chunk[0]['name']}': {e}")
+    return inserted
+
+
+def count_workflows(supabase):
+    """Row count computed by Postgres instead of downloading every id."""
+    response = supabase.table("n8n_workflows").select("id", count="exact").limit(1).execute()
+    return response.count
+
+
+def write_index_snapshot(supabase, path=None):
+    """Page the catalog back out of n8n_workflows and swap it in as the serving snapshot.
+
+    Read back rather than built from the vectors just embedded, so the
+    snapshot carries database ids and only rows that were really inserted.
+    Running servers pick the new file up on their next snapshot check.
+    """
+    from _vector_index import VectorIndex
+    from _index_snapshot import write_snapshot, WORKFLOW_INDEX_SNAPSHOT_PATH
+    path = path or WORKFLOW_INDEX_SNAPSHOT_PATH
+    try:
+        started = time.perf_counter()
+        index = VectorIndex.from_supabase(supabase)
+        size = write_snapshot(index, path)
+        print(f"Wrote index snapshot {path}: {len(index)} rows x {index.dim} dims, "
+              f"{size / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s (version {index.version})")
+        return index.version
+    except Exception as e:
+        print(f"Failed to write index snapshot: {e}")
+        return None
+
+
+def publish_catalog_csv(csv_file_path, path=None):
+    """Make the CSV just synced the one the servers read, and bump its mtime.
+
+    The typeahead polls its CSV's identity (inode, mtime, size) rather than
+    the catalog version, so a sync from another file is copied over the
+    serving CSV (atomically, via a temp file beside it) and a sync from the
+    serving CSV itself touches it. The lexical index reads it on next start.
+    """
+    from _lexical_index import WORKFLOWS_CSV_PATH
+    path = path or WORKFLOWS_CSV_PATH
+    try:
+        if os.path.exists(path) and os.path.samefile(csv_file_path, path):
+            os.utime(path)
+        else:
+            temp_path = f"{path}.tmp"
+            shutil.copyfile(csv_file_path, temp_path)
+            os.replace(temp_path, path)
+        print(f"Published catalog CSV {path}")
+        return path
+    except Exception as e:
+        print(f"Failed to publish catalog CSV: {e}")
+        return None
@@ -0,0 +1,169 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from _ingest import load_workflows_csv
+from _vector_index import match_workflows, match_workflows_batch
+
+# --- Lexical Index Configuration ---
+WORKFLOWS_CSV_PATH = os.environ.get(
+    "WORKFLOWS_CSV_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_n8n Templates 3000 - Templates.csv")
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Name tokens count this many times, so "Baserow" in a title beats a passing mention
+NAME_WEIGHT = 2
+# Each ranking contributes up to this many candidates (or match_count, if more) to the fusion
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in into is it its me my of on or that the this to "
+    "using via we what when with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 inverted index over workflow names and descriptions.
+
+    Per-posting BM25 weights are precomputed at build time, so a query is one
+    scatter-add per query term into a dense score array. version hashes the
+    indexed rows, so instances built from the same CSV agree on it.
+    """
+
+    def __init__(self, rows):
+        self.rows = [{"name": row["name"], "description": row["description"], "link": row["link"]} for row in rows]
+        digest = hashlib.blake2b(digest_size=8)
+        for row in self.rows:
+            digest.update(f"{row['name']}\x1f{row['description']}\x1f{row['link']}\x1e".encode("utf-8"))
+        self.version = digest.hexdigest()
+        doc_lengths = np.zeros(len(rows), dtype=np.float32)
+        term_docs = defaultdict(list)
+        term_freqs = defaultdict(list)
+        for i, row in enumerate(self.rows):
+            tokens = tokenize(row["name"]) * NAME_WEIGHT + tokenize(row["description"])
+            doc_lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_docs[term].append(i)
+                term_freqs[term].append(tf)
+
+        n = len(rows)
+        average_length = float(doc_lengths.mean()) if n else 0.0
+        self.postings = {}
+        for term, docs in term_docs.items():
+            docs = np.asarray(docs, dtype=np.int32)
+            tf = np.asarray(term_freqs[term], dtype=np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[docs] / average_length)
+            self.postings[term] = (docs, (idf * tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32))
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_csv(cls, csv_file_path=WORKFLOWS_CSV_PATH):
+        return cls(load_workflows_csv(csv_file_path))
+
+    def search(self, query, k=10):
+        """Top-k rows by BM25 as copies of {name, description, link, bm25}."""
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or k <= 0:
+            return []
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        for term in terms:
+            docs, weights = self.postings[term]
+            scores[docs] += weights
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [dict(self.rows[i], bm25=float(scores[i])) for i in matched]
+
+
+def reciprocal_rank_fusion(rankings, limit, k=RRF_K):
+    """Merge ranked result lists (keyed by link) with RRF: score = sum 1 / (k + rank)."""
+    fused = {}
+    rows = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            key = row["link"]
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            # Keep the richest copy of the row (similarity and bm25 both survive)
+            rows[key] = dict(rows.get(key, {}), **row)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [dict(rows[key], rrf_score=fused[key]) for key in ordered]
+
+
+# --- Process-wide Index ---
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index():
+    """Build the BM25 index from the templates CSV on first use; None if the CSV is missing."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = LexicalIndex.from_csv()
+                    print(f"Loaded lexical index: {len(_index)} workflows, {len(_index.postings)} terms")
+                except Exception as e:
+                    print(f"Lexical index unavailable: {str(e)}")
+                    return None
+    return _index
+
+
+def current_lexical_version():
+    """Content version of the BM25 index (None if the CSV is missing)."""
+    index = get_lexical_index()
+    return index.version if index is not None else None
+
+
+def hybrid_match_workflows(supabase, query, query_embedding, match_threshold=0.1, match_count=5,
+                           candidates=HYBRID_CANDIDATES):
+    """Fuse vector and BM25 rankings with RRF.
+
+    With query_embedding=None (embedding service slow or down) the lexical
+    ranking answers on its own. Each ranking is at least match_count deep.
+    """
+    candidates = max(candidates, match_count)
+    lexical = get_lexical_index()
+    lexical_results = lexical.search(query, candidates) if lexical is not None else []
+    if query_embedding is None:
+        if lexical is None:
+            raise RuntimeError("No query embedding and no lexical index to fall back on")
+        return lexical_results[:match_count]
+
+    vector_results = match_workflows(supabase, query_embedding, match_threshold, candidates)
+    return reciprocal_rank_fusion([vector_results, lexical_results], match_count)
+
+
+def hybrid_match_workflows_batch(supabase, queries, query_embeddings, match_threshold=0.1, match_count=5,
+                                 candidates=HYBRID_CANDIDATES):
+    """hybrid_match_workflows for many queries, with the vector side scored as one batch.
+
+    query_embeddings may be None (lexical-only for every query).
+    """
+    candidates = max(candidates, match_count)
+    lexical = get_lexical_index()
+    if query_embeddings is None:
+        if lexical is None:
+            raise RuntimeError("No query embeddings and no lexical index to fall back on")
+        return [lexical.search(query, candidates)[:match_count] for query in queries]
+
+    vector_batch = match_workflows_batch(supabase, query_embeddings, match_threshold, candidates)
+    results = []
+    for query, vector_results in zip(queries, vector_batch):
+        lexical_results = lexical.search(query, candidates) if lexical is not None else []
+        results.append(reciprocal_rank_fusion([vector_results, lexical_results], match_count))
+    return results
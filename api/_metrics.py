@@ -0,0 +1,236 @@
+import os
+import time
+import uuid
+import bisect
+import threading
+from contextlib import contextmanager
+
+# --- Metrics Configuration ---
+# Stage latencies, counters and gauges kept in process and rendered in the
+# Prometheus text format by /metrics. Recording is a bisect and a locked
+# increment, so it stays on in production.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Also emit an OpenTelemetry span per pipeline stage (needs opentelemetry-api
+# and an SDK/exporter configured by the deployment)
+METRICS_OTEL = os.environ.get("METRICS_OTEL", "0") == "1"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_tracer = None
+if METRICS_OTEL:
+    try:
+        from opentelemetry import trace as _otel_trace
+        _tracer = _otel_trace.get_tracer("n8n-workflow-assistant")
+    except ImportError:
+        print("METRICS_OTEL is set but opentelemetry is not installed; spans disabled")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time from a function returning {label value tuple: number}.
+
+    Used for state other modules already count (cache stats, breaker state),
+    so exposing them adds nothing to the request path.
+    """
+
+    def __init__(self, name, help_text, kind, callback, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Metrics callback {self.name} failed: {str(e)}")
+            return []
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(values.items()) if value is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, kind, callback, labelnames=()):
+        return self.register(CallbackMetric(name, help_text, kind, callback, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# --- Process-wide Metrics ---
+registry = Registry()
+stage_seconds = registry.histogram(
+    "assistant_stage_seconds", "Latency of each query pipeline stage.", ("stage",)
+)
+stage_errors = registry.counter(
+    "assistant_stage_errors_total", "Pipeline stage failures, including timeouts.", ("stage",)
+)
+fallbacks = registry.counter(
+    "assistant_fallbacks_total", "Requests served by a degraded path.", ("kind",)
+)
+tokens_streamed = registry.counter(
+    "assistant_llm_tokens_streamed_total", "LLM stream chunks (about one token each) received."
+)
+streams_in_flight = registry.gauge(
+    "assistant_streams_in_flight", "SSE streams currently open."
+)
+streams_total = registry.counter(
+    "assistant_streams_total", "SSE streams by outcome.", ("outcome",)
+)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one pipeline stage (and an OpenTelemetry span when enabled)."""
+    span = _tracer.start_span(f"pipeline.{name}") if _tracer is not None else None
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if isinstance(e, Exception):
+            stage_errors.inc(stage=name)
+            if span is not None:
+                span.record_exception(e)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+        if span is not None:
+            span.end()
+
+
+def observe_stage(name, seconds):
+    stage_seconds.observe(seconds, stage=name)
+
+
+def new_trace_id(traceparent=None):
+    """Trace id for one stream: taken from a W3C traceparent header when valid, else random."""
+    if traceparent:
+        parts = traceparent.strip().split("-")
+        if len(parts) == 4 and len(parts[1]) == 32 and parts[1] != "0" * 32:
+            try:
+                int(parts[1], 16)
+                return parts[1].lower()
+            except ValueError:
+                pass
+    return uuid.uuid4().hex
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+from difflib import SequenceMatcher
+from collections import OrderedDict
+from _embedding_cache import normalize_query
+
+# --- Prefetch Configuration ---
+# /query/prefetch embeds and retrieves a debounced draft while the user is
+# still typing; the submitted query picks the result up if it arrives within
+# PREFETCH_TTL_SECONDS and is the same draft or at least PREFETCH_MATCH_RATIO
+# similar to it.
+PREFETCH_TTL_SECONDS = float(os.environ.get("PREFETCH_TTL_SECONDS", "30"))
+PREFETCH_MAX_ENTRIES = int(os.environ.get("PREFETCH_MAX_ENTRIES", "256"))
+# Speculative work never takes more than this many concurrent pipelines
+PREFETCH_MAX_IN_FLIGHT = int(os.environ.get("PREFETCH_MAX_IN_FLIGHT", "16"))
+PREFETCH_MATCH_RATIO = float(os.environ.get("PREFETCH_MATCH_RATIO", "0.9"))
+# Shorter drafts retrieve too little to be worth an embedding call
+PREFETCH_MIN_CHARS = int(os.environ.get("PREFETCH_MIN_CHARS", "8"))
+
+
+def _log_failure(task):
+    # Retrieving the exception also keeps asyncio from warning about it at exit
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Prefetch failed: {str(task.exception())}")
+
+
+class Prefetch:
+    """One speculative embed-and-retrieve run for a normalized draft."""
+
+    def __init__(self, key, version):
+        self.key = key
+        self.version = version
+        self.created_at = time.monotonic()
+        self.holders = 0
+        self.task = None
+
+
+class QueryPrefetcher:
+    """Short-lived cache of speculative (embedding, search results) for drafts.
+
+    Identical drafts share one run. Each client holds at most one draft: a
+    newer draft from the same client cancels the older run if it is still
+    going and nobody else holds it. Must be used from a single event loop.
+    """
+
+    def __init__(self, ttl_seconds=PREFETCH_TTL_SECONDS, max_entries=PREFETCH_MAX_ENTRIES,
+                 max_in_flight=PREFETCH_MAX_IN_FLIGHT, match_ratio=PREFETCH_MATCH_RATIO,
+                 min_chars=PREFETCH_MIN_CHARS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_in_flight = max_in_flight
+        self.match_ratio = match_ratio
+        self.min_chars = min_chars
+        self.started = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._clients = OrderedDict()
+
+    def _in_flight(self):
+        return sum(1 for entry in self._entries.values() if not entry.task.done())
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and not entry.task.done():
+            entry.task.cancel()
+            self.cancelled += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]:
+            self._drop(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        while len(self._clients) > self.max_entries:
+            self._clients.popitem(last=False)
+
+    def _release(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.holders -= 1
+        if entry.holders <= 0 and not entry.task.done():
+            # Superseded before it finished: stop paying for it
+            self._drop(key)
+
+    def start(self, query, run, client_id=None, version=None):
+        """Start (or join) the prefetch for a draft; returns its status.
+
+        run(query) is the coroutine function doing the embedding and retrieval.
+        """
+        self._expire()
+        key = normalize_query(query)
+        if len(key) < self.min_chars:
+            return "ignored"
+
+        previous = self._clients.get(client_id) if client_id else None
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            if previous != key:
+                self.deduplicated += 1
+                entry.holders += 1
+        else:
+            # A draft prefetched against an older catalog is redone, keeping its holders
+            holders = 0
+            if entry is not None:
+                holders = entry.holders
+                self._drop(key)
+            if self._in_flight() >= self.max_in_flight:
+                self.rejected += 1
+                if previous is not None:
+                    self._release(self._clients.pop(client_id))
+                return "rejected"
+            entry = Prefetch(key, version)
+            entry.holders = holders if previous == key else holders + 1
+            entry.task = asyncio.get_running_loop().create_task(run(query))
+            entry.task.add_done_callback(_log_failure)
+            self._entries[key] = entry
+            self.started += 1
+
+        if client_id:
+            if previous is not None and previous != key:
+                self._release(previous)
+            self._clients[client_id] = key
+            self._clients.move_to_end(client_id)
+        self._entries.move_to_end(key)
+        return "ready" if entry.task.done() else "pending"
+
+    def _find(self, key, client_id):
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry, False
+        draft = self._clients.get(client_id) if client_id else None
+        if draft is not None and SequenceMatcher(None, key, draft).ratio() >= self.match_ratio:
+            return self._entries.get(draft), True
+        return None, False
+
+    async def take(self, query, client_id=None, version=None):
+        """The prefetched (embedding, search results) for a submitted query, or None.
+
+        Waits for a prefetch that is still running. A failed or cancelled
+        prefetch, or one made against another catalog version, is a miss.
+        """
+        self._expire()
+        entry, near = self._find(normalize_query(query), client_id)
+        if client_id:
+            self._clients.pop(client_id, None)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+
+        # The submitted query owns it now; a later draft must not cancel it
+        entry.holders += 1
+        await asyncio.wait({entry.task})
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            self.misses += 1
+            return None
+        if near:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        return entry.task.result()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "in_flight": self._in_flight(),
+            "started": self.started,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+        }
+
+
+# --- Process-wide Prefetcher ---
+query_prefetcher = QueryPrefetcher()
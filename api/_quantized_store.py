@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+
+# --- Store Configuration ---
+# Candidates pulled from the compact codes per query before exact rescoring
+QUANTIZED_RESCORE_CANDIDATES = int(os.environ.get("QUANTIZED_RESCORE_CANDIDATES", "100"))
+# Rows per block when scoring int8 codes, bounding the float32 scratch buffer
+_INT8_BLOCK_ROWS = 1024
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+class QuantizedEmbeddingStore:
+    """Compact codes in memory, full-precision vectors memory-mapped from disk.
+
+    For text-embedding-3-large (3072 dims) a row costs 384 bytes of binary
+    codes and 3 KB of int8 codes, against 12 KB as float32 (and ~100 KB as a
+    Python list of floats). Candidates are found with Hamming distance or an
+    int8 dot product, then only those rows are read from the memory-mapped
+    float32 file and rescored exactly.
+    """
+
+    def __init__(self, directory, mode="binary", load_int8=True):
+        if mode not in ("binary", "int8"):
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        with open(os.path.join(directory, "store.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.full = np.load(os.path.join(directory, "full.npy"), mmap_mode="r")
+        self.bits = np.load(os.path.join(directory, "bits.npy"))
+        self.int8 = np.load(os.path.join(directory, "int8.npy")) if load_int8 or mode == "int8" else None
+        self.scales = np.load(os.path.join(directory, "scales.npy"))
+
+    @staticmethod
+    def _complete(directory, matrix):
+        # store.json is written last, so its presence marks a finished set of files
+        try:
+            with open(os.path.join(directory, "store.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get("rows") == matrix.shape[0] and meta.get("dim") == matrix.shape[1]
+
+    @classmethod
+    def build(cls, matrix, directory, mode="binary"):
+        """Quantize L2-normalized float32 rows into directory and open the store.
+
+        A complete store already in directory is reused rather than rewritten:
+        other workers may have its files mapped. A new store is written to a
+        temporary directory next to it and renamed into place, so readers
+        never see a partial set of files.
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if cls._complete(directory, matrix):
+            return cls(directory, mode=mode, load_int8=(mode == "int8"))
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(prefix=f".{os.path.basename(directory)}.tmp-", dir=parent)
+        try:
+            # Symmetric per-dimension int8 scales: x[:, d] ~= int8[:, d] * scales[d]
+            scales = np.abs(matrix).max(axis=0) / 127.0
+            scales[scales == 0] = 1.0
+            int8_codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+            bits = np.packbits(matrix > 0, axis=1)
+
+            np.save(os.path.join(tmp_directory, "full.npy"), matrix)
+            np.save(os.path.join(tmp_directory, "int8.npy"), int8_codes)
+            np.save(os.path.join(tmp_directory, "scales.npy"), scales.astype(np.float32))
+            np.save(os.path.join(tmp_directory, "bits.npy"), bits)
+            with open(os.path.join(tmp_directory, "store.json"), "w", encoding="utf-8") as f:
+                json.dump({"rows": int(matrix.shape[0]), "dim": int(matrix.shape[1])}, f)
+
+            if os.path.isdir(directory) and not cls._complete(directory, matrix):
+                # Left behind by an interrupted build; nothing can have it mapped
+                shutil.rmtree(directory, ignore_errors=True)
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # Another worker renamed its identical store into place first
+                if not cls._complete(directory, matrix):
+                    raise
+        finally:
+            if os.path.isdir(tmp_directory):
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+        return cls(directory, mode=mode, load_int8=(mode == "int8"))
+
+    def __len__(self):
+        return self.full.shape[0]
+
+    @property
+    def dim(self):
+        return self.full.shape[1]
+
+    def memory_footprint(self):
+        """Bytes resident in process memory, plus what stays on disk behind the mmap."""
+        resident = self.bits.nbytes + self.scales.nbytes
+        if self.int8 is not None:
+            resident += self.int8.nbytes
+        return {
+            "resident_bytes": int(resident),
+            "binary_bytes": int(self.bits.nbytes),
+            "int8_bytes": int(self.int8.nbytes) if self.int8 is not None else 0,
+            "mapped_float32_bytes": int(self.full.nbytes),
+        }
+
+    def _binary_candidates(self, query, count):
+        query_bits = np.packbits(query > 0)
+        distances = _popcount(np.bitwise_xor(self.bits, query_bits)).sum(axis=1, dtype=np.int32)
+        return np.argpartition(distances, count - 1)[:count]
+
+    def _int8_candidates(self, query, count):
+        # Fold the per-dimension scales into the query, then score block by block
+        scaled_query = (query * self.scales).astype(np.float32)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _INT8_BLOCK_ROWS):
+            block = self.int8[start:start + _INT8_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        return np.argpartition(-scores, count - 1)[:count]
+
+    def search(self, query, k, candidates=QUANTIZED_RESCORE_CANDIDATES):
+        """Top-k rows as (indices, exact cosine scores), best first.
+
+        `query` must be an L2-normalized float32 vector.
+        """
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        count = min(n, max(candidates, k))
+        if count == n:
+            pool = np.arange(n)
+        elif self.mode == "int8":
+            pool = self._int8_candidates(query, count)
+        else:
+            pool = self._binary_candidates(query, count)
+
+        # Exact rescoring reads only the candidate rows from the mapped file
+        pool.sort()
+        exact = np.asarray(self.full[pool]) @ query
+        best = np.argsort(-exact, kind="stable")[:k]
+        return pool[best], exact[best]
@@ -0,0 +1,184 @@
+import time
+from _clients import get_supabase, get_embeddings, get_llm
+from _answer_cache import answer_cache, replay_answer_events
+from _vector_index import current_catalog_version
+from _async_pipeline import (
+    StageTimeout, embed_query_async, embed_query_or_none, retrieve_workflows_async, invoke_llm_async, astream_llm
+)
+from _sse import SSEWriter, coalesce_text, llm_text
+from _single_flight import query_flights
+from _prefetch import query_prefetcher
+from _resilience import sources_only_answer
+from _metrics import new_trace_id, observe_stage, streams_in_flight, streams_total
+
+# --- Recommendation Pipeline ---
+# Shared by main.py and the serverless handlers (stream.py, query.py):
+# prefetch pickup, answer cache, hybrid retrieval, generation and the
+# sources-only fallback when the LLM is down.
+
+
+def build_prompt(query: str, search_results):
+    """Answer prompt over the retrieved workflows (links stay out; they are in source_documents)."""
+    # Format the context for the LLM
+    context_docs = []
+    for result in search_results:
+        context_docs.append(f"Workflow: {result['name']}\nDescription: {result['description']}")
+
+    context = "\n\n".join(context_docs)
+
+    return f"""Based on the user's query: "{query}"
+
+Here are the most relevant n8n workflows I found:
+
+{context}
+
+Please provide a helpful response that:
+1. Directly answers the user's question
+2. For each recommended workflow, include:
+   - The workflow name in bold (use **name**)
+   - A "Why:" explanation of why this workflow is suitable for their needs
+3. Use numbered list format like:
+   1. **Workflow Name**
+      - **Why:** Explanation of why this workflow fits their needs
+4. Keep explanations concise but informative
+5. Do NOT include any links or URLs in your response
+
+Response:"""
+
+
+def source_documents_for(search_results):
+    return [
+        {
+            "name": result['name'],
+            "description": result['description'],
+            "link": result['link']
+        }
+        for result in search_results
+    ]
+
+
+async def prefetch_retrieval(query: str):
+    """Embedding and search results for a draft query, computed ahead of submission.
+
+    The embedding is required: a draft is not worth a lexical-only fallback,
+    the submitted query can take that path itself.
+    """
+    query_embedding = await embed_query_async(get_embeddings(), query)
+    search_results = await retrieve_workflows_async(get_supabase(), query, query_embedding, match_threshold=0.1, match_count=5)
+    return query_embedding, search_results
+
+
+async def recommendation_events(query: str, client_id: str = None):
+    """Workflow recommendations as (event_type, data) events: source_documents, then content.
+
+    Every network stage is awaited natively or on the bounded executor with a
+    deadline, so a slow upstream never blocks other requests on this loop.
+    A matching /query/prefetch result skips straight to generation.
+    """
+    catalog_version = current_catalog_version()
+    prefetched = await query_prefetcher.take(query, client_id, catalog_version)
+    if prefetched is not None:
+        query_embedding, search_results = prefetched
+    else:
+        # Generate embedding for the query (None if Azure is down: lexical-only mode)
+        query_embedding = await embed_query_or_none(get_embeddings(), query)
+        search_results = None
+
+    # Replay a cached answer if a near-identical query was already answered
+    cached = answer_cache.lookup(query_embedding, catalog_version)
+    if cached is not None:
+        for event in replay_answer_events(cached):
+            yield event
+        return
+
+    # Hybrid BM25 + vector search fused with reciprocal rank fusion
+    if search_results is None:
+        search_results = await retrieve_workflows_async(get_supabase(), query, query_embedding, match_threshold=0.1, match_count=5)
+
+    # Send source documents first
+    source_documents = source_documents_for(search_results)
+    yield ('source_documents', source_documents)
+
+    # Stream LLM response, coalescing tokens into ~30 ms / 256 byte frames
+    prompt = build_prompt(query, search_results)
+    answer_parts = []
+    try:
+        async for text in coalesce_text(llm_text(astream_llm(get_llm(streaming=True), prompt))):
+            answer_parts.append(text)
+            yield ('content', text)
+    except Exception as e:
+        # The sources are already out; without any answer text yet, list them instead
+        if answer_parts:
+            raise
+        print(f"LLM unavailable, sending sources only: {str(e)}")
+        yield ('content', sources_only_answer(source_documents))
+        return
+
+    # Only complete answers are cached; disconnects never reach this point
+    answer_cache.store(query_embedding, query, source_documents, "".join(answer_parts), catalog_version)
+
+
+async def recommendation_stream(query: str, stream_format: str = None, trace_id: str = None, client_id: str = None):
+    """Stream workflow recommendations as SSE frames.
+
+    Concurrent identical queries share one pipeline run (and one LLM stream);
+    each subscriber formats the shared events for its own stream_format.
+    The stream opens with a comment carrying its trace id. A stage timeout
+    ends it with an error event and done; other errors are raised for the
+    caller to report.
+    """
+    writer = SSEWriter.for_format(stream_format)
+    trace_id = trace_id or new_trace_id()
+    started = time.perf_counter()
+    outcome = "disconnected"
+    streams_in_flight.inc()
+    try:
+        yield writer.comment(f"trace {trace_id}")
+
+        async for event in query_flights.stream(query, lambda: recommendation_events(query, client_id)):
+            yield writer.frame(event)
+
+        outcome = "ok"
+        yield writer.event('done')
+    except StageTimeout as e:
+        outcome = "timeout"
+        print(f"[{trace_id}] Stage timeout in streaming query: {str(e)}")
+        yield writer.event('error', str(e))
+        yield writer.event('done')
+    except Exception as e:
+        outcome = "error"
+        print(f"[{trace_id}] Error in streaming query: {str(e)}")
+        raise
+    finally:
+        streams_in_flight.dec()
+        streams_total.inc(outcome=outcome)
+        observe_stage("stream", time.perf_counter() - started)
+
+
+async def answer_query(query: str):
+    """The non-streaming answer: {"result", "source_documents"}; raises StageTimeout."""
+    # Generate embedding for the query (None if Azure is down: lexical-only mode)
+    query_embedding = await embed_query_or_none(get_embeddings(), query)
+
+    # Serve a cached answer if a near-identical query was already answered
+    catalog_version = current_catalog_version()
+    cached = answer_cache.lookup(query_embedding, catalog_version)
+    if cached is not None:
+        return {"result": cached.answer, "source_documents": cached.source_documents}
+
+    # Hybrid BM25 + vector search fused with reciprocal rank fusion
+    search_results = await retrieve_workflows_async(get_supabase(), query, query_embedding, match_threshold=0.1, match_count=5)
+    source_documents = source_documents_for(search_results)
+
+    # Get LLM response (the sources alone if the LLM is down or too slow)
+    try:
+        llm_response = await invoke_llm_async(get_llm(), build_prompt(query, search_results))
+    except Exception as e:
+        print(f"LLM unavailable, returning sources only: {str(e)}")
+        return {"result": sources_only_answer(source_documents), "source_documents": source_documents}
+    answer_cache.store(query_embedding, query, source_documents, llm_response.content, catalog_version)
+
+    return {
+        "result": llm_response.content,
+        "source_documents": source_documents
+    }
@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from _metrics import fallbacks
+
+# --- Circuit Breaker Configuration ---
+# A breaker opens when at least BREAKER_MIN_CALLS calls in the rolling window
+# ran and BREAKER_FAILURE_RATE of them failed or timed out. While open, calls
+# fail fast (and the pipeline takes its fallback) until BREAKER_OPEN_SECONDS
+# have passed; then a single trial call decides whether it closes again.
+BREAKER_WINDOW_SECONDS = float(os.environ.get("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "15"))
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.environ.get("HEALTH_PROBE_INTERVAL_SECONDS", "15"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """The dependency's breaker is open; the call was not attempted."""
+
+    def __init__(self, name):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Rolling-window error-rate breaker for one upstream dependency.
+
+    Thread-safe: Azure calls record from the event loop and Supabase calls
+    from the blocking executor.
+    """
+
+    def __init__(self, name, window_seconds=BREAKER_WINDOW_SECONDS, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, open_seconds=BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = None
+        self.rejected = 0
+        self._calls = deque()
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _trim_locked(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def allow(self):
+        """Whether a call may go out now. An open breaker lets one trial through after open_seconds."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, latency):
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, ok, latency))
+            self._trim_locked(now)
+            if self.state == HALF_OPEN:
+                self._trial_running = False
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open_locked(now)
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            if (self.state == CLOSED and len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.failure_rate):
+                self._open_locked(now)
+
+    def _open_locked(self, now):
+        if self.state != OPEN:
+            print(f"Circuit breaker {self.name} opened")
+        self.state = OPEN
+        self.opened_at = now
+
+    def abandon(self):
+        """The caller gave up before the call finished; free the half-open trial slot."""
+        with self._lock:
+            self._trial_running = False
+
+    def call(self, func, *args, **kwargs):
+        """Run a blocking call through the breaker."""
+        if not self.allow():
+            raise CircuitOpen(self.name)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim_locked(now)
+            latencies = [latency for _, _, latency in self._calls]
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            return {
+                "state": self.state,
+                "calls": len(self._calls),
+                "error_rate": failures / len(self._calls) if self._calls else 0.0,
+                "p50_ms": _percentile(latencies, 0.5) * 1000 if latencies else None,
+                "p95_ms": _percentile(latencies, 0.95) * 1000 if latencies else None,
+                "rejected": self.rejected,
+                "open_for_seconds": now - self.opened_at if self.state != CLOSED else None,
+            }
+
+
+# --- Process-wide Breakers ---
+breakers = {
+    "supabase": CircuitBreaker("supabase"),
+    "embeddings": CircuitBreaker("embeddings"),
+    "llm": CircuitBreaker("llm"),
+}
+
+
+def sources_only_answer(source_documents):
+    """Answer text for when the LLM is unavailable: the retrieved workflows, listed."""
+    fallbacks.inc(kind="sources_only")
+    if not source_documents:
+        return "The assistant is temporarily unavailable and no matching workflows were found. Please try again shortly."
+    lines = ["The assistant is temporarily unavailable, but these workflows match your request:", ""]
+    for i, doc in enumerate(source_documents, 1):
+        lines.append(f"{i}. **{doc['name']}**")
+        if doc.get('description'):
+            lines.append(f"   - {doc['description']}")
+    return "\n".join(lines)
+
+
+# --- Background Health Prober ---
+class HealthProber:
+    """Probes Supabase on a timer so /health answers from memory.
+
+    Azure is not probed (every call costs tokens); its health is the state
+    of the embeddings and llm breakers, which real traffic keeps current.
+    """
+
+    def __init__(self, supabase_factory, interval=HEALTH_PROBE_INTERVAL_SECONDS):
+        self.supabase_factory = supabase_factory
+        self.interval = interval
+        self.state = {"ok": None, "latency_ms": None, "error": None, "checked_at": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe(self):
+        started = time.perf_counter()
+        try:
+            self.supabase_factory().rpc('get_star_count').execute()
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)
+            print(f"Health probe failed: {error}")
+        self.state = {
+            "ok": ok,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "error": error,
+            "checked_at": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        }
+        return ok
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.probe()
+
+    def start(self):
+        if self._thread is None:
+            self.probe()
+            self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def report(self):
+        """Cached health: database probe result plus the breaker states."""
+        database = self.state
+        dependencies = {name: breaker.stats() for name, breaker in breakers.items()}
+        if database["ok"] is False:
+            status = "unhealthy"
+        elif any(dep["state"] != CLOSED for dep in dependencies.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+        return {
+            "status": status,
+            "database": "connected" if database["ok"] else ("unknown" if database["ok"] is None else "unreachable"),
+            "timestamp": database["checked_at"],
+            "probe": database,
+            "dependencies": dependencies,
+        }
@@ -0,0 +1,131 @@
+import os
+import hashlib
+from _lexical_index import hybrid_match_workflows, current_lexical_version
+from _vector_index import current_catalog_version
+from _async_pipeline import RETRIEVAL_TIMEOUT_SECONDS, run_blocking, with_timeout, embed_query_or_none
+from _metrics import stage as timed_stage, fallbacks
+
+# --- Search Configuration ---
+# /search returns the ranked workflows without generating an answer. Every
+# page is a slice of one ranking fused SEARCH_MAX_RESULTS deep, so pages of
+# the same query never overlap or skip a result.
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", "50"))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "100"))
+# Sent with full-fidelity results of a loaded catalog; the ETag changes with
+# the catalog version and the lexical index's CSV content, so revalidation
+# after a re-ingest or a CSV redeploy is a cheap 304 miss
+SEARCH_CACHE_CONTROL = os.environ.get(
+    "SEARCH_CACHE_CONTROL", "public, max-age=60, s-maxage=300, stale-while-revalidate=600"
+)
+# Degraded (lexical-only) results and RPC-mode results carry no version to key on
+SEARCH_NO_CACHE = "no-store"
+
+
+class SearchParams:
+    """Validated /search query parameters."""
+
+    def __init__(self, query, page=1, page_size=10):
+        self.query = (query or "").strip()
+        if not self.query:
+            raise ValueError("q is required")
+        if page < 1:
+            raise ValueError("page must be 1 or more")
+        if not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {SEARCH_MAX_PAGE_SIZE}")
+        if page * page_size > SEARCH_MAX_RESULTS:
+            raise ValueError(f"Results are available to a depth of {SEARCH_MAX_RESULTS}")
+        self.page = page
+        self.page_size = page_size
+
+    @property
+    def offset(self):
+        return (self.page - 1) * self.page_size
+
+
+def search_etag(params, catalog_version, lexical_version):
+    """Strong ETag for one page of results against both ranking inputs.
+
+    None without a catalog version: RPC-mode results have nothing to key on.
+    """
+    if catalog_version is None:
+        return None
+    digest = hashlib.blake2b(digest_size=12)
+    # The raw query, as echoed in the body, not its normalized cache key
+    digest.update(f"search-v3\x1f{catalog_version}\x1f{lexical_version}\x1f{params.query}"
+                  f"\x1f{params.page}\x1f{params.page_size}".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match comparison (weak, as RFC 9110 specifies for this header)."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified(params, if_none_match):
+    """ETag to answer 304 with when the client already has this page, else None.
+
+    Checked before any embedding or retrieval, so a revalidation costs a hash.
+    """
+    catalog_version = current_catalog_version()
+    if catalog_version is None:
+        return None
+    etag = search_etag(params, catalog_version, current_lexical_version())
+    return etag if etag_matches(if_none_match, etag) else None
+
+
+def _result(row, rank):
+    result = {
+        "rank": rank,
+        "name": row["name"],
+        "description": row["description"],
+        "link": row["link"],
+        "score": row.get("rrf_score", row.get("bm25")),
+    }
+    if row.get("similarity") is not None:
+        result["similarity"] = row["similarity"]
+    if row.get("bm25") is not None:
+        result["bm25"] = row["bm25"]
+    return result
+
+
+async def search_workflows(supabase, embeddings, params):
+    """One page of hybrid results; returns (body, etag, cache_control).
+
+    Only results from the full hybrid ranking over a loaded catalog get an
+    ETag and a public Cache-Control; a lexical-only fallback is never cached.
+    """
+    query_embedding = await embed_query_or_none(embeddings, params.query)
+    degraded = query_embedding is None
+    try:
+        with timed_stage("retrieval"):
+            rows = await with_timeout(
+                "retrieval",
+                run_blocking(hybrid_match_workflows, supabase, params.query, query_embedding, 0.1, SEARCH_MAX_RESULTS),
+                RETRIEVAL_TIMEOUT_SECONDS
+            )
+    except Exception as e:
+        if degraded:
+            raise
+        print(f"Vector retrieval unavailable, using lexical retrieval only: {str(e)}")
+        fallbacks.inc(kind="lexical_retrieval")
+        degraded = True
+        rows = await run_blocking(hybrid_match_workflows, supabase, params.query, None, 0.1, SEARCH_MAX_RESULTS)
+
+    catalog_version = current_catalog_version()
+    page = rows[params.offset:params.offset + params.page_size]
+    body = {
+        "query": params.query,
+        "page": params.page,
+        "page_size": params.page_size,
+        "has_more": len(rows) > params.offset + params.page_size,
+        "catalog_version": catalog_version,
+        "degraded": degraded,
+        "results": [_result(row, params.offset + i + 1) for i, row in enumerate(page)],
+    }
+    etag = None if degraded else search_etag(params, catalog_version, current_lexical_version())
+    return body, etag, SEARCH_CACHE_CONTROL if etag is not None else SEARCH_NO_CACHE
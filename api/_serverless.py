@@ -0,0 +1,120 @@
+import json
+import asyncio
+import threading
+
+# --- Serverless Runtime Helpers ---
+# Vercel calls each function's BaseHTTPRequestHandler on a thread it owns.
+# Rather than asyncio.run() per request, which builds and tears down an event
+# loop every time, coroutines run on one loop in a daemon thread that lives as
+# long as the function instance stays warm, next to the shared clients.
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="serverless-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the shared loop and block this thread until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+async def _anext(events):
+    return await events.__anext__()
+
+
+async def _aclose(events):
+    await events.aclose()
+
+
+def read_json_body(handler):
+    content_length = int(handler.headers.get('Content-Length', 0))
+    if content_length <= 0:
+        return {}
+    return json.loads(handler.rfile.read(content_length).decode('utf-8'))
+
+
+def client_ip(handler):
+    """Caller IP, preferring the proxy headers Vercel sets."""
+    if 'x-forwarded-for' in handler.headers:
+        return handler.headers['x-forwarded-for'].split(',')[0].strip()
+    if 'x-real-ip' in handler.headers:
+        return handler.headers['x-real-ip']
+    return handler.client_address[0]
+
+
+def send_cors_headers(handler, methods):
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('Access-Control-Allow-Methods', methods)
+    handler.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+
+def send_preflight(handler, methods):
+    handler.send_response(200)
+    send_cors_headers(handler, methods)
+    handler.end_headers()
+
+
+def send_json(handler, status, body, methods, headers=None):
+    payload = json.dumps(body).encode('utf-8')
+    handler.send_response(status)
+    handler.send_header('Content-Type', 'application/json')
+    handler.send_header('Content-Length', str(len(payload)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    send_cors_headers(handler, methods)
+    handler.end_headers()
+    handler.wfile.write(payload)
+
+
+def _write_frame(handler, frame):
+    """Write and flush one frame; False once the client has gone away."""
+    try:
+        handler.wfile.write(frame.encode('utf-8'))
+        handler.wfile.flush()
+        return True
+    except (BrokenPipeError, ConnectionResetError):
+        return False
+
+
+def stream_events(handler, events, writer):
+    """Write an async generator of SSE frames to the client, ending with exactly one done.
+
+    The next frame is only pulled from the loop after the previous one has
+    been written and flushed, so a slow client holds the generator (and the
+    LLM read behind it) at its yield instead of frames queueing in memory.
+    If the client disconnects the generator is closed, which closes the
+    upstream LLM stream.
+    """
+    done_frame = writer.event('done')
+    finished = False
+    connected = True
+    try:
+        while True:
+            try:
+                frame = run_async(_anext(events))
+            except StopAsyncIteration:
+                break
+            if not _write_frame(handler, frame):
+                print("Client disconnected mid-stream")
+                connected = False
+                break
+            if frame == done_frame:
+                finished = True
+                break
+    except Exception as e:
+        print(f"Error during streaming: {str(e)}")
+        connected = _write_frame(handler, writer.event('error', str(e)))
+    finally:
+        run_async(_aclose(events))
+        if connected and not finished:
+            _write_frame(handler, done_frame)
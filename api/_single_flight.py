@@ -0,0 +1,136 @@
+import asyncio
+from _embedding_cache import normalize_query
+
+# --- Single-Flight Query Coalescing ---
+# A shared link brings a burst of the same question within a second or two.
+# The first request starts the pipeline (embed, retrieve, stream the LLM) as
+# a task; identical requests that arrive while it runs attach to it instead
+# of starting their own. Every event the pipeline produces is kept on the
+# flight, so a late joiner first gets everything emitted so far and then
+# follows the live stream. Once the flight finishes it is dropped and the
+# answer cache serves later repeats.
+
+
+class Flight:
+    """One in-progress pipeline run and the events it has produced so far."""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._wake = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Waiters hold the old event; the next wait gets a fresh one
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+
+def _merge_backlog(events):
+    """Join runs of content events so a replayed prefix goes out as one frame."""
+    merged = []
+    for kind, data in events:
+        if kind == "content" and merged and merged[-1][0] == "content":
+            merged[-1] = ("content", merged[-1][1] + data)
+        else:
+            merged.append((kind, data))
+    return merged
+
+
+class SingleFlight:
+    """Coalesces concurrent identical queries onto one pipeline run.
+
+    The pipeline is any async iterator of (event_type, data) tuples. It runs
+    as its own task, so a subscriber that disconnects does not end it for the
+    others; it is only cancelled when the last subscriber leaves. Must be
+    used from a single event loop.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+        self._flights = {}
+
+    @staticmethod
+    def key(query):
+        return normalize_query(query)
+
+    async def _run(self, flight, events):
+        try:
+            async for event in events:
+                flight.publish(event)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _join(self, key, factory):
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            self.joined += 1
+        else:
+            flight = Flight(key)
+            self._flights[key] = flight
+            self.started += 1
+            flight.task = asyncio.get_running_loop().create_task(self._run(flight, factory()))
+        flight.subscribers += 1
+        return flight
+
+    async def stream(self, query, factory):
+        """Yield the (event_type, data) events of the flight for query.
+
+        factory() builds the pipeline when no identical query is in flight.
+        A pipeline error is raised to every subscriber after the events that
+        preceded it.
+        """
+        flight = self._join(self.key(query), factory)
+        index = 0
+        try:
+            while True:
+                wake = flight._wake
+                if index < len(flight.events):
+                    backlog = flight.events[index:]
+                    index += len(backlog)
+                    for event in _merge_backlog(backlog):
+                        yield event
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await wake.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more; stop paying for the LLM stream
+                flight.task.cancel()
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "joined": self.joined,
+            "in_flight": len(self._flights),
+        }
+
+
+# --- Process-wide Coalescer ---
+query_flights = SingleFlight()
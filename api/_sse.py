@@ -0,0 +1,138 @@
+import os
+import json
+import asyncio
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Stream Configuration ---
+# LLM tokens are merged into one frame until either limit is reached
+SSE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("SSE_FLUSH_INTERVAL_MS", "30")) / 1000
+SSE_FLUSH_BYTES = int(os.environ.get("SSE_FLUSH_BYTES", "256"))
+# Request value of "stream_format" that switches content frames to raw appends
+APPEND_FORMAT = "append"
+
+
+def dumps(obj):
+    """Compact JSON text, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class SSEWriter:
+    """Formats the events of one stream.
+
+    Every event is a `data: {"type": ..., "data": ...}` frame. With
+    raw_append, content is sent as `event: append` frames whose data lines are
+    the text itself, which skips JSON encoding on the server and parsing in
+    the browser for the bulk of the stream.
+    """
+
+    def __init__(self, raw_append=False):
+        self.raw_append = raw_append
+
+    @classmethod
+    def for_format(cls, stream_format):
+        return cls(raw_append=stream_format == APPEND_FORMAT)
+
+    def event(self, event_type, data=None):
+        payload = {"type": event_type} if data is None else {"type": event_type, "data": data}
+        return f"data: {dumps(payload)}\n\n"
+
+    def content(self, text):
+        if not self.raw_append:
+            return self.event("content", text)
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        return "event: append\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+    def comment(self, text):
+        """An SSE comment line; EventSource and the frontend parser skip it."""
+        return f": {text}\n\n"
+
+    def frame(self, event):
+        """Format an (event_type, data) pipeline event."""
+        event_type, data = event
+        return self.content(data) if event_type == "content" else self.event(event_type, data)
+
+
+async def coalesce_text(chunks, flush_interval=SSE_FLUSH_INTERVAL_SECONDS, flush_bytes=SSE_FLUSH_BYTES):
+    """Merge an async stream of text pieces into fewer, larger pieces.
+
+    The first piece is passed through at once so time to first token is
+    unchanged. After that, pieces are buffered and released when flush_bytes
+    have accumulated or flush_interval has passed since the oldest buffered
+    piece arrived, whichever comes first. Upstream errors are raised after
+    whatever was buffered has been released.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    pending = None
+    buffer, size, opened_at = [], 0, None
+    first = True
+    try:
+        while True:
+            if pending is None and opened_at is None:
+                # Nothing buffered, so there is no deadline: wait on the source directly
+                try:
+                    text = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = None if opened_at is None else max(0.0, opened_at + flush_interval - loop.time())
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    yield "".join(buffer)
+                    buffer, size, opened_at = [], 0, None
+                    continue
+                task, pending = pending, None
+                try:
+                    text = task.result()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    if buffer:
+                        yield "".join(buffer)
+                        buffer = []
+                    raise
+
+            if first:
+                first = False
+                yield text
+                continue
+            buffer.append(text)
+            size += len(text.encode("utf-8"))
+            if opened_at is None:
+                opened_at = loop.time()
+            if size >= flush_bytes:
+                yield "".join(buffer)
+                buffer, size, opened_at = [], 0, None
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def llm_text(chunks):
+    """Non-empty text from a stream of LangChain message chunks."""
+    try:
+        async for chunk in chunks:
+            if chunk.content:
+                yield chunk.content
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,324 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from _clients import get_supabase
+from _star_filter import StarMembership
+
+# --- Star Counter Configuration ---
+# The count is served from memory: fresh for STAR_COUNT_TTL_SECONDS, then
+# served stale (while one background refresh runs) for up to
+# STAR_COUNT_STALE_SECONDS more before a request waits on Supabase again.
+STAR_COUNT_TTL_SECONDS = float(os.environ.get("STAR_COUNT_TTL_SECONDS", "10"))
+STAR_COUNT_STALE_SECONDS = float(os.environ.get("STAR_COUNT_STALE_SECONDS", "300"))
+# Queued stars are written with add_stars_batch (star_counter_batching_setup.sql),
+# or one add_star call each when that function has not been created.
+# Queued stars live only in this process: main.py flushes them every
+# interval and at shutdown, so a crash loses at most one interval of stars.
+# The serverless star_add writes through before it answers instead.
+STAR_FLUSH_INTERVAL_SECONDS = float(os.environ.get("STAR_FLUSH_INTERVAL_SECONDS", "2"))
+STAR_FLUSH_BATCH_SIZE = int(os.environ.get("STAR_FLUSH_BATCH_SIZE", "500"))
+# Consecutive failed flushes after which the queued stars are dropped (and
+# the cached count with them) rather than retried forever
+STAR_FLUSH_MAX_ATTEMPTS = int(os.environ.get("STAR_FLUSH_MAX_ATTEMPTS", "5"))
+DEFAULT_STAR_COUNT = 63
+
+
+def _missing_function(error):
+    # PostgREST answers PGRST202 when an RPC is not in its schema cache
+    return getattr(error, "code", None) == "PGRST202" or "Could not find the function" in str(error)
+
+
+def _rpc_row(data):
+    # PostgREST returns a JSON function result either bare or as a one-element list
+    if isinstance(data, list):
+        return data[0] if data else None
+    return data
+
+
+class StarCounter:
+    """Cached total star count with write-behind batching of new stars.
+
+    Page views read the count from memory. A new star is checked, queued and
+    added to the cached count straight away; a flush later writes every
+    queued star in one insert with ON CONFLICT DO NOTHING and updates the
+    total_stars row once for the whole batch. Until then a star exists only
+    in this process, so it is lost if the process dies before the flush.
+    """
+
+    def __init__(self, client_factory=get_supabase, ttl_seconds=STAR_COUNT_TTL_SECONDS,
+                 stale_seconds=STAR_COUNT_STALE_SECONDS, flush_interval=STAR_FLUSH_INTERVAL_SECONDS,
+                 batch_size=STAR_FLUSH_BATCH_SIZE, max_attempts=STAR_FLUSH_MAX_ATTEMPTS):
+        self.client_factory = client_factory
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.dropped = 0
+        self._failed_flushes = 0
+        # Cleared once add_stars_batch turns out not to exist
+        self._batch_rpc = True
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db_count = None
+        self._fetched_at = 0.0
+        # Bumped by every flush so a refresh that raced it cannot roll the count back
+        self._generation = 0
+        self._refreshing = False
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._starred = set()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flusher = None
+        self.membership = StarMembership()
+
+    # --- Count ---
+    def _local_count(self):
+        return self._db_count + len(self._pending) + len(self._in_flight)
+
+    def _fetch(self):
+        with self._lock:
+            generation = self._generation
+        result = self.client_factory().rpc('get_star_count').execute()
+        count = result.data if result.data is not None else DEFAULT_STAR_COUNT
+        with self._lock:
+            if generation == self._generation:
+                self._db_count = count
+                self._fetched_at = time.time()
+            return self._local_count()
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            print(f"Star count refresh failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def peek(self):
+        """The count if it can be served without waiting on Supabase, else None.
+
+        A stale count starts one background refresh and is returned as is.
+        """
+        now = time.time()
+        with self._lock:
+            if self._db_count is None:
+                return None
+            age = now - self._fetched_at
+            if age <= self.ttl_seconds:
+                self.hits += 1
+                return self._local_count()
+            if age > self.ttl_seconds + self.stale_seconds:
+                return None
+            self.stale_hits += 1
+            if not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, name="star-count-refresh", daemon=True).start()
+            return self._local_count()
+
+    def count(self):
+        """Current star count, including stars queued but not yet written."""
+        count = self.peek()
+        if count is not None:
+            return count
+        with self._lock:
+            self.misses += 1
+            stale = self._local_count() if self._db_count is not None else None
+        try:
+            return self._fetch()
+        except Exception:
+            # A too-old count still beats an error on every page view
+            if stale is None:
+                raise
+            return stale
+
+    # --- Stars ---
+    def _known_starred(self, key):
+        return key in self._pending or key in self._in_flight or key in self._starred
+
+    def load_membership(self):
+        """Build the starred-pairs filter now rather than on the first check."""
+        return self.membership.load(self.client_factory())
+
+    def _rpc_has_starred(self, user_ip, session_id):
+        result = self.client_factory().rpc('has_user_starred', {
+            'user_ip': user_ip,
+            'user_session': session_id
+        }).execute()
+        if result.data:
+            with self._lock:
+                self._starred.add((user_ip, session_id))
+        return bool(result.data)
+
+    def has_starred(self, user_ip, session_id):
+        """Whether this ip/session has starred, counting stars still in the queue.
+
+        A miss in a recently synced membership filter is answered without
+        Supabase; anything else is asked with has_user_starred.
+        """
+        with self._lock:
+            if self._known_starred((user_ip, session_id)):
+                return True
+        answer = self.membership.check(self.client_factory(), user_ip, session_id)
+        if answer == "no":
+            return False
+        starred = self._rpc_has_starred(user_ip, session_id)
+        if answer == "maybe" and not starred:
+            self.membership.record_false_positive()
+        return starred
+
+    def add(self, user_ip, session_id, user_agent=None, write_through=False):
+        """Queue a star and return the same shape as the add_star RPC.
+
+        With write_through the queue is flushed before returning, and a star
+        that could not be written raises instead of being reported as added.
+        """
+        key = (user_ip, session_id)
+        with self._lock:
+            already_starred = self._known_starred(key)
+        if not already_starred:
+            # Always asked directly: the filter can lag stars made on other instances
+            already_starred = self._rpc_has_starred(user_ip, session_id)
+        if self._db_count is None:
+            self.count()
+        with self._lock:
+            if already_starred or self._known_starred(key):
+                return {"success": False, "message": "Already starred", "count": self._local_count()}
+            self._pending[key] = user_agent or ''
+            count = self._local_count()
+            full = len(self._pending) >= self.batch_size
+        self.membership.add(user_ip, session_id)
+        if write_through:
+            self.flush()
+            with self._lock:
+                if self._pending.pop(key, None) is not None:
+                    raise RuntimeError("Could not record the star")
+                count = self._local_count()
+        elif full:
+            self._wake.set()
+        return {"success": True, "message": "Star added successfully", "count": count}
+
+    # --- Write-Behind ---
+    def _write_one_by_one(self, keys, batch):
+        inserted, count, failed = 0, None, []
+        for key, star in zip(keys, batch):
+            try:
+                row = _rpc_row(self.client_factory().rpc('add_star', star).execute().data) or {}
+            except Exception as e:
+                print(f"Star write failed, keeping it queued: {str(e)}")
+                failed.append(key)
+                continue
+            if row.get('success'):
+                inserted += 1
+            if row.get('count') is not None:
+                count = row['count']
+        return inserted, count, failed
+
+    def _write_batch(self, keys, batch):
+        """Write one batch; returns (rows inserted, new total or None, keys that failed)."""
+        if self._batch_rpc:
+            try:
+                result = self.client_factory().rpc('add_stars_batch', {'stars': batch}).execute()
+                row = _rpc_row(result.data) or {}
+                return row.get('inserted') or 0, row.get('count'), []
+            except Exception as e:
+                if not _missing_function(e):
+                    print(f"Star flush failed, keeping {len(batch)} stars queued: {str(e)}")
+                    return 0, None, keys
+                print("add_stars_batch not found (star_counter_batching_setup.sql not applied), "
+                      "writing stars one at a time with add_star")
+                self._batch_rpc = False
+        return self._write_one_by_one(keys, batch)
+
+    def flush(self):
+        """Write every queued star in batches; returns the number of rows inserted."""
+        inserted = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return inserted
+                    keys = list(self._pending)[:self.batch_size]
+                    self._in_flight = {key: self._pending.pop(key) for key in keys}
+                    batch = [
+                        {"user_ip": ip, "user_session": session, "user_agent_string": user_agent}
+                        for (ip, session), user_agent in self._in_flight.items()
+                    ]
+                written, count, failed = self._write_batch(keys, batch)
+                inserted += written
+                with self._lock:
+                    failed_stars = OrderedDict((key, self._in_flight[key]) for key in failed)
+                    self._starred.update(key for key in self._in_flight if key not in failed_stars)
+                    self._in_flight = {}
+                    if len(failed_stars) < len(keys):
+                        self.flushes += 1
+                        self._generation += 1
+                        if count is not None:
+                            self._db_count = count
+                            self._fetched_at = time.time()
+                    if not failed_stars:
+                        self._failed_flushes = 0
+                        continue
+                    self.flush_errors += 1
+                    self._failed_flushes += 1
+                    if self._failed_flushes >= self.max_attempts:
+                        print(f"Dropping {len(failed_stars)} stars after {self._failed_flushes} failed flushes")
+                        self.dropped += len(failed_stars)
+                        self._failed_flushes = 0
+                    else:
+                        # Put them back in front of anything queued meanwhile
+                        failed_stars.update(self._pending)
+                        self._pending = failed_stars
+                return inserted
+
+    def _run_flusher(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        """Flush queued stars every flush_interval on a daemon thread."""
+        with self._lock:
+            if self._flusher is None:
+                self._stopping = False
+                self._flusher = threading.Thread(target=self._run_flusher, name="star-flusher", daemon=True)
+                self._flusher.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still queued."""
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+            self._stopping = True
+        self._wake.set()
+        if flusher is not None:
+            flusher.join(timeout=self.flush_interval + 10)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "count": self._local_count() if self._db_count is not None else None,
+                "age_seconds": time.time() - self._fetched_at if self._db_count is not None else None,
+                "pending": len(self._pending) + len(self._in_flight),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "dropped": self.dropped,
+                "batch_rpc": self._batch_rpc,
+                "membership": self.membership.stats(),
+            }
+
+
+# Process-wide counter shared by main.py and the serverless star handlers
+star_counter = StarCounter()
@@ -0,0 +1,214 @@
+import os
+import math
+import time
+import hashlib
+import threading
+
+# --- Star Membership Filter Configuration ---
+# Almost no visitor has starred, so /stars/check answers from a Bloom filter
+# of starred (ip, session) pairs: a miss is a definite "no" and only a
+# possible hit is confirmed with has_user_starred.
+#
+# Stars written by other processes (other uvicorn workers, the star_add
+# serverless function) only reach this filter with the next sync, so a miss
+# is trusted only while the last sync is at most STAR_FILTER_TRUST_SECONDS
+# old. A stale filter syncs (new user_stars ids only, one query) on the
+# next check; checks meanwhile go to has_user_starred. At worst a star made
+# elsewhere in that window reads as "not starred" to the button, and
+# star_add still asks has_user_starred before counting anything.
+#
+# With STAR_FILTER_SINGLE_WRITER=1 (one process handles every star, its own
+# adds go straight into the filter) misses stay trusted for a whole
+# STAR_FILTER_SYNC_SECONDS.
+STAR_FILTER_SINGLE_WRITER = os.environ.get("STAR_FILTER_SINGLE_WRITER", "0") == "1"
+STAR_FILTER_TRUST_SECONDS = float(os.environ.get("STAR_FILTER_TRUST_SECONDS", "5"))
+STAR_FILTER_CAPACITY = int(os.environ.get("STAR_FILTER_CAPACITY", "100000"))
+STAR_FILTER_FPR = float(os.environ.get("STAR_FILTER_FPR", "0.001"))
+# Sync interval for a single writer, and the wait after a failed sync
+STAR_FILTER_SYNC_SECONDS = float(os.environ.get("STAR_FILTER_SYNC_SECONDS", "30"))
+STAR_FILTER_PAGE_SIZE = int(os.environ.get("STAR_FILTER_PAGE_SIZE", "1000"))
+
+
+def _pair_key(user_ip, session_id):
+    return f"{user_ip or ''}\x1f{session_id or ''}".encode("utf-8")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over bytes keys, sized for a capacity and target FPR.
+
+    Positions come from one 128-bit blake2b digest split into two 64-bit
+    halves and combined by double hashing (h1 + i * h2).
+    """
+
+    def __init__(self, capacity=STAR_FILTER_CAPACITY, fpr=STAR_FILTER_FPR):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.target_fpr = fpr
+        self.num_bits = max(64, math.ceil(-capacity * math.log(fpr) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_fpr(self):
+        """Expected false-positive rate at the current fill: (1 - e^(-kn/m))^k."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+
+class StarMembership:
+    """Bloom filter of every (ip, session) in user_stars, kept in sync by id.
+
+    Built lazily on first use. A miss is only answered as a definite "no"
+    while the last successful sync is within fresh_seconds (trust_seconds,
+    or sync_seconds for a single writer); otherwise (not loaded, sync
+    failing or still running) check() says "unknown" and callers fall back
+    to the RPC.
+    """
+
+    def __init__(self, capacity=STAR_FILTER_CAPACITY, fpr=STAR_FILTER_FPR,
+                 sync_seconds=STAR_FILTER_SYNC_SECONDS, page_size=STAR_FILTER_PAGE_SIZE,
+                 single_writer=STAR_FILTER_SINGLE_WRITER, trust_seconds=STAR_FILTER_TRUST_SECONDS):
+        self.capacity = capacity
+        self.fpr = fpr
+        self.sync_seconds = sync_seconds
+        self.page_size = page_size
+        self.single_writer = single_writer
+        self.fresh_seconds = sync_seconds if single_writer else min(trust_seconds, sync_seconds)
+        self.negatives = 0
+        self.positives = 0
+        self.false_positives = 0
+        self._filter = None
+        self._last_id = 0
+        # Last successful sync, and when the next attempt is due (pushed back after a failure)
+        self._synced_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _fetch_since(self, supabase, last_id):
+        """user_stars rows with id > last_id, in id order."""
+        rows = []
+        while True:
+            response = (
+                supabase.table("user_stars")
+                .select("id,ip_address,session_id")
+                .gt("id", last_id)
+                .order("id")
+                .limit(self.page_size)
+                .execute()
+            )
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            last_id = page[-1]["id"]
+
+    def _sync(self, supabase):
+        # One sync at a time; concurrent checks keep using the current filter
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                bloom, last_id = self._filter, self._last_id
+            rows = self._fetch_since(supabase, last_id if bloom is not None else 0)
+            fresh = bloom is None or bloom.count + len(rows) > bloom.capacity
+            if fresh:
+                # First load, or the filter is full: rebuild with headroom from scratch
+                if bloom is not None:
+                    rows = self._fetch_since(supabase, 0)
+                bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.fpr)
+            for row in rows:
+                bloom.add(_pair_key(row.get("ip_address"), row.get("session_id")))
+            with self._lock:
+                if fresh:
+                    # Stars added locally during the read are still in StarCounter's own sets
+                    self._filter = bloom
+                if rows:
+                    self._last_id = max(self._last_id, rows[-1]["id"])
+                self._synced_at = time.time()
+                self._retry_at = self._synced_at + self.fresh_seconds
+        finally:
+            self._sync_lock.release()
+
+    def load(self, supabase):
+        """Build the filter from user_stars; returns False if it could not be read."""
+        try:
+            self._sync(supabase)
+            return self._filter is not None
+        except Exception as e:
+            print(f"Star membership filter unavailable, using has_user_starred: {str(e)}")
+            # Wait a full sync interval before trying the table again; the
+            # old filter stays but is stale, so its misses are not trusted
+            self._retry_at = time.time() + self.sync_seconds
+            return False
+
+    def check(self, supabase, user_ip, session_id):
+        """Filter answer for a pair: "no" (definitely not starred), "maybe" or "unknown".
+
+        Callers confirm "maybe" and "unknown" with has_user_starred.
+        """
+        if time.time() >= self._retry_at:
+            self.load(supabase)
+        with self._lock:
+            bloom = self._filter
+            if bloom is None or time.time() - self._synced_at > self.fresh_seconds:
+                return "unknown"
+            if _pair_key(user_ip, session_id) in bloom:
+                self.positives += 1
+                return "maybe"
+            self.negatives += 1
+            return "no"
+
+    def might_have_starred(self, supabase, user_ip, session_id):
+        """False only when the pair has definitely not starred."""
+        return self.check(supabase, user_ip, session_id) != "no"
+
+    def add(self, user_ip, session_id):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(_pair_key(user_ip, session_id))
+
+    def record_false_positive(self):
+        """The RPC said no after the filter said maybe."""
+        with self._lock:
+            self.false_positives += 1
+
+    def stats(self):
+        with self._lock:
+            bloom = self._filter
+            lookups = self.negatives + self.positives
+            return {
+                "loaded": bloom is not None,
+                "single_writer": self.single_writer,
+                "fresh_seconds": self.fresh_seconds,
+                "items": bloom.count if bloom else 0,
+                "capacity": bloom.capacity if bloom else self.capacity,
+                "bits": bloom.num_bits if bloom else 0,
+                "hashes": bloom.num_hashes if bloom else 0,
+                "memory_bytes": bloom.memory_bytes if bloom else 0,
+                "target_fpr": self.fpr,
+                "estimated_fpr": bloom.estimated_fpr() if bloom else None,
+                # False positives over everyone who has not starred
+                "observed_fpr": self.false_positives / (self.negatives + self.false_positives)
+                if self.negatives + self.false_positives else None,
+                "lookups": lookups,
+                "rpc_skipped": self.negatives,
+                "synced_at": self._synced_at or None,
+            }
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import bisect
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from _ingest import load_workflows_csv
+from _lexical_index import WORKFLOWS_CSV_PATH
+
+# --- Typeahead Configuration ---
+TYPEAHEAD_DEFAULT_LIMIT = 8
+TYPEAHEAD_MAX_LIMIT = 25
+# Normalized prefixes whose suggestions are remembered until the next rebuild
+TYPEAHEAD_CACHE_SIZE = int(os.environ.get("TYPEAHEAD_CACHE_SIZE", "4096"))
+# How often to stat the templates CSV for a re-ingested catalog
+TYPEAHEAD_CHECK_SECONDS = float(os.environ.get("TYPEAHEAD_CHECK_SECONDS", "5"))
+# Past this share of changed names a full rebuild is cheaper than patching keys
+TYPEAHEAD_REBUILD_FRACTION = float(os.environ.get("TYPEAHEAD_REBUILD_FRACTION", "0.25"))
+TYPEAHEAD_CACHE_CONTROL = os.environ.get("TYPEAHEAD_CACHE_CONTROL", "public, max-age=300")
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def _tokens(text):
+    return _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def _name_keys(name, link):
+    """One sorted-array key per token of the name: the name from that token on."""
+    tokens = _tokens(name)
+    return [(" ".join(tokens[i:]), link, i) for i in range(len(tokens))]
+
+
+class TypeaheadIndex:
+    """Workflow-name autocomplete over a sorted array searched with bisect.
+
+    Every name contributes one key per token ("ai powered telegram ...",
+    "powered telegram ...", "telegram ..."), so a prefix of the whole name or
+    of any run of its words is one contiguous slice of the array. Matches
+    at the start of a name rank first, then by the CSV score. Each key's
+    rank is precomputed, so a slice is ranked with one np.unique however
+    short the prefix. Treated as immutable: updated() returns a new index.
+    """
+
+    def __init__(self, entries, keys=None):
+        self.entries = entries
+        if keys is None:
+            keys = sorted(key for link, entry in entries.items() for key in _name_keys(entry["name"], link))
+        self.keys = keys
+
+        # Workflows best first; a key's rank is its workflow's place, offset
+        # by len(entries) when the match is not at the start of the name
+        self.ranked = sorted(entries, key=self._order)
+        place = {link: i for i, link in enumerate(self.ranked)}
+        self.ranks = np.fromiter(
+            ((0 if position == 0 else len(entries)) + place[link] for _, link, position in keys),
+            dtype=np.int32, count=len(keys)
+        )
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _entries(rows):
+        return {row["link"]: {"name": row["name"], "link": row["link"], "score": row.get("score")} for row in rows}
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(cls._entries(rows))
+
+    @classmethod
+    def from_csv(cls, csv_file_path=WORKFLOWS_CSV_PATH):
+        return cls.from_rows(load_workflows_csv(csv_file_path))
+
+    def updated(self, rows):
+        """Index for a new catalog, patching only the keys of added, removed or renamed workflows."""
+        entries = self._entries(rows)
+        removed = [link for link, entry in self.entries.items()
+                   if link not in entries or entries[link]["name"] != entry["name"]]
+        added = [link for link, entry in entries.items()
+                 if link not in self.entries or self.entries[link]["name"] != entry["name"]]
+        if len(removed) + len(added) > TYPEAHEAD_REBUILD_FRACTION * max(len(entries), 1):
+            return TypeaheadIndex(entries)
+
+        # Score-only changes need no key changes: ranking reads scores from entries
+        keys = list(self.keys)
+        for link in removed:
+            for key in _name_keys(self.entries[link]["name"], link):
+                i = bisect.bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+        for link in added:
+            for key in _name_keys(entries[link]["name"], link):
+                bisect.insort(keys, key)
+        return TypeaheadIndex(entries, keys)
+
+    def _order(self, link):
+        entry = self.entries[link]
+        return (-(entry["score"] or 0.0), len(entry["name"]), entry["name"])
+
+    def suggest(self, query, limit=TYPEAHEAD_DEFAULT_LIMIT):
+        """Up to limit {name, link, score} suggestions for what the user has typed so far."""
+        prefix = " ".join(_tokens(query))
+        if not prefix or limit <= 0:
+            return []
+        with self._cache_lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                self._cache.move_to_end((prefix, limit))
+                return cached
+
+        # Every key starting with the prefix sits between these two bounds
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + "\U0010ffff",), start)
+        places = []
+        seen = set()
+        for rank in np.unique(self.ranks[start:end]).tolist():
+            place = rank % len(self.entries)
+            if place not in seen:
+                seen.add(place)
+                places.append(place)
+                if len(places) == limit:
+                    break
+        suggestions = [dict(self.entries[self.ranked[place]]) for place in places]
+
+        with self._cache_lock:
+            self._cache[(prefix, limit)] = suggestions
+            while len(self._cache) > TYPEAHEAD_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return suggestions
+
+
+# --- Process-wide Index ---
+_index = None
+_csv_identity = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def get_typeahead_index(csv_file_path=WORKFLOWS_CSV_PATH):
+    """The typeahead index, built on first use and patched when the CSV is re-ingested; None without a CSV."""
+    global _index, _csv_identity, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < TYPEAHEAD_CHECK_SECONDS:
+        return _index
+    with _index_lock:
+        if _index is not None and now - _checked_at < TYPEAHEAD_CHECK_SECONDS:
+            return _index
+        _checked_at = now
+        identity = _identity(csv_file_path)
+        if identity is None or identity == _csv_identity:
+            return _index
+        try:
+            started = time.perf_counter()
+            rows = load_workflows_csv(csv_file_path)
+            _index = TypeaheadIndex.from_rows(rows) if _index is None else _index.updated(rows)
+            _csv_identity = identity
+            print(f"Loaded typeahead index: {len(_index)} workflows, {len(_index.keys)} keys "
+                  f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        except Exception as e:
+            print(f"Typeahead index unavailable: {str(e)}")
+        return _index
+
+
+def typeahead_response(query, limit=TYPEAHEAD_DEFAULT_LIMIT):
+    """Body for /typeahead; raises ValueError for a bad limit and RuntimeError without a catalog."""
+    if not 1 <= limit <= TYPEAHEAD_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {TYPEAHEAD_MAX_LIMIT}")
+    index = get_typeahead_index()
+    if index is None:
+        raise RuntimeError("Typeahead index unavailable")
+    return {"query": query, "suggestions": index.suggest(query, limit)}
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from _resilience import breakers
+from _metrics import stage
+from _index_snapshot import IndexSnapshot, WORKFLOW_INDEX_SNAPSHOT_PATH, snapshot_identity
+
+# --- Index Configuration ---
+# "local" answers match_workflows in-process, "rpc" always calls Supabase
+WORKFLOW_INDEX_MODE = os.environ.get("WORKFLOW_INDEX_MODE", "local")
+WORKFLOW_INDEX_PAGE_SIZE = int(os.environ.get("WORKFLOW_INDEX_PAGE_SIZE", "200"))
+# Seconds to wait before retrying a failed index load (falls back to the RPC meanwhile)
+WORKFLOW_INDEX_RETRY_SECONDS = float(os.environ.get("WORKFLOW_INDEX_RETRY_SECONDS", "60"))
+# "binary" or "int8" keeps only compact codes in memory and memory-maps the
+# float32 vectors from WORKFLOW_INDEX_STORE_DIR for exact rescoring
+WORKFLOW_INDEX_QUANTIZATION = os.environ.get("WORKFLOW_INDEX_QUANTIZATION", "")
+WORKFLOW_INDEX_STORE_DIR = os.environ.get("WORKFLOW_INDEX_STORE_DIR", "/tmp/workflow_index")
+# How often to stat WORKFLOW_INDEX_SNAPSHOT_PATH for a newly swapped-in snapshot
+WORKFLOW_INDEX_SNAPSHOT_CHECK_SECONDS = float(os.environ.get("WORKFLOW_INDEX_SNAPSHOT_CHECK_SECONDS", "5"))
+
+
+def _parse_embedding(value):
+    """pgvector columns come back from PostgREST as a '[0.1,0.2,...]' string."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+class VectorIndex:
+    """In-memory cosine index over the n8n_workflows catalog.
+
+    All embeddings live in one contiguous float32 matrix with L2-normalized
+    rows, so a query is a single matrix-vector product plus argpartition.
+    """
+
+    def __init__(self, rows, embeddings):
+        self.ids = [row.get("id") for row in rows]
+        self.names = [row["name"] for row in rows]
+        self.descriptions = [row["description"] for row in rows]
+        self.links = [row["link"] for row in rows]
+
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(rows):
+            raise ValueError(f"Expected a ({len(rows)}, dim) embedding matrix, got {matrix.shape}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms)
+        self.store = None
+        self.snapshot = None
+        self.version = self._compute_version()
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def attach_store(self, store):
+        """Serve searches from a QuantizedEmbeddingStore and drop the in-memory matrix."""
+        if len(store) != len(self) or store.dim != self.dim:
+            raise ValueError("Quantized store does not match this index")
+        self.store = store
+        self.matrix = store.full
+
+    def _compute_version(self):
+        """Short content hash identifying this exact catalog."""
+        digest = hashlib.blake2b(digest_size=8)
+        for row_id, name, description, link in zip(self.ids, self.names, self.descriptions, self.links):
+            digest.update(f"{row_id}\x1f{name}\x1f{description}\x1f{link}\x1e".encode("utf-8"))
+        digest.update(str(self.matrix.shape).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_supabase(cls, supabase, page_size=WORKFLOW_INDEX_PAGE_SIZE):
+        """Page through n8n_workflows and build an index from every row."""
+        rows = []
+        embeddings = []
+        start = 0
+        while True:
+            response = (
+                supabase.table("n8n_workflows")
+                .select("id,name,description,link,embedding")
+                .order("id")
+                .range(start, start + page_size - 1)
+                .execute()
+            )
+            page = response.data or []
+            for row in page:
+                if row.get("embedding") is None:
+                    continue
+                embeddings.append(_parse_embedding(row.pop("embedding")))
+                rows.append(row)
+            if len(page) < page_size:
+                break
+            start += page_size
+
+        if not rows:
+            raise ValueError("n8n_workflows returned no embedded rows")
+        return cls(rows, np.vstack(embeddings))
+
+    @classmethod
+    def from_snapshot(cls, path=WORKFLOW_INDEX_SNAPSHOT_PATH):
+        """Map a snapshot written by write_snapshot(); nothing is copied or decoded up front."""
+        snapshot = IndexSnapshot(path)
+        index = cls.__new__(cls)
+        index.ids = snapshot.id_column()
+        index.names = snapshot.column("name")
+        index.descriptions = snapshot.column("description")
+        index.links = snapshot.column("link")
+        index.matrix = snapshot.matrix
+        index.store = None
+        index.version = snapshot.version
+        index.snapshot = snapshot
+        return index
+
+    def row(self, i, similarity=None):
+        """Result row in the same shape match_workflows returns."""
+        result = {
+            "id": self.ids[i],
+            "name": self.names[i],
+            "description": self.descriptions[i],
+            "link": self.links[i],
+        }
+        if similarity is not None:
+            result["similarity"] = float(similarity)
+        return result
+
+    def search(self, query_embedding, match_threshold=0.1, match_count=10):
+        """Top-k cosine search with the same semantics as the match_workflows RPC.
+
+        Rows with similarity strictly above match_threshold are returned,
+        best first, at most match_count of them.
+        """
+        if match_count <= 0 or len(self) == 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(f"Query embedding has shape {query.shape}, index expects ({self.dim},)")
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        query = query / norm
+        if self.store is not None:
+            top, top_scores = self.store.search(query, match_count)
+            return [self.row(i, score) for i, score in zip(top, top_scores) if score > match_threshold]
+
+        scores = self.matrix @ query
+        k = min(match_count, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [self.row(i, scores[i]) for i in top if scores[i] > match_threshold]
+
+    def search_batch(self, query_embeddings, match_threshold=0.1, match_count=10):
+        """search() for many queries at once: one (B, dim) x (dim, N) product for the whole batch.
+
+        Returns one result list per query, in order. A quantized store is
+        searched query by query so the full matrix stays on disk.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError(f"Query embeddings have shape {queries.shape}, index expects (batch, {self.dim})")
+        if match_count <= 0 or len(self) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        if self.store is not None:
+            return [self.search(query, match_threshold, match_count) for query in queries]
+
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        zero = norms[:, 0] == 0
+        norms[zero] = 1.0
+        scores = (queries / norms) @ self.matrix.T
+
+        k = min(match_count, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [] if zero[b] else [self.row(i, score) for i, score in zip(top[b], top_scores[b]) if score > match_threshold]
+            for b in range(len(queries))
+        ]
+
+
+# --- Process-wide Index ---
+_index = None
+_index_lock = threading.Lock()
+_index_failed_at = None
+_snapshot_checked_at = 0.0
+# Identity of a snapshot file that failed to map, skipped until the file changes
+_snapshot_rejected = None
+# Requests never page the catalog out of Supabase themselves: that takes
+# seconds, far past the retrieval deadline. Without a snapshot they start
+# this thread and use the match_workflows RPC until it has finished.
+_loader = None
+_loader_lock = threading.Lock()
+# Cleared by snapshot_only() in the serverless handlers, where every cold
+# instance would download the whole embedding table again
+_supabase_load_allowed = True
+
+
+def _with_store(index):
+    if WORKFLOW_INDEX_QUANTIZATION:
+        from _quantized_store import QuantizedEmbeddingStore
+        # One directory per catalog version: a swapped-in index must not
+        # overwrite the files the previous one still has mapped
+        index.attach_store(QuantizedEmbeddingStore.build(
+            index.matrix, os.path.join(WORKFLOW_INDEX_STORE_DIR, index.version), mode=WORKFLOW_INDEX_QUANTIZATION
+        ))
+    return index
+
+
+def _load_locked(supabase):
+    global _index, _index_failed_at, _snapshot_rejected
+    try:
+        started = time.perf_counter()
+        index = None
+        identity = snapshot_identity()
+        if identity is not None and identity != _snapshot_rejected:
+            try:
+                index = VectorIndex.from_snapshot()
+            except Exception as e:
+                _snapshot_rejected = identity
+                print(f"Failed to map workflow index snapshot, paging from Supabase: {str(e)}")
+        if index is None:
+            index = VectorIndex.from_supabase(supabase)
+        _index = _with_store(index)
+        _index_failed_at = None
+        source = "snapshot" if index.snapshot is not None else "Supabase"
+        print(f"Loaded workflow index from {source}: {len(index)} rows x {index.dim} dims "
+              f"in {time.perf_counter() - started:.2f}s (version {index.version})")
+        return index
+    except Exception as e:
+        _index_failed_at = time.monotonic()
+        print(f"Failed to load workflow index, falling back to match_workflows RPC: {str(e)}")
+        return None
+
+
+def _map_snapshot_locked(identity):
+    global _index, _snapshot_rejected
+    try:
+        index = _with_store(VectorIndex.from_snapshot())
+    except Exception as e:
+        _snapshot_rejected = identity
+        print(f"Failed to map workflow index snapshot, using match_workflows RPC: {str(e)}")
+        return
+    _index = index
+    print(f"Mapped workflow index snapshot: {len(index)} rows x {index.dim} dims (version {index.version})")
+
+
+def load_workflow_index(supabase):
+    """(Re)build the process-wide index now; returns None if loading fails."""
+    with _index_lock:
+        return _load_locked(supabase)
+
+
+def snapshot_only():
+    """Never page the index from Supabase in this process: map a snapshot or use the RPC."""
+    global _supabase_load_allowed
+    _supabase_load_allowed = False
+
+
+def _start_background_load(supabase):
+    global _loader
+    with _loader_lock:
+        if _loader is not None and _loader.is_alive():
+            return
+        if _index_failed_at is not None and time.monotonic() - _index_failed_at < WORKFLOW_INDEX_RETRY_SECONDS:
+            return
+        _loader = threading.Thread(
+            target=load_workflow_index, args=(supabase,), name="workflow-index-load", daemon=True
+        )
+        _loader.start()
+
+
+def _snapshot_replaced():
+    """Whether a different snapshot file than the loaded one is in place; stats at most every few seconds."""
+    global _snapshot_checked_at
+    now = time.monotonic()
+    if now - _snapshot_checked_at < WORKFLOW_INDEX_SNAPSHOT_CHECK_SECONDS:
+        return False
+    _snapshot_checked_at = now
+    identity = snapshot_identity()
+    if identity is None or identity == _snapshot_rejected:
+        return False
+    return _index.snapshot is None or identity != _index.snapshot.identity
+
+
+def _reload_snapshot():
+    """Swap in the new snapshot; searches already running finish on the old mapping."""
+    global _index, _snapshot_rejected
+    # Whoever holds the lock is already replacing the index; keep serving this one
+    if not _index_lock.acquire(blocking=False):
+        return _index
+    try:
+        identity = snapshot_identity()
+        try:
+            index = _with_store(VectorIndex.from_snapshot())
+        except Exception as e:
+            _snapshot_rejected = identity
+            print(f"Failed to map new workflow index snapshot, keeping version {_index.version}: {str(e)}")
+            return _index
+        _index = index
+        print(f"Swapped in workflow index snapshot: {len(index)} rows (version {index.version})")
+        return index
+    finally:
+        _index_lock.release()
+
+
+def get_workflow_index(supabase):
+    """Return the process-wide index, or None to use the match_workflows RPC.
+
+    Never blocks on a load: a snapshot file is mapped in place (which is
+    fast); otherwise the catalog is paged from Supabase on a background
+    thread and callers use the RPC until it is done. A snapshot swapped in
+    by the ingestion scripts replaces the loaded index without a restart.
+    """
+    if WORKFLOW_INDEX_MODE != "local":
+        return None
+    if _index is not None:
+        if _snapshot_replaced():
+            return _reload_snapshot()
+        return _index
+    identity = snapshot_identity()
+    if identity is not None and identity != _snapshot_rejected:
+        if not _index_lock.acquire(blocking=False):
+            return None
+        try:
+            if _index is None:
+                _map_snapshot_locked(identity)
+            return _index
+        finally:
+            _index_lock.release()
+    if _supabase_load_allowed:
+        _start_background_load(supabase)
+    return None
+
+
+def match_workflows(supabase, query_embedding, match_threshold=0.1, match_count=5):
+    """Drop-in replacement for supabase.rpc('match_workflows', ...).execute().data."""
+    index = get_workflow_index(supabase)
+    if index is not None:
+        with stage("vector_search"):
+            return index.search(query_embedding, match_threshold, match_count)
+
+    with stage("match_workflows_rpc"):
+        search_results = breakers["supabase"].call(supabase.rpc('match_workflows', {
+            'query_embedding': query_embedding,
+            'match_threshold': match_threshold,
+            'match_count': match_count
+        }).execute)
+    return search_results.data
+
+
+def match_workflows_batch(supabase, query_embeddings, match_threshold=0.1, match_count=5):
+    """match_workflows for a list of embeddings; one matrix product when the local index is loaded."""
+    index = get_workflow_index(supabase)
+    if index is not None:
+        with stage("vector_search_batch"):
+            return index.search_batch(query_embeddings, match_threshold, match_count)
+    return [match_workflows(supabase, embedding, match_threshold, match_count) for embedding in query_embeddings]
+
+
+def current_catalog_version():
+    """Version hash of the loaded index, or None when serving from the RPC."""
+    return _index.version if _index is not None else None
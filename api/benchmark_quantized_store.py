@@ -0,0 +1,126 @@
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+from _quantized_store import QuantizedEmbeddingStore
+
+# Memory footprint and recall@k of the quantized embedding store against the
+# exact float32 ranking, at today's catalog size and at simulated growth.
+#
+#   python benchmark_quantized_store.py --npy catalog.npy --scale 1 10 100
+#
+# catalog.npy can be written by evaluate_embedding_dims.py --save-npy. Without
+# it a synthetic catalog with a decaying per-dimension spectrum is used.
+# Larger catalogs are simulated by jittering copies of the real rows.
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def synthetic_catalog(rows, dim, rng):
+    spectrum = np.linspace(2.0, 0.3, dim, dtype=np.float32)
+    return normalize_rows(rng.standard_normal((rows, dim), dtype=np.float32) * spectrum)
+
+
+def grow_catalog(base, scale, rng, jitter=0.35):
+    if scale == 1:
+        return base
+    copies = [base] + [
+        normalize_rows(base + jitter * rng.standard_normal(base.shape, dtype=np.float32) / np.sqrt(base.shape[1]))
+        for _ in range(scale - 1)
+    ]
+    return np.vstack(copies)
+
+
+def python_list_bytes(rows, dim):
+    """What the ingestion scripts used to hold: a list of Python floats per row."""
+    per_row = sys.getsizeof([0.0] * dim) + dim * sys.getsizeof(0.0)
+    return rows * per_row
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(catalog, queries, k, candidates):
+    exact_top = []
+    exact_times = []
+    for query in queries:
+        started = time.perf_counter()
+        scores = catalog @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        exact_times.append(time.perf_counter() - started)
+        exact_top.append(set(top.tolist()))
+
+    results = [{
+        "method": "float32 exact",
+        "recall": 1.0,
+        "p50_ms": percentile_ms(exact_times, 50),
+        "p95_ms": percentile_ms(exact_times, 95),
+        "resident_mb": catalog.nbytes / 1e6,
+    }]
+
+    with tempfile.TemporaryDirectory() as directory:
+        QuantizedEmbeddingStore.build(catalog, directory)
+        for mode in ("binary", "int8"):
+            store = QuantizedEmbeddingStore(directory, mode=mode, load_int8=(mode == "int8"))
+            for count in candidates:
+                hits = 0
+                times = []
+                for query, expected in zip(queries, exact_top):
+                    started = time.perf_counter()
+                    top, _ = store.search(query, k, candidates=count)
+                    times.append(time.perf_counter() - started)
+                    hits += len(expected & set(top.tolist()))
+                results.append({
+                    "method": f"{mode} + rescore@{count}",
+                    "recall": hits / (len(queries) * k),
+                    "p50_ms": percentile_ms(times, 50),
+                    "p95_ms": percentile_ms(times, 95),
+                    "resident_mb": store.memory_footprint()["resident_bytes"] / 1e6,
+                })
+            del store
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding store memory/recall benchmark.")
+    parser.add_argument("--npy", help="Catalog embedding matrix (rows, dim)")
+    parser.add_argument("--rows", type=int, default=3000, help="Synthetic catalog rows when --npy is not given")
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.npy:
+        base = normalize_rows(np.load(args.npy))
+    else:
+        base = synthetic_catalog(args.rows, args.dim, rng)
+
+    for scale in args.scale:
+        catalog = grow_catalog(base, scale, rng)
+        rows, dim = catalog.shape
+        picks = rng.choice(rows, size=args.queries, replace=False)
+        queries = normalize_rows(catalog[picks] + 0.5 * rng.standard_normal((args.queries, dim), dtype=np.float32) / np.sqrt(dim))
+
+        print(f"\n=== {rows} rows x {dim} dims (scale x{scale}) ===")
+        print(f"Python float lists: {python_list_bytes(rows, dim) / 1e6:10.1f} MB")
+        print(f"float32 matrix:     {rows * dim * 4 / 1e6:10.1f} MB")
+        print(f"int8 codes:         {rows * dim / 1e6:10.1f} MB")
+        print(f"binary codes:       {rows * dim / 8 / 1e6:10.1f} MB\n")
+        print(f"{'method':<24} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'resident MB':>12}")
+        for row in run(catalog, queries, args.k, args.candidates):
+            print(f"{row['method']:<24} {row['recall']:>10.3f} {row['p50_ms']:>8.3f} "
+                  f"{row['p95_ms']:>8.3f} {row['resident_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
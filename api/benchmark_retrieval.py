@@ -0,0 +1,254 @@
+import os
+import gc
+import json
+import math
+import time
+import hashlib
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+import numpy as np
+from _ingest import load_workflows_csv
+from _vector_index import VectorIndex
+from _quantized_store import QuantizedEmbeddingStore
+from _lexical_index import (
+    WORKFLOWS_CSV_PATH, HYBRID_CANDIDATES, LexicalIndex, tokenize, reciprocal_rank_fusion
+)
+
+# Offline retrieval quality and latency for every retrieval backend, scored
+# against a labeled query set (benchmark_queries.json: query -> expected
+# workflow names; every catalog row with an expected name counts as relevant).
+#
+#   python benchmark_retrieval.py --output results/baseline.json
+#   python benchmark_retrieval.py --catalog-npy catalog.npy --queries-npy queries.npy
+#
+# Without cached embeddings a deterministic hashing embedder stands in for
+# text-embedding-3-large, so runs need no network and are reproducible. Its
+# absolute quality says little about the real model; compare runs made with
+# the same embeddings. catalog.npy rows must follow the CSV row order and
+# queries.npy rows the query file order.
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_queries.json")
+
+
+class HashingEmbedder:
+    """Deterministic stand-in for the embeddings client.
+
+    Word tokens and character trigrams are hashed (blake2b, so the result does
+    not depend on PYTHONHASHSEED) into signed buckets of a fixed-size vector.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def _bucket(self, feature):
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def embed_query(self, text):
+        features = Counter()
+        for token in tokenize(text):
+            features[token] += 2
+            padded = f"#{token}#"
+            for i in range(len(padded) - 2):
+                features[padded[i:i + 3]] += 1
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in features.items():
+            index, sign = self._bucket(feature)
+            vector[index] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts):
+        return np.vstack([self.embed_query(text) for text in texts])
+
+
+def load_queries(path, rows):
+    """Labeled queries with the expected names resolved to catalog links."""
+    with open(path, encoding="utf-8") as f:
+        queries = json.load(f)
+    links_by_name = {}
+    for row in rows:
+        links_by_name.setdefault(row["name"], set()).add(row["link"])
+    for item in queries:
+        missing = [name for name in item["expected"] if name not in links_by_name]
+        if missing:
+            raise ValueError(f"Query {item['query']!r} expects workflows not in the catalog: {missing}")
+        item["relevant"] = set().union(*(links_by_name[name] for name in item["expected"]))
+    return queries
+
+
+# --- Metrics ---
+def recall_at(ranked, relevant, k):
+    return len(set(ranked[:k]) & relevant) / len(relevant)
+
+
+def reciprocal_rank(ranked, relevant):
+    for rank, link in enumerate(ranked, start=1):
+        if link in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at(ranked, relevant, k):
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, link in enumerate(ranked[:k], start=1) if link in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+# --- Backends ---
+def measure_build(build):
+    """Run build() and return (result, seconds, bytes it left allocated)."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained
+
+
+def build_backends(rows, catalog, store_dir, threshold, depth):
+    """Map backend name -> (search(query, query_vector) -> ranked links, build seconds, memory bytes)."""
+    backends = {}
+
+    vector, seconds, memory = measure_build(lambda: VectorIndex(rows, catalog))
+    backends["vector"] = (
+        lambda query, vec: [row["link"] for row in vector.search(vec, threshold, depth)], seconds, memory
+    )
+
+    for mode in ("binary", "int8"):
+        def build_quantized(mode=mode):
+            index = VectorIndex(rows, catalog)
+            QuantizedEmbeddingStore.build(index.matrix, f"{store_dir}/{mode}")
+            index.attach_store(QuantizedEmbeddingStore(f"{store_dir}/{mode}", mode=mode, load_int8=(mode == "int8")))
+            return index
+
+        index, seconds, memory = measure_build(build_quantized)
+        backends[f"vector-{mode}"] = (
+            lambda query, vec, index=index: [row["link"] for row in index.search(vec, threshold, depth)],
+            seconds, memory
+        )
+
+    lexical, seconds, memory = measure_build(lambda: LexicalIndex(rows))
+    backends["lexical"] = (lambda query, vec: [row["link"] for row in lexical.search(query, depth)], seconds, memory)
+
+    def hybrid(query, vec):
+        candidates = max(depth, HYBRID_CANDIDATES)
+        fused = reciprocal_rank_fusion(
+            [vector.search(vec, threshold, candidates), lexical.search(query, candidates)], depth
+        )
+        return [row["link"] for row in fused]
+
+    backends["hybrid"] = (hybrid, backends["vector"][1] + seconds, backends["vector"][2] + memory)
+    return backends
+
+
+def evaluate(search, queries, query_vectors, ks, repeat):
+    depth = max(ks)
+    totals = Counter()
+    per_query = []
+    times = []
+    for item, vec in zip(queries, query_vectors):
+        search(item["query"], vec)  # warm-up
+        for _ in range(repeat):
+            started = time.perf_counter()
+            ranked = search(item["query"], vec)
+            times.append(time.perf_counter() - started)
+
+        ranked = ranked[:depth]
+        relevant = item["relevant"]
+        rr = reciprocal_rank(ranked, relevant)
+        totals["mrr"] += rr
+        for k in ks:
+            totals[f"recall@{k}"] += recall_at(ranked, relevant, k)
+            totals[f"ndcg@{k}"] += ndcg_at(ranked, relevant, k)
+        per_query.append({"query": item["query"], "first_relevant_rank": round(1 / rr) if rr else None})
+
+    metrics = {name: total / len(queries) for name, total in sorted(totals.items())}
+    latency = {f"p{q}_ms": percentile_ms(times, q) for q in (50, 95, 99)}
+    return metrics, latency, per_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval quality and latency benchmark.")
+    parser.add_argument("--csv", default=WORKFLOWS_CSV_PATH, help="Templates CSV")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="Labeled queries JSON")
+    parser.add_argument("--catalog-npy", help="Cached catalog embeddings (rows in CSV order)")
+    parser.add_argument("--queries-npy", help="Cached query embeddings (rows in query file order)")
+    parser.add_argument("--dim", type=int, default=1024, help="Hashing embedder size when no cache is given")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--match-threshold", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed searches per query")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    rows = load_workflows_csv(args.csv)
+    queries = load_queries(args.queries, rows)
+    texts = [item["query"] for item in queries]
+
+    if args.catalog_npy and args.queries_npy:
+        catalog = np.load(args.catalog_npy)
+        query_vectors = np.load(args.queries_npy)
+        embeddings = {"source": "cached", "catalog_npy": args.catalog_npy, "queries_npy": args.queries_npy}
+    elif args.catalog_npy or args.queries_npy:
+        parser.error("--catalog-npy and --queries-npy must be given together")
+    else:
+        embedder = HashingEmbedder(args.dim)
+        # The catalog is embedded from descriptions only, like the ingest scripts do
+        catalog = embedder.embed_documents([row["description"] for row in rows])
+        query_vectors = embedder.embed_documents(texts)
+        embeddings = {"source": "hashing", "dim": args.dim}
+    if catalog.shape[0] != len(rows) or query_vectors.shape[0] != len(queries):
+        raise ValueError(f"Embeddings {catalog.shape} / {query_vectors.shape} do not match "
+                         f"{len(rows)} rows / {len(queries)} queries")
+
+    ks = sorted(set(args.k))
+    results = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "catalog_rows": len(rows),
+        "queries": len(queries),
+        "embeddings": embeddings,
+        "k": ks,
+        "match_threshold": args.match_threshold,
+        "repeat": args.repeat,
+        "backends": {},
+    }
+
+    print(f"Catalog: {len(rows)} rows x {catalog.shape[1]} dims, {len(queries)} queries, "
+          f"embeddings: {embeddings['source']}\n")
+    header = " ".join(f"{'R@' + str(k):>6}" for k in ks)
+    print(f"{'backend':<14} {header} {'MRR':>6} {'nDCG@' + str(ks[-1]):>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'MB':>7} {'build s':>8}")
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        backends = build_backends(rows, catalog, store_dir, args.match_threshold, ks[-1])
+        for name, (search, build_seconds, memory) in backends.items():
+            metrics, latency, per_query = evaluate(search, queries, query_vectors, ks, args.repeat)
+            results["backends"][name] = dict(
+                metrics, **latency, memory_bytes=int(memory), build_seconds=build_seconds, per_query=per_query
+            )
+            recalls = " ".join(f"{metrics[f'recall@{k}']:>6.3f}" for k in ks)
+            print(f"{name:<14} {recalls} {metrics['mrr']:>6.3f} {metrics[f'ndcg@{ks[-1]}']:>8.3f} "
+                  f"{latency['p50_ms']:>8.3f} {latency['p95_ms']:>8.3f} {latency['p99_ms']:>8.3f} "
+                  f"{memory / 1e6:>7.2f} {build_seconds:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import time
+import argparse
+import numpy as np
+
+# Offline recall@k of truncated, renormalized (Matryoshka) embedding prefixes
+# against the exact full-dimension ranking. Used to pick the embedding_short
+# size in embedding_reduction_setup.sql.
+#
+# Queries are sampled catalog vectors (each query's own row is excluded), or
+# real query embeddings from --queries-npy. For every prefix length it reports
+#   - recall@k of the reduced ranking alone (what a bare ANN search returns)
+#   - recall@k after over-fetching --candidates rows and rescoring them on full
+#     vectors (what the two-stage match_workflows returns)
+#
+#   python evaluate_embedding_dims.py --save-npy catalog.npy   # pull from Supabase once
+#   python evaluate_embedding_dims.py --npy catalog.npy --dims 256 512 1024 1536
+
+
+def load_catalog_matrix(args):
+    if args.npy:
+        return np.load(args.npy, mmap_mode="r")
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+    from _vector_index import VectorIndex
+
+    load_dotenv()
+    supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    print("Downloading catalog embeddings from Supabase...")
+    matrix = VectorIndex.from_supabase(supabase).matrix
+    if args.save_npy:
+        np.save(args.save_npy, matrix)
+        print(f"Saved {matrix.shape} matrix to {args.save_npy}")
+    return matrix
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k):
+    """Indices of the k best scores per row, best first."""
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def recall(predicted, expected):
+    hits = sum(len(set(p) & set(e)) for p, e in zip(predicted.tolist(), expected.tolist()))
+    return hits / expected.size
+
+
+def evaluate(catalog, queries, exclude_self, dims, k, candidates):
+    catalog = normalize_rows(np.asarray(catalog, dtype=np.float32))
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+
+    full_scores = queries @ catalog.T
+    if exclude_self is not None:
+        full_scores[np.arange(len(queries)), exclude_self] = -np.inf
+    expected = top_k(full_scores, k)
+
+    results = []
+    for dim in dims:
+        reduced_catalog = normalize_rows(catalog[:, :dim])
+        reduced_queries = normalize_rows(queries[:, :dim])
+
+        started = time.perf_counter()
+        reduced_scores = reduced_queries @ reduced_catalog.T
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        if exclude_self is not None:
+            reduced_scores[np.arange(len(queries)), exclude_self] = -np.inf
+
+        reduced_only = top_k(reduced_scores, k)
+
+        # Two-stage: over-fetch on the reduced vectors, rescore exactly on the full ones
+        pool = top_k(reduced_scores, min(candidates, catalog.shape[0] - 1))
+        rescored = np.take_along_axis(full_scores, pool, axis=1)
+        two_stage = np.take_along_axis(pool, np.argsort(-rescored, axis=1)[:, :k], axis=1)
+
+        results.append({
+            "dim": dim,
+            "recall_reduced": recall(reduced_only, expected),
+            "recall_two_stage": recall(two_stage, expected),
+            "bytes_per_vector": dim * 4,
+            "scan_ms_per_query": elapsed_ms,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of reduced-dimension embeddings vs the full ranking.")
+    parser.add_argument("--npy", help="Catalog embedding matrix saved with --save-npy")
+    parser.add_argument("--save-npy", help="Save the downloaded catalog matrix here")
+    parser.add_argument("--queries-npy", help="Real query embeddings (n, 3072); default samples catalog rows")
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 512, 768, 1024, 1536, 2000])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=100, help="Over-fetch size for the two-stage search")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = load_catalog_matrix(args)
+    if args.queries_npy:
+        queries = np.load(args.queries_npy)
+        exclude_self = None
+    else:
+        rng = np.random.default_rng(args.seed)
+        exclude_self = rng.choice(catalog.shape[0], size=min(args.samples, catalog.shape[0]), replace=False)
+        queries = catalog[exclude_self]
+
+    dims = [dim for dim in args.dims if dim <= catalog.shape[1]]
+    print(f"Catalog: {catalog.shape[0]} x {catalog.shape[1]}, {len(queries)} queries, "
+          f"k={args.k}, candidates={args.candidates}\n")
+    print(f"{'dim':>6} {'recall@k reduced':>18} {'recall@k two-stage':>20} {'bytes/vec':>10} {'ms/query':>9}")
+    for row in evaluate(catalog, queries, exclude_self, dims, args.k, args.candidates):
+        print(f"{row['dim']:>6} {row['recall_reduced']:>18.3f} {row['recall_two_stage']:>20.3f} "
+              f"{row['bytes_per_vector']:>10} {row['scan_ms_per_query']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@ from dotenv import load_dotenv
 from supabase import create_client, Client
 from langchain_openai import AzureOpenAIEmbeddings
 import asyncio
-import csv # Added import
+import time
+from _ingest import BatchEmbedder, load_workflows_csv, insert_workflows, write_index_snapshot
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path='C:\\Users\\HomePC\\n8n workflow chat\\api\\.env') # Ensure .env is loaded from api directory
@@ -27,21 +28,14 @@ embeddings_model = AzureOpenAIEmbeddings(
     azure_deployment="text-embedding-3-large",
     openai_api_version="2024-02-01",
     azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
-    api_key=AZURE_OPENAI_EMBEDDING_API_KEY
+    api_key=AZURE_OPENAI_EMBEDDING_API_KEY,
+    max_retries=0  # BatchEmbedder owns retries so it can see and adapt to 429s
 )
 
 # --- Load n8n Workflow Data from CSV ---
-n8n_workflow_data = []
 csv_file_path = "C:\\Users\\HomePC\\n8n workflow chat\\_n8n Templates 3000 - Templates.csv"
 try:
-    with open(csv_file_path, mode='r', encoding='utf-8') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            n8n_workflow_data.append({
-                "name": row["name"],
-                "description": row["description"],
-                "link": row["url"] # Map 'url' from CSV to 'link' in database
-            })
+    n8n_workflow_data = load_workflows_csv(csv_file_path)
     print(f"Successfully loaded {len(n8n_workflow_data)} workflows from CSV.")
 except FileNotFoundError:
     print(f"Error: CSV file not found at {csv_file_path}")
@@ -52,34 +46,31 @@ except Exception as e:
 
 async def ingest_data():
     print("Starting data ingestion...")
-    for i, workflow in enumerate(n8n_workflow_data):
-        try:
-            print(f"Processing workflow {i+1}/{len(n8n_workflow_data)}")
-            
-            # Generate embedding for the description
-            embedding = embeddings_model.embed_query(workflow["description"])
-            
-            # Prepare data for insertion
-            data_to_insert = {
+    started = time.perf_counter()
+    embedder = BatchEmbedder(embeddings_model)
+    inserted = 0
+
+    # Batches are embedded concurrently and inserted as soon as each one completes
+    async for batch, vectors in embedder.embed(n8n_workflow_data):
+        rows = [
+            {
                 "name": workflow["name"],
                 "description": workflow["description"],
                 "link": workflow["link"],
                 "embedding": embedding
             }
-            
-            # Insert into Supabase
-            response = supabase.table("n8n_workflows").insert(data_to_insert).execute()
-            
-            if response.data:
-                print(f"Successfully inserted '{workflow['name']}'.")
-            else:
-                print(f"Failed to insert '{workflow['name']}'. Response: {response.data}")
-                if response.error:
-                    print(f"Error details: {response.error}")
+            for workflow, embedding in zip(batch, vectors)
+        ]
+        inserted += await insert_workflows(supabase, rows)
+        print(f"Inserted {inserted}/{len(n8n_workflow_data)} workflows")
 
-        except Exception as e:
-            print(f"An error occurred while processing '{workflow['name']}': {e}")
-    print("Data ingestion complete.")
+    print(f"Data ingestion complete in {time.perf_counter() - started:.1f}s: "
+          f"{inserted} inserted, {len(embedder.failed)} failed, "
+          f"{embedder.requests} embedding requests, {embedder.rate_limited} rate limited.")
+    for workflow, error in embedder.failed:
+        print(f"  Failed to embed '{workflow['name']}': {error}")
 
 if __name__ == "__main__":
     asyncio.run(ingest_data())
+    # Memory-mapped by the API workers instead of paging embeddings from Supabase
+    write_index_snapshot(supabase)
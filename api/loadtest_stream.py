@@ -0,0 +1,462 @@
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import subprocess
+import numpy as np
+import httpx
+from _ingest import load_workflows_csv
+from _lexical_index import WORKFLOWS_CSV_PATH
+
+# End-to-end load test for /query/stream on one uvicorn worker of main.py.
+#
+# Starts a stand-in server that answers like Supabase (PostgREST table reads
+# and RPCs) and Azure OpenAI (embeddings and streaming chat completions) with
+# configurable latency and token rate, starts main:app pointed at it, then
+# drives N concurrent SSE clients per concurrency level and reports time to
+# source_documents, time to first content, tokens/s, total stream time and
+# error rate.
+#
+#   python loadtest_stream.py --concurrency 1 10 25 50 100 --output load.json
+#   python loadtest_stream.py --tokens-per-second 80 --chat-first-token-ms 300
+#   python loadtest_stream.py --target http://127.0.0.1:8000   # app already running
+#   python loadtest_stream.py --client langchain               # langchain_openai clients
+#
+# The app's real Supabase and Azure OpenAI clients are exercised; only the
+# remote services are replaced. --client sets AZURE_OPENAI_CLIENT for the
+# launched app: "direct" (the default, as in production) or "langchain".
+# LangChain tokenizes embedding inputs with tiktoken, so with --client
+# langchain its cl100k_base encoding must already be cached locally.
+
+SAMPLE_QUERIES = [
+    "How do I integrate Slack with Google Sheets?",
+    "Show me workflows for social media automation",
+    "I need to process emails automatically",
+    "Create a workflow for data synchronization",
+    "Automate customer support tickets",
+    "Telegram bot that answers questions from my documents",
+    "Sync Shopify orders to a spreadsheet",
+    "Summarize YouTube videos with AI",
+]
+
+ANSWER_WORDS = (
+    "Here are workflows that fit your needs **Workflow Name** Why: it connects the apps you "
+    "mentioned triggers on new records and keeps both systems in sync without manual steps"
+).split()
+
+
+# --- Stand-in Services ---
+def _seed(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class StubServices:
+    """Supabase and Azure OpenAI stand-ins sharing one synthetic catalog."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rows = load_workflows_csv(args.csv)
+        for i, row in enumerate(self.rows, start=1):
+            row["id"] = i
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((len(self.rows), args.embedding_dim), dtype=np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.stars = 0
+
+    async def delay(self, milliseconds):
+        jitter = self.args.jitter
+        await asyncio.sleep(max(0.0, milliseconds * random.uniform(1 - jitter, 1 + jitter)) / 1000)
+
+    def embed(self, text):
+        """A query lands near one catalog row, so vector search finds real matches."""
+        seed = _seed(text)
+        rng = np.random.default_rng(seed)
+        vector = self.matrix[seed % len(self.rows)] + 0.6 * rng.standard_normal(
+            self.args.embedding_dim, dtype=np.float32
+        ) / np.sqrt(self.args.embedding_dim)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def match_workflows(self, params):
+        embedding = params["query_embedding"]
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        top = np.argsort(-scores)[:int(params.get("match_count", 5))]
+        return [
+            dict({key: self.rows[i][key] for key in ("id", "name", "description", "link")}, similarity=float(scores[i]))
+            for i in top if scores[i] > float(params.get("match_threshold", 0.1))
+        ]
+
+    def table_page(self, request):
+        offset = int(request.query_params.get("offset", 0))
+        limit = int(request.query_params.get("limit", len(self.rows)))
+        if "range" in request.headers:
+            first, last = request.headers["range"].split("-")
+            offset, limit = int(first), int(last) - int(first) + 1
+        page = []
+        for i in range(offset, min(offset + limit, len(self.rows))):
+            row = {key: self.rows[i][key] for key in ("id", "name", "description", "link")}
+            row["embedding"] = "[" + ",".join(f"{x:.6f}" for x in self.matrix[i]) + "]"
+            page.append(row)
+        return page
+
+    def answer_tokens(self):
+        return [" " + ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(self.args.answer_tokens)]
+
+
+def build_stub_app(args):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    services = StubServices(args)
+    app = FastAPI(title="Load test stand-ins")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/rest/v1/n8n_workflows")
+    async def table(request: Request):
+        await services.delay(args.supabase_latency_ms)
+        return JSONResponse(services.table_page(request))
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        await services.delay(args.supabase_latency_ms)
+        params = await request.json() if await request.body() else {}
+        if function == "match_workflows":
+            return JSONResponse(services.match_workflows(params))
+        if function == "get_star_count":
+            return JSONResponse(services.stars)
+        if function == "add_star":
+            services.stars += 1
+            return JSONResponse({"success": True, "message": "Star added successfully", "count": services.stars})
+        if function == "has_user_starred":
+            return JSONResponse(False)
+        return JSONResponse({"message": f"Unknown function {function}"}, status_code=404)
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        body = await request.json()
+        await services.delay(args.embed_latency_ms)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # LangChain may send token-id arrays instead of strings
+        if inputs and isinstance(inputs[0], int):
+            inputs = [inputs]
+        data = []
+        for i, item in enumerate(inputs):
+            vector = services.embed(item if isinstance(item, str) else json.dumps(item))
+            if body.get("encoding_format") == "base64":
+                encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                encoded = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": encoded})
+        return {"object": "list", "data": data, "model": deployment,
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}}
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat(deployment: str, request: Request):
+        body = await request.json()
+        tokens = services.answer_tokens()
+        created = int(time.time())
+        if not body.get("stream"):
+            await services.delay(args.chat_first_token_ms + 1000 * len(tokens) / args.tokens_per_second)
+            return {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created, "model": deployment,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }
+
+        def chunk(delta, finish_reason=None):
+            payload = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                       "model": deployment,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await services.delay(args.chat_first_token_ms)
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                yield chunk({"content": token})
+                await services.delay(1000 / args.tokens_per_second)
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def serve_stubs(args):
+    import uvicorn
+    uvicorn.run(build_stub_app(args), host="127.0.0.1", port=args.stub_port, log_level="warning")
+
+
+# --- Process Management ---
+def wait_for(url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def start_processes(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub_args = [
+        sys.executable, os.path.abspath(__file__), "--serve-stubs",
+        "--stub-port", str(args.stub_port), "--csv", args.csv,
+        "--embedding-dim", str(args.embedding_dim), "--jitter", str(args.jitter),
+        "--supabase-latency-ms", str(args.supabase_latency_ms), "--embed-latency-ms", str(args.embed_latency_ms),
+        "--chat-first-token-ms", str(args.chat_first_token_ms),
+        "--tokens-per-second", str(args.tokens_per_second), "--answer-tokens", str(args.answer_tokens),
+    ]
+    stubs = subprocess.Popen(stub_args, cwd=here)
+    wait_for(f"{stub_url}/health", 60, stubs)
+
+    env = dict(
+        os.environ,
+        SUPABASE_URL=stub_url,
+        # supabase-py only checks that the key is JWT-shaped
+        SUPABASE_KEY="stub.stub.stub",
+        AZURE_OPENAI_EMBEDDING_ENDPOINT=stub_url,
+        AZURE_OPENAI_EMBEDDING_API_KEY="stub",
+        AZURE_OPENAI_CHAT_ENDPOINT=stub_url,
+        AZURE_OPENAI_CHAT_API_KEY="stub",
+        WORKFLOWS_CSV_PATH=args.csv,
+        AZURE_OPENAI_CLIENT=args.client,
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.app_port),
+         "--log-level", "warning"],
+        cwd=here, env=env,
+        stdout=None if args.app_log else subprocess.DEVNULL,
+    )
+    target = f"http://127.0.0.1:{args.app_port}"
+    try:
+        wait_for(f"{target}/ready", 180, app)
+    except Exception:
+        for process in (app, stubs):
+            process.terminate()
+        raise
+    return target, [app, stubs]
+
+
+# --- Load Driver ---
+async def run_stream(client, url, query):
+    """One /query/stream request; timings are seconds from the request being sent."""
+    result = {"sources": None, "first_content": None, "total": None, "tokens": 0, "error": None}
+    started = time.perf_counter()
+    text = []
+    done = False
+    try:
+        async with client.stream("POST", url, json={"query": query}) as response:
+            if response.status_code != 200:
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                elapsed = time.perf_counter() - started
+                if event["type"] == "source_documents" and result["sources"] is None:
+                    result["sources"] = elapsed
+                elif event["type"] == "content":
+                    if result["first_content"] is None:
+                        result["first_content"] = elapsed
+                    text.append(event["data"])
+                elif event["type"] == "error":
+                    result["error"] = f"error event: {event.get('data')}"
+                elif event["type"] == "done":
+                    done = True
+        result["total"] = time.perf_counter() - started
+        if not done and result["error"] is None:
+            result["error"] = "stream ended without done"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {str(e)}"
+    # Count tokens from the text, so coalesced content events still measure right
+    result["tokens"] = len("".join(text).split())
+    return result
+
+
+async def run_level(target, concurrency, streams_per_client, unique_queries, timeout):
+    url = f"{target}/query/stream"
+    counter = iter(range(10 ** 9))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def client_loop():
+            results = []
+            for _ in range(streams_per_client):
+                n = next(counter)
+                query = SAMPLE_QUERIES[n % len(SAMPLE_QUERIES)]
+                if unique_queries:
+                    # Defeat the embedding and answer caches so every stream runs the full pipeline
+                    query = f"{query} (load test {concurrency}-{n})"
+                results.append(await run_stream(client, url, query))
+            return results
+
+        started = time.perf_counter()
+        per_client = await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+    return [result for results in per_client for result in results], wall
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": float(np.percentile(values, q)) * 1000 for q in (50, 95, 99)}
+
+
+def summarize(concurrency, results, wall):
+    ok = [r for r in results if r["error"] is None]
+    rates = [
+        r["tokens"] / (r["total"] - r["first_content"])
+        for r in ok if r["first_content"] is not None and r["total"] > r["first_content"]
+    ]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "concurrency": concurrency,
+        "streams": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results),
+        "error_kinds": errors,
+        "wall_seconds": wall,
+        "streams_per_second": len(ok) / wall,
+        "aggregate_tokens_per_second": sum(r["tokens"] for r in ok) / wall,
+        "time_to_sources_ms": percentiles([r["sources"] for r in ok if r["sources"] is not None]),
+        "time_to_first_content_ms": percentiles([r["first_content"] for r in ok if r["first_content"] is not None]),
+        "total_ms": percentiles([r["total"] for r in ok]),
+        "stream_tokens_per_second_p50": float(np.median(rates)) if rates else None,
+    }
+
+
+def find_saturation(levels):
+    """First level where throughput stops scaling (<10% gain) or p95 first content doubles."""
+    baseline = levels[0]["time_to_first_content_ms"]["p95"]
+    for previous, level in zip(levels, levels[1:]):
+        p95 = level["time_to_first_content_ms"]["p95"]
+        if level["error_rate"] > 0.01:
+            return level["concurrency"], "error rate above 1%"
+        if level["streams_per_second"] < previous["streams_per_second"] * 1.1:
+            return level["concurrency"], "throughput stopped scaling"
+        if baseline and p95 and p95 > 2 * baseline:
+            return level["concurrency"], "p95 time to first content doubled"
+    return None, None
+
+
+def _fmt(value):
+    return f"{value:>8.0f}" if value is not None else f"{'-':>8}"
+
+
+async def drive(args, target):
+    levels = []
+    print(f"{'conc':>5} {'streams':>7} {'err%':>6} {'str/s':>7} {'tok/s':>8} "
+          f"{'src p50':>8} {'src p95':>8} {'1st p50':>8} {'1st p95':>8} {'1st p99':>8} "
+          f"{'tot p95':>8} {'tok/s/str':>9}")
+    for concurrency in args.concurrency:
+        results, wall = await run_level(
+            target, concurrency, args.streams_per_client, not args.repeat_queries, args.timeout
+        )
+        level = summarize(concurrency, results, wall)
+        levels.append(level)
+        sources, first, total = (level["time_to_sources_ms"], level["time_to_first_content_ms"], level["total_ms"])
+        rate = level["stream_tokens_per_second_p50"]
+        print(f"{concurrency:>5} {level['streams']:>7} {100 * level['error_rate']:>6.1f} "
+              f"{level['streams_per_second']:>7.2f} {level['aggregate_tokens_per_second']:>8.0f} "
+              f"{_fmt(sources['p50'])} {_fmt(sources['p95'])} {_fmt(first['p50'])} {_fmt(first['p95'])} "
+              f"{_fmt(first['p99'])} {_fmt(total['p95'])} {rate if rate is not None else 0:>9.1f}")
+        for kind, count in level["error_kinds"].items():
+            print(f"      {count} x {kind}")
+        await asyncio.sleep(args.pause)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent SSE load test for /query/stream with stubbed upstreams.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument("--streams-per-client", type=int, default=3)
+    parser.add_argument("--repeat-queries", action="store_true", help="Reuse query texts so caches can hit")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--pause", type=float, default=1.0, help="Seconds between concurrency levels")
+    parser.add_argument("--target", help="Load an already running app instead of starting one")
+    parser.add_argument("--app-port", type=int, default=8011)
+    parser.add_argument("--app-log", action="store_true", help="Show the app's stdout")
+    parser.add_argument("--client", choices=["direct", "langchain"], default="direct",
+                        help="AZURE_OPENAI_CLIENT for the launched app (ignored with --target)")
+    parser.add_argument("--output", help="Write results JSON here")
+
+    stubs = parser.add_argument_group("stand-in services")
+    stubs.add_argument("--serve-stubs", action="store_true", help=argparse.SUPPRESS)
+    stubs.add_argument("--stub-port", type=int, default=8010)
+    stubs.add_argument("--csv", default=WORKFLOWS_CSV_PATH)
+    stubs.add_argument("--embedding-dim", type=int, default=3072)
+    stubs.add_argument("--supabase-latency-ms", type=float, default=40)
+    stubs.add_argument("--embed-latency-ms", type=float, default=80)
+    stubs.add_argument("--chat-first-token-ms", type=float, default=600)
+    stubs.add_argument("--tokens-per-second", type=float, default=40)
+    stubs.add_argument("--answer-tokens", type=int, default=200)
+    stubs.add_argument("--jitter", type=float, default=0.2, help="Uniform +/- fraction applied to every delay")
+    args = parser.parse_args()
+
+    if args.serve_stubs:
+        serve_stubs(args)
+        return
+
+    processes = []
+    target = args.target
+    if target is None:
+        print("Starting stand-in services and main:app...")
+        target, processes = start_processes(args)
+    try:
+        levels = asyncio.run(drive(args, target))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    saturation, reason = find_saturation(levels)
+    if saturation is not None:
+        print(f"\nSaturation at concurrency {saturation}: {reason}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "target": target if args.target else "main:app (1 uvicorn worker)",
+                "client": None if args.target else args.client,
+                "stubs": None if args.target else {
+                    "supabase_latency_ms": args.supabase_latency_ms,
+                    "embed_latency_ms": args.embed_latency_ms,
+                    "chat_first_token_ms": args.chat_first_token_ms,
+                    "tokens_per_second": args.tokens_per_second,
+                    "answer_tokens": args.answer_tokens,
+                    "embedding_dim": args.embedding_dim,
+                    "jitter": args.jitter,
+                },
+                "streams_per_client": args.streams_per_client,
+                "unique_queries": not args.repeat_queries,
+                "saturation": {"concurrency": saturation, "reason": reason},
+                "levels": levels,
+            }, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
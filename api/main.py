@@ -1,112 +1,129 @@
-import os
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from typing import List
+from pydantic import BaseModel, Field
+import os
 import uvicorn
-import json
 import asyncio
-from supabase import create_client, Client
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_openai import AzureChatOpenAI
+from contextlib import asynccontextmanager
+from supabase import Client
 from dotenv import load_dotenv
 
+# Load .env before the shared modules read their configuration
 load_dotenv()
 
-# --- Supabase and Azure OpenAI Configuration ---
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-AZURE_OPENAI_CHAT_API_KEY = os.environ.get("AZURE_OPENAI_CHAT_API_KEY")
-AZURE_OPENAI_CHAT_ENDPOINT = os.environ.get("AZURE_OPENAI_CHAT_ENDPOINT")
-AZURE_OPENAI_EMBEDDING_API_KEY = os.environ.get("AZURE_OPENAI_EMBEDDING_API_KEY")
-AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT")
-
-# --- Supabase Client ---
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# --- Langchain and Recommendation Logic ---
-async def get_workflow_recommendations_stream(query: str):
-    """Stream workflow recommendations using direct Supabase calls and Azure OpenAI."""
-    # Initialize embeddings
-    embeddings = AzureOpenAIEmbeddings(
-        azure_deployment="text-embedding-3-large",
-        openai_api_version="2024-02-01",
-        azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
-        api_key=AZURE_OPENAI_EMBEDDING_API_KEY
-    )
-    
-    # Generate embedding for the query
-    query_embedding = embeddings.embed_query(query)
-    
-    # Search for similar workflows using direct RPC call
-    search_results = supabase.rpc('match_workflows', {
-        'query_embedding': query_embedding,
-        'match_threshold': 0.1,
-        'match_count': 5
-    }).execute()
-    
-    # Send source documents first
-    source_documents = [
-        {
-            "name": result['name'],
-            "description": result['description'],
-            "link": result['link']
-        }
-        for result in search_results.data
-    ]
-    
-    yield f"data: {json.dumps({'type': 'source_documents', 'data': source_documents})}\n\n"
-    
-    # Format the context for the LLM
-    context_docs = []
-    for result in search_results.data:
-        context_docs.append(f"Workflow: {result['name']}\nDescription: {result['description']}")
-    
-    context = "\n\n".join(context_docs)
-    
-    # Initialize LLM for streaming
-    llm = AzureChatOpenAI(
-        deployment_name="gpt-4-32k",
-        openai_api_version="2024-02-01",
-        azure_endpoint=AZURE_OPENAI_CHAT_ENDPOINT,
-        api_key=AZURE_OPENAI_CHAT_API_KEY,
-        temperature=0.7,
-        streaming=True
-    )
-    
-    # Create prompt for the LLM (without links since they're in source_documents)
-    prompt = f"""Based on the user's query: "{query}"
+from _clients import get_supabase, get_embeddings, get_llm, warm_up, readiness, is_ready
+from _embedding_cache import query_embedding_cache
+from _answer_cache import answer_cache
+from _vector_index import load_workflow_index, current_catalog_version
+from _lexical_index import get_lexical_index
+from _async_pipeline import (
+    StageTimeout, run_blocking, invoke_llm_async, embed_queries_or_none, retrieve_workflows_batch_async
+)
+from _recommendations import (
+    build_prompt, source_documents_for, prefetch_retrieval, recommendation_stream, answer_query
+)
+from _sse import dumps
+from _star_counter import star_counter
+from _single_flight import query_flights
+from _prefetch import query_prefetcher
+from _search import SearchParams, SEARCH_CACHE_CONTROL, search_workflows, not_modified
+from _typeahead import TYPEAHEAD_CACHE_CONTROL, get_typeahead_index, typeahead_response
+from _resilience import HealthProber, breakers, sources_only_answer
+from _metrics import registry, new_trace_id
 
-Here are the most relevant n8n workflows I found:
+# --- Batch Configuration ---
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+# Results per query; larger requests are rejected with 422
+BATCH_MAX_MATCH_COUNT = int(os.environ.get("BATCH_MAX_MATCH_COUNT", "50"))
 
-{context}
+# --- Shared Clients ---
+supabase: Client = get_supabase()
+health_prober = HealthProber(get_supabase)
 
-Please provide a helpful response that:
-1. Directly answers the user's question
-2. For each recommended workflow, include:
-   - The workflow name in bold (use **name**)
-   - A "Why:" explanation of why this workflow is suitable for their needs
-3. Use numbered list format like:
-   1. **Workflow Name**
-      - **Why:** Explanation of why this workflow fits their needs
-4. Keep explanations concise but informative
-5. Do NOT include any links or URLs in your response
+# --- Batch Recommendation Logic ---
+async def batch_recommendation_lines(queries, generate=False, concurrency=4, match_count=5):
+    """NDJSON lines for /query/batch, one per query, written as each one completes.
 
-Response:"""
+    Every uncached query is embedded in one embed_documents call and the whole
+    batch is scored against the catalog in one matrix product. With generate,
+    answers run concurrently, at most `concurrency` LLM calls at a time.
+    """
+    try:
+        query_embeddings = await embed_queries_or_none(get_embeddings(), queries)
+        batch_results = await retrieve_workflows_batch_async(
+            supabase, queries, query_embeddings, match_threshold=0.1, match_count=match_count
+        )
+    except Exception as e:
+        print(f"Error in batch retrieval: {str(e)}")
+        yield dumps({"error": str(e)}) + "\n"
+        return
     
-    # Stream LLM response
-    async for chunk in llm.astream(prompt):
-        if chunk.content:
-            yield f"data: {json.dumps({'type': 'content', 'data': chunk.content})}\n\n"
-            await asyncio.sleep(0.01)  # Small delay for smooth streaming
+    if not generate:
+        for i, search_results in enumerate(batch_results):
+            yield dumps({"index": i, "query": queries[i], "source_documents": source_documents_for(search_results)}) + "\n"
+        return
     
-    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+    catalog_version = current_catalog_version()
+    llm = get_llm()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def answer(i):
+        query_embedding = query_embeddings[i] if query_embeddings is not None else None
+        cached = answer_cache.lookup(query_embedding, catalog_version)
+        if cached is not None:
+            return {"index": i, "query": queries[i], "result": cached.answer, "source_documents": cached.source_documents}
+        
+        source_documents = source_documents_for(batch_results[i])
+        async with semaphore:
+            try:
+                llm_response = await invoke_llm_async(llm, build_prompt(queries[i], batch_results[i]))
+            except Exception as e:
+                print(f"LLM unavailable for batch item {i}, returning sources only: {str(e)}")
+                return {"index": i, "query": queries[i], "result": sources_only_answer(source_documents),
+                        "source_documents": source_documents}
+        answer_cache.store(query_embedding, queries[i], source_documents, llm_response.content, catalog_version)
+        return {"index": i, "query": queries[i], "result": llm_response.content, "source_documents": source_documents}
+    
+    tasks = [asyncio.ensure_future(answer(i)) for i in range(len(queries))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield dumps(await next_done) + "\n"
+    finally:
+        # A client that disconnects stops the generations still queued
+        for task in tasks:
+            task.cancel()
 
 # --- FastAPI Application ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open pooled connections to Supabase and Azure before taking traffic
+    await asyncio.to_thread(warm_up)
+    # Load every workflow embedding once so queries never wait on the RPC
+    await asyncio.to_thread(load_workflow_index, supabase)
+    # BM25 index over the templates CSV (also the fallback when embeddings are down)
+    await asyncio.to_thread(get_lexical_index)
+    # Workflow-name autocomplete over the same CSV
+    await asyncio.to_thread(get_typeahead_index)
+    # Bloom filter of starred visitors, so most /stars/check calls skip the RPC
+    await asyncio.to_thread(star_counter.load_membership)
+    # Periodic bulk writes of queued stars
+    star_counter.start()
+    # /health reads the prober's last result instead of calling Supabase
+    await asyncio.to_thread(health_prober.start)
+    yield
+    health_prober.stop()
+    # Write any stars still queued before the worker exits
+    await asyncio.to_thread(star_counter.stop)
+    await asyncio.to_thread(query_embedding_cache.flush)
+
 app = FastAPI(
     title="n8n Workflow Assistant API",
     description="API for recommending n8n workflows.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS Middleware
@@ -121,6 +138,21 @@ app.add_middleware(
 # --- Pydantic Models ---
 class QueryRequest(BaseModel):
     query: str
+    # "append" streams content as raw `event: append` frames instead of JSON
+    stream_format: str = None
+    # Same id the client sent with /query/prefetch, so a near-identical draft is found
+    client_id: str = None
+
+class PrefetchRequest(BaseModel):
+    query: str
+    client_id: str = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    # Retrieval only unless set; answers then run at most `concurrency` at a time
+    generate: bool = False
+    concurrency: int = 4
+    match_count: int = Field(default=5, ge=1, le=BATCH_MAX_MATCH_COUNT)
 
 class StarRequest(BaseModel):
     session_id: str
@@ -128,18 +160,21 @@ class StarRequest(BaseModel):
 
 # --- API Endpoints ---
 @app.post("/query/stream")
-async def query_workflows_stream(request: QueryRequest):
+async def query_workflows_stream(request: QueryRequest, http_request: Request):
     """Stream workflow recommendations."""
     try:
-        print(f"Received streaming query: {request.query}")
+        trace_id = new_trace_id(http_request.headers.get("traceparent"))
+        print(f"[{trace_id}] Received streaming query: {request.query}")
         return StreamingResponse(
-            get_workflow_recommendations_stream(request.query),
+            recommendation_stream(request.query, request.stream_format, trace_id, request.client_id),
             media_type="text/plain",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Headers": "*",
+                "Access-Control-Expose-Headers": "X-Trace-Id",
+                "X-Trace-Id": trace_id,
             }
         )
     except Exception as e:
@@ -148,94 +183,94 @@ async def query_workflows_stream(request: QueryRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/query")
-async def query_workflows_fallback(request: QueryRequest):
-    """Fallback non-streaming endpoint."""
+@app.get("/search")
+async def search(request: Request, q: str = "", page: int = 1, page_size: int = 10):
+    """Ranked workflows only (no LLM), with scores, pagination and ETag/Cache-Control."""
     try:
-        print(f"Received fallback query: {request.query}")
-        
-        # Initialize embeddings
-        embeddings = AzureOpenAIEmbeddings(
-            azure_deployment="text-embedding-3-large",
-            openai_api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
-            api_key=AZURE_OPENAI_EMBEDDING_API_KEY
-        )
-        
-        # Generate embedding for the query
-        query_embedding = embeddings.embed_query(request.query)
-        
-        # Search for similar workflows using direct RPC call
-        search_results = supabase.rpc('match_workflows', {
-            'query_embedding': query_embedding,
-            'match_threshold': 0.1,
-            'match_count': 5
-        }).execute()
-        
-        # Format the context for the LLM
-        context_docs = []
-        for result in search_results.data:
-            context_docs.append(f"Workflow: {result['name']}\nDescription: {result['description']}")
-        
-        context = "\n\n".join(context_docs)
-        
-        # Initialize LLM
-        llm = AzureChatOpenAI(
-            deployment_name="gpt-4-32k",
-            openai_api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_CHAT_ENDPOINT,
-            api_key=AZURE_OPENAI_CHAT_API_KEY,
-            temperature=0.7,
-        )
-        
-        # Create prompt for the LLM (without links)
-        prompt = f"""Based on the user's query: "{request.query}"
+        params = SearchParams(q, page, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Revalidations are answered from the catalog version alone
+    etag = not_modified(params, request.headers.get("if-none-match"))
+    if etag is not None:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": SEARCH_CACHE_CONTROL})
+    
+    try:
+        body, etag, cache_control = await search_workflows(supabase, get_embeddings(), params)
+    except StageTimeout as e:
+        print(f"Stage timeout in search: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        print(f"Error in search: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    headers = {"Cache-Control": cache_control}
+    if etag is not None:
+        headers["ETag"] = etag
+    return JSONResponse(body, headers=headers)
 
-Here are the most relevant n8n workflows I found:
+@app.get("/typeahead")
+async def typeahead(q: str = "", limit: int = 8):
+    """Workflow names matching what has been typed so far, best rated first."""
+    try:
+        body = typeahead_response(q, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(body, headers={"Cache-Control": TYPEAHEAD_CACHE_CONTROL})
 
-{context}
+@app.post("/query/prefetch", status_code=202)
+async def prefetch_query(request: PrefetchRequest):
+    """Start embedding and retrieval for a draft the user has not submitted yet.
 
-Please provide a helpful response that:
-1. Directly answers the user's question
-2. For each recommended workflow, include:
-   - The workflow name in bold (use **name**)
-   - A "Why:" explanation of why this workflow is suitable for their needs
-3. Use numbered list format like:
-   1. **Workflow Name**
-      - **Why:** Explanation of why this workflow fits their needs
-4. Keep explanations concise but informative
-5. Do NOT include any links or URLs in your response
+    Returns at once; a later draft from the same client_id cancels this one
+    if it is still running.
+    """
+    status = query_prefetcher.start(request.query, prefetch_retrieval, request.client_id, current_catalog_version())
+    return {"status": status}
 
-Response:"""
-        
-        # Get LLM response
-        llm_response = llm.invoke(prompt)
-        
-        # Format response to match expected structure
-        return {
-            "result": llm_response.content,
-            "source_documents": [
-                {
-                    "name": result['name'],
-                    "description": result['description'],
-                    "link": result['link']
-                }
-                for result in search_results.data
-            ]
-        }
+@app.post("/query")
+async def query_workflows_fallback(request: QueryRequest):
+    """Fallback non-streaming endpoint."""
+    try:
+        print(f"Received fallback query: {request.query}")
+        return await answer_query(request.query)
+    except StageTimeout as e:
+        print(f"Stage timeout in query_workflows_fallback: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Error in query_workflows_fallback: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/batch")
+async def query_workflows_batch(request: BatchQueryRequest):
+    """Recommendations for many queries at once, as NDJSON in completion order."""
+    if not request.queries or any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="queries must be a non-empty list of non-empty strings")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    
+    print(f"Received batch of {len(request.queries)} queries (generate={request.generate})")
+    concurrency = max(1, min(request.concurrency, BATCH_MAX_CONCURRENCY))
+    return StreamingResponse(
+        batch_recommendation_lines(request.queries, request.generate, concurrency, request.match_count),
+        media_type="application/x-ndjson"
+    )
+
 # --- Star Counter Endpoints ---
 @app.get("/stars/count")
 async def get_star_count():
     """Get current star count."""
     try:
-        result = supabase.rpc('get_star_count').execute()
-        return {"count": result.data}
+        # Cached in memory; only a cold or expired count waits on Supabase
+        count = star_counter.peek()
+        if count is None:
+            count = await run_blocking(star_counter.count)
+        return {"count": count}
     except Exception as e:
         print(f"Error getting star count: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -252,14 +287,8 @@ async def add_star(request: Request, star_request: StarRequest):
             if forwarded_for:
                 client_ip = forwarded_for.split(',')[0].strip()
         
-        # Add star using database function
-        result = supabase.rpc('add_star', {
-            'user_ip': client_ip,
-            'user_session': star_request.session_id,
-            'user_agent_string': star_request.user_agent
-        }).execute()
-        
-        return result.data
+        # Queued for the next bulk flush; the cached count includes it right away
+        return await run_blocking(star_counter.add, client_ip, star_request.session_id, star_request.user_agent)
         
     except Exception as e:
         print(f"Error adding star: {str(e)}")
@@ -276,32 +305,82 @@ async def check_user_starred(request: Request, session_id: str):
             if forwarded_for:
                 client_ip = forwarded_for.split(',')[0].strip()
         
-        # Check if user has starred
-        result = supabase.rpc('has_user_starred', {
-            'user_ip': client_ip,
-            'user_session': session_id
-        }).execute()
+        # Check if user has starred (stars still queued count)
+        has_starred = await run_blocking(star_counter.has_starred, client_ip, session_id)
         
-        return {"has_starred": result.data}
+        return {"has_starred": has_starred}
         
     except Exception as e:
         print(f"Error checking star status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Cache Endpoints ---
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches."""
+    return {
+        "embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "star_counter": star_counter.stats(),
+        "single_flight": query_flights.stats(),
+        "prefetch": query_prefetcher.stats()
+    }
+
+# --- Metrics ---
+# State the caches, coalescer, breakers and star counter already keep is read at scrape time
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+def _cache_counts(field):
+    return {
+        ("embedding",): query_embedding_cache.stats()[field],
+        ("answer",): answer_cache.stats()[field],
+        ("star_count",): star_counter.stats()[field],
+        ("prefetch",): query_prefetcher.stats()[field],
+    }
+
+registry.callback("assistant_cache_hits_total", "Cache hits by cache.", "counter",
+                  lambda: _cache_counts("hits"), ("cache",))
+registry.callback("assistant_cache_misses_total", "Cache misses by cache.", "counter",
+                  lambda: _cache_counts("misses"), ("cache",))
+registry.callback("assistant_single_flight_total", "Streaming queries that started or joined a pipeline run.",
+                  "counter", lambda: {("started",): query_flights.started, ("joined",): query_flights.joined},
+                  ("result",))
+registry.callback("assistant_circuit_state", "Circuit breaker state (0 closed, 1 half open, 2 open).", "gauge",
+                  lambda: {(name,): _BREAKER_STATES[breaker.state] for name, breaker in breakers.items()},
+                  ("dependency",))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- Liveness and Readiness ---
+@app.get("/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests. Does no I/O."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: shared clients are warmed up and dependencies answered."""
+    body = {
+        "status": "ready" if is_ready() else "not_ready",
+        "supabase": readiness["supabase"],
+        "embeddings": readiness["embeddings"],
+        "workflow_index_version": current_catalog_version(),
+        "warmed_up_at": readiness["warmed_up_at"],
+    }
+    if not is_ready():
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    try:
-        # Test database connection
-        result = supabase.rpc('get_star_count').execute()
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "timestamp": "2024-01-01T00:00:00Z"
-        }
-    except Exception as e:
-        print(f"Health check failed: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
+    """Health from the background prober and the circuit breakers; does no I/O."""
+    report = health_prober.report()
+    if report["status"] == "unhealthy":
+        raise HTTPException(status_code=503, detail=report)
+    return report
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
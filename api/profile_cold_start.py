@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+# Cold-start profile of each serverless handler: a fresh interpreter per run
+# imports the handler module and then builds the clients its first request
+# needs, under `python -X importtime`. Reports median wall time per phase,
+# the heaviest top-level imports and whether LangChain was loaded.
+#
+#   python profile_cold_start.py                          # working tree
+#   python profile_cold_start.py --ref HEAD~1 --ref WORKTREE --output cold_start.json
+#
+# --ref profiles the api/ directory of any git revision (extracted with git
+# archive), so before/after numbers come from the same machine and run.
+# No network is used: client construction does not connect, and the
+# endpoints point at a closed local port.
+
+HANDLERS = {
+    "star_count": ("star_count", "get_supabase()"),
+    "star_add": ("star_add", "get_supabase()"),
+    "star_check": ("star_check", "get_supabase()"),
+    "query": ("query", "get_supabase(); get_embeddings(); get_llm()"),
+    "stream": ("stream", "get_supabase(); get_embeddings(); get_llm(streaming=True)"),
+}
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from _clients import *
+{setup}
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "setup_ms": (ready - imported) * 1000,
+    "modules": len(sys.modules),
+    "langchain": any(name.split(".")[0].startswith("langchain") for name in sys.modules),
+    "openai_sdk": "openai" in sys.modules,
+}}))
+"""
+
+STUB_ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_KEY": "stub.stub.stub",
+    "AZURE_OPENAI_EMBEDDING_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_OPENAI_EMBEDDING_API_KEY": "stub",
+    "AZURE_OPENAI_CHAT_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_OPENAI_CHAT_API_KEY": "stub",
+}
+
+
+def parse_importtime(stderr, top, module):
+    """Heaviest imports by cumulative time from -X importtime output.
+
+    Lists what the handler module pulls in directly (and other top-level
+    imports), not the handler itself or deeper nested modules.
+    """
+    totals = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1 or name.strip() == module:
+            continue
+        totals.append((name.strip(), int(cumulative) / 1000))
+    totals.sort(key=lambda item: item[1], reverse=True)
+    return [{"module": name, "cumulative_ms": ms} for name, ms in totals[:top]]
+
+
+def profile(api_dir, handler, repeat, top, extra_env):
+    module, setup = HANDLERS[handler]
+    env = dict(os.environ, **STUB_ENV, **extra_env)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    code = PROBE.format(module=module, setup=setup)
+    runs = []
+    imports = None
+    # One untimed run first so every timed run starts with warm .pyc files
+    for i in range(repeat + 1):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=api_dir, env=env, capture_output=True, text=True
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        if i == 0:
+            imports = parse_importtime(result.stderr, top, module)
+            continue
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        run["process_ms"] = wall_ms
+        runs.append(run)
+
+    return {
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "setup_ms": statistics.median(run["setup_ms"] for run in runs),
+        "process_ms": statistics.median(run["process_ms"] for run in runs),
+        "modules": runs[-1]["modules"],
+        "langchain": runs[-1]["langchain"],
+        "openai_sdk": runs[-1]["openai_sdk"],
+        "top_imports": imports,
+    }
+
+
+def extract_ref(ref, directory):
+    """Write the api/ directory of a git revision into directory and return its path."""
+    repo = subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True)
+    archive = subprocess.run(
+        ["git", "-C", repo.stdout.strip(), "archive", "--format=tar", ref, "api"],
+        capture_output=True, check=True
+    )
+    path = os.path.join(directory, "archive.tar")
+    with open(path, "wb") as f:
+        f.write(archive.stdout)
+    with tarfile.open(path) as tar:
+        tar.extractall(directory)
+    return os.path.join(directory, "api")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and client-setup profile of the serverless handlers.")
+    parser.add_argument("--ref", action="append",
+                        help="Git revision to profile (repeatable); WORKTREE is the working tree. Default: WORKTREE")
+    parser.add_argument("--handler", action="append", choices=sorted(HANDLERS), help="Default: all")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed cold starts per handler")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest top-level imports to list")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment, e.g. AZURE_OPENAI_CLIENT=langchain")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    refs = args.ref or ["WORKTREE"]
+    handlers = args.handler or list(HANDLERS)
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {"python": sys.version.split()[0], "repeat": args.repeat, "env": extra_env, "refs": {}}
+
+    print(f"{'ref':<12} {'handler':<11} {'import ms':>10} {'setup ms':>9} {'process ms':>11} "
+          f"{'modules':>8} {'langchain':>10}")
+    for ref in refs:
+        with tempfile.TemporaryDirectory() as directory:
+            api_dir = here if ref == "WORKTREE" else extract_ref(ref, directory)
+            results["refs"][ref] = {}
+            for handler in handlers:
+                row = profile(api_dir, handler, args.repeat, args.top, extra_env)
+                results["refs"][ref][handler] = row
+                if "error" in row:
+                    print(f"{ref:<12} {handler:<11} failed: {row['error']}")
+                    continue
+                print(f"{ref:<12} {handler:<11} {row['import_ms']:>10.1f} {row['setup_ms']:>9.1f} "
+                      f"{row['process_ms']:>11.1f} {row['modules']:>8} {str(row['langchain']):>10}")
+
+    for ref, rows in results["refs"].items():
+        for handler, row in rows.items():
+            if row.get("top_imports"):
+                heaviest = ", ".join(f"{item['module']} {item['cumulative_ms']:.0f}ms" for item in row["top_imports"][:5])
+                print(f"\n{ref} {handler}: {heaviest}", end="")
+    print()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
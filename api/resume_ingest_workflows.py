@@ -3,8 +3,8 @@ from dotenv import load_dotenv
 from supabase import create_client, Client
 from langchain_openai import AzureOpenAIEmbeddings
 import asyncio
-import csv
 import time
+from _ingest import BatchEmbedder, load_workflows_csv, insert_workflows, count_workflows, write_index_snapshot
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path='C:\\Users\\HomePC\\n8n workflow chat\\api\\.env')
@@ -27,7 +27,8 @@ embeddings_model = AzureOpenAIEmbeddings(
     azure_deployment="text-embedding-3-large",
     openai_api_version="2024-02-01",
     azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
-    api_key=AZURE_OPENAI_EMBEDDING_API_KEY
+    api_key=AZURE_OPENAI_EMBEDDING_API_KEY,
+    max_retries=0  # BatchEmbedder owns retries so it can see and adapt to 429s
 )
 
 def get_existing_workflow_names():
@@ -42,17 +43,9 @@ def get_existing_workflow_names():
         return set()
 
 # --- Load n8n Workflow Data from CSV ---
-n8n_workflow_data = []
 csv_file_path = "C:\\Users\\HomePC\\n8n workflow chat\\_n8n Templates 3000 - Templates.csv"
 try:
-    with open(csv_file_path, mode='r', encoding='utf-8') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            n8n_workflow_data.append({
-                "name": row["name"],
-                "description": row["description"],
-                "link": row["url"]
-            })
+    n8n_workflow_data = load_workflows_csv(csv_file_path)
     print(f"Successfully loaded {len(n8n_workflow_data)} workflows from CSV.")
 except FileNotFoundError:
     print(f"Error: CSV file not found at {csv_file_path}")
@@ -77,58 +70,39 @@ async def resume_ingest_data():
         print("All workflows are already in the database!")
         return
     
+    started = time.perf_counter()
+    embedder = BatchEmbedder(embeddings_model)
     success_count = 0
-    error_count = 0
     
-    for i, workflow in enumerate(workflows_to_process):
-        try:
-            print(f"Processing workflow {i+1}/{len(workflows_to_process)}: '{workflow['name'][:50]}...'")
-            
-            # Generate embedding for the description
-            embedding = embeddings_model.embed_query(workflow["description"])
-            
-            # Prepare data for insertion
-            data_to_insert = {
+    # Batches are embedded concurrently under the adaptive rate limiter and
+    # inserted as soon as each one completes
+    async for batch, vectors in embedder.embed(workflows_to_process):
+        rows = [
+            {
                 "name": workflow["name"],
                 "description": workflow["description"],
                 "link": workflow["link"],
                 "embedding": embedding
             }
-            
-            # Insert into Supabase
-            response = supabase.table("n8n_workflows").insert(data_to_insert).execute()
-            
-            if response.data:
-                success_count += 1
-                print(f"✅ Successfully inserted '{workflow['name'][:30]}...'")
-            else:
-                error_count += 1
-                print(f"❌ Failed to insert '{workflow['name'][:30]}...'")
-                if hasattr(response, 'error') and response.error:
-                    print(f"Error details: {response.error}")
-
-            # Add a small delay to avoid rate limiting
-            if i % 10 == 0 and i > 0:
-                print(f"Processed {i} workflows, taking a short break...")
-                time.sleep(1)
-
-        except Exception as e:
-            error_count += 1
-            print(f"❌ An error occurred while processing '{workflow['name'][:30]}...': {e}")
-            
-        # Progress update every 50 items
-        if (i + 1) % 50 == 0:
-            print(f"Progress: {i+1}/{len(workflows_to_process)} processed. Success: {success_count}, Errors: {error_count}")
+            for workflow, embedding in zip(batch, vectors)
+        ]
+        inserted = await insert_workflows(supabase, rows)
+        success_count += inserted
+        print(f"✅ Inserted {inserted}/{len(rows)} from batch. Progress: {success_count}/{len(workflows_to_process)}")
     
-    print(f"\n🎉 Data ingestion complete!")
+    error_count = len(workflows_to_process) - success_count
+    print(f"\n🎉 Data ingestion complete in {time.perf_counter() - started:.1f}s!")
     print(f"Total processed: {len(workflows_to_process)}")
     print(f"Successful insertions: {success_count}")
     print(f"Errors: {error_count}")
+    print(f"Embedding requests: {embedder.requests} ({embedder.rate_limited} rate limited)")
+    for workflow, error in embedder.failed:
+        print(f"❌ Failed to embed '{workflow['name'][:30]}...': {error}")
     
-    # Final count check
-    final_response = supabase.table("n8n_workflows").select("id").execute()
-    if final_response.data:
-        print(f"Total workflows in database: {len(final_response.data)}")
+    # Final count check (counted server-side)
+    print(f"Total workflows in database: {count_workflows(supabase)}")
 
 if __name__ == "__main__":
-    asyncio.run(resume_ingest_data())
\ No newline at end of file
+    asyncio.run(resume_ingest_data())
+    # Memory-mapped by the API workers instead of paging embeddings from Supabase
+    write_index_snapshot(supabase)
\ No newline at end of file
@@ -0,0 +1,53 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from _clients import get_supabase, get_embeddings
+from _vector_index import snapshot_only
+from _async_pipeline import StageTimeout
+from _search import SearchParams, SEARCH_CACHE_CONTROL, search_workflows, not_modified
+from _serverless import run_async, send_json, send_preflight, send_cors_headers
+
+# A cold instance maps a deployed snapshot or uses the match_workflows RPC;
+# it never downloads the embedding table
+snapshot_only()
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        send_preflight(self, 'GET, OPTIONS')
+
+    def do_GET(self):
+        try:
+            args = parse_qs(urlparse(self.path).query)
+            try:
+                params = SearchParams(
+                    args.get('q', [''])[0],
+                    int(args.get('page', ['1'])[0]),
+                    int(args.get('page_size', ['10'])[0])
+                )
+            except ValueError as e:
+                send_json(self, 400, {"error": str(e)}, 'GET, OPTIONS')
+                return
+            
+            # Revalidations are answered from the catalog version alone
+            etag = not_modified(params, self.headers.get('If-None-Match'))
+            if etag is not None:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', SEARCH_CACHE_CONTROL)
+                send_cors_headers(self, 'GET, OPTIONS')
+                self.end_headers()
+                return
+            
+            body, etag, cache_control = run_async(search_workflows(get_supabase(), get_embeddings(), params))
+            headers = {'Cache-Control': cache_control}
+            if etag is not None:
+                headers['ETag'] = etag
+            send_json(self, 200, body, 'GET, OPTIONS', headers)
+            
+        except StageTimeout as e:
+            print(f"Stage timeout: {str(e)}")
+            send_json(self, 504, {"error": str(e)}, 'GET, OPTIONS')
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            send_json(self, 500, {"error": str(e)}, 'GET, OPTIONS')
@@ -1,8 +1,7 @@
 from http.server import BaseHTTPRequestHandler
-import json
-import os
 from urllib.parse import urlparse, parse_qs
-from supabase import create_client, Client
+from _star_counter import star_counter
+from _serverless import client_ip, send_json, send_preflight
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -24,48 +23,14 @@ class handler(BaseHTTPRequestHandler):
             if not session_id:
                 raise ValueError("session_id is required")
             
-            # Initialize Supabase client
-            SUPABASE_URL = os.environ.get("SUPABASE_URL")
-            SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-            supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            # Stars still queued on this instance count as starred
+            has_starred = star_counter.has_starred(client_ip(self), session_id)
             
-            # Get client IP (handle various proxy headers)
-            client_ip = self.client_address[0]
-            if 'x-forwarded-for' in self.headers:
-                client_ip = self.headers['x-forwarded-for'].split(',')[0].strip()
-            elif 'x-real-ip' in self.headers:
-                client_ip = self.headers['x-real-ip']
-            
-            # Check if user has starred using database function
-            result = supabase.rpc('has_user_starred', {
-                'user_ip': client_ip,
-                'user_session': session_id
-            }).execute()
-            
-            # Return response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
-            response = {"has_starred": result.data}
-            self.wfile.write(json.dumps(response).encode())
+            send_json(self, 200, {"has_starred": has_starred}, 'GET, OPTIONS')
             
         except Exception as e:
             print(f"Error checking star status: {str(e)}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            error_response = {"error": str(e), "has_starred": False}
-            self.wfile.write(json.dumps(error_response).encode())
+            send_json(self, 500, {"error": str(e), "has_starred": False}, 'GET, OPTIONS')
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
\ No newline at end of file
+        send_preflight(self, 'GET, OPTIONS')
@@ -1,44 +1,18 @@
 from http.server import BaseHTTPRequestHandler
-import json
-import os
-from supabase import create_client, Client
+from _star_counter import star_counter
+from _serverless import send_json, send_preflight
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
-            # Initialize Supabase client
-            SUPABASE_URL = os.environ.get("SUPABASE_URL")
-            SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-            supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            # Served from the warm instance's cache; Supabase is only asked once the TTL lapses
+            count = star_counter.count()
             
-            # Get current star count using the database function
-            result = supabase.rpc('get_star_count').execute()
-            count = result.data if result.data is not None else 63
-            
-            # Return response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
-            response = {"count": count}
-            self.wfile.write(json.dumps(response).encode())
+            send_json(self, 200, {"count": count}, 'GET, OPTIONS')
             
         except Exception as e:
             print(f"Error getting star count: {str(e)}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            error_response = {"error": str(e)}
-            self.wfile.write(json.dumps(error_response).encode())
+            send_json(self, 500, {"error": str(e)}, 'GET, OPTIONS')
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
\ No newline at end of file
+        send_preflight(self, 'GET, OPTIONS')
@@ -1,169 +1,46 @@
-import os
-import json
-import asyncio
 from http.server import BaseHTTPRequestHandler
-from supabase import create_client, Client
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_openai import AzureChatOpenAI
+from _vector_index import snapshot_only
+from _recommendations import recommendation_stream
+from _sse import SSEWriter
+from _metrics import new_trace_id
+from _serverless import read_json_body, send_cors_headers, send_preflight, stream_events
 
-# --- Supabase and Azure OpenAI Configuration ---
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-AZURE_OPENAI_CHAT_API_KEY = os.environ.get("AZURE_OPENAI_CHAT_API_KEY")
-AZURE_OPENAI_CHAT_ENDPOINT = os.environ.get("AZURE_OPENAI_CHAT_ENDPOINT")
-AZURE_OPENAI_EMBEDDING_API_KEY = os.environ.get("AZURE_OPENAI_EMBEDDING_API_KEY")
-AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT")
+# A cold instance maps a deployed snapshot or uses the match_workflows RPC;
+# it never downloads the embedding table
+snapshot_only()
 
-# --- Supabase Client ---
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-async def get_workflow_recommendations_stream(query: str):
-    """Stream workflow recommendations using direct Supabase calls and Azure OpenAI."""
-    try:
-        # Initialize embeddings
-        embeddings = AzureOpenAIEmbeddings(
-            azure_deployment="text-embedding-3-large",
-            openai_api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
-            api_key=AZURE_OPENAI_EMBEDDING_API_KEY
-        )
-        
-        # Generate embedding for the query
-        query_embedding = embeddings.embed_query(query)
-        
-        # Search for similar workflows using direct RPC call
-        search_results = supabase.rpc('match_workflows', {
-            'query_embedding': query_embedding,
-            'match_threshold': 0.1,
-            'match_count': 5
-        }).execute()
-        
-        # Send source documents first
-        source_documents = [
-            {
-                "name": result['name'],
-                "description": result['description'],
-                "link": result['link']
-            }
-            for result in search_results.data
-        ]
-        
-        yield f"data: {json.dumps({'type': 'source_documents', 'data': source_documents})}\n\n"
-        
-        # Format the context for the LLM
-        context_docs = []
-        for result in search_results.data:
-            context_docs.append(f"Workflow: {result['name']}\nDescription: {result['description']}")
-        
-        context = "\n\n".join(context_docs)
-        
-        # Initialize LLM for streaming
-        llm = AzureChatOpenAI(
-            deployment_name="gpt-4-32k",
-            openai_api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_CHAT_ENDPOINT,
-            api_key=AZURE_OPENAI_CHAT_API_KEY,
-            temperature=0.7,
-            streaming=True
-        )
-        
-        # Create prompt for the LLM
-        prompt = f"""Based on the user's query: "{query}"
-
-Here are the most relevant n8n workflows I found:
-
-{context}
-
-Please provide a helpful response that:
-1. Directly answers the user's question
-2. For each recommended workflow, include:
-   - The workflow name in bold (use **name**)
-   - A "Why:" explanation of why this workflow is suitable for their needs
-3. Use numbered list format like:
-   1. **Workflow Name**
-      - **Why:** Explanation of why this workflow fits their needs
-4. Keep explanations concise but informative
-5. Do NOT include any links or URLs in your response
-
-Response:"""
-        
-        # Stream LLM response
-        try:
-            async for chunk in llm.astream(prompt):
-                if chunk.content:
-                    yield f"data: {json.dumps({'type': 'content', 'data': chunk.content})}\n\n"
-                    await asyncio.sleep(0.01)
-        except Exception as llm_error:
-            print(f"LLM streaming error: {str(llm_error)}")
-            yield f"data: {json.dumps({'type': 'error', 'data': str(llm_error)})}\n\n"
-        
-        # Always send done message (this will be sent again in the finally block, but that's ok)
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
-        
-    except Exception as e:
-        print(f"Error in streaming: {str(e)}")
-        yield f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
+async def _error_stream(writer, message):
+    yield writer.event('error', message)
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
+        send_preflight(self, 'POST, OPTIONS')
+
+    def do_POST(self):
+        # Set streaming headers
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        trace_id = new_trace_id(self.headers.get('traceparent'))
+        self.send_header('X-Trace-Id', trace_id)
+        self.send_header('Access-Control-Expose-Headers', 'X-Trace-Id')
+        send_cors_headers(self, 'POST, OPTIONS')
         self.end_headers()
 
-    def do_POST(self):
         try:
-            # Set streaming headers
-            self.send_response(200)
-            self.send_header('Content-type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-
-            # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                request_data = json.loads(post_data.decode('utf-8'))
-            else:
-                request_data = {}
-            
-            query = request_data.get('query', '')
-            print(f"Received streaming query: {query}")
-            
-            if not query:
-                error_data = f"data: {json.dumps({'type': 'error', 'data': 'Query parameter is required'})}\n\n"
-                self.wfile.write(error_data.encode('utf-8'))
-                return
-            
-            # Stream response
-            async def stream_response():
-                try:
-                    async for chunk in get_workflow_recommendations_stream(query):
-                        self.wfile.write(chunk.encode('utf-8'))
-                        self.wfile.flush()
-                except Exception as stream_error:
-                    print(f"Error during streaming: {str(stream_error)}")
-                    # Always send done message even if there's an error
-                    error_data = f"data: {json.dumps({'type': 'error', 'data': str(stream_error)})}\n\n"
-                    self.wfile.write(error_data.encode('utf-8'))
-                finally:
-                    # Ensure we always send the done message
-                    done_data = f"data: {json.dumps({'type': 'done'})}\n\n"
-                    self.wfile.write(done_data.encode('utf-8'))
-                    self.wfile.flush()
-            
-            # Run async function
-            asyncio.run(stream_response())
-            
-        except Exception as e:
-            print(f"Error in streaming: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            
-            error_data = f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
-            self.wfile.write(error_data.encode('utf-8'))
\ No newline at end of file
+            request_data = read_json_body(self)
+        except ValueError as e:
+            request_data = {}
+            print(f"Invalid request body: {str(e)}")
+        
+        query = request_data.get('query', '')
+        writer = SSEWriter.for_format(request_data.get('stream_format'))
+        print(f"[{trace_id}] Received streaming query: {query}")
+        
+        if not query:
+            stream_events(self, _error_stream(writer, 'Query parameter is required'), writer)
+            return
+        
+        # Frames are produced on the shared loop and written here with backpressure
+        stream_events(self, recommendation_stream(query, request_data.get('stream_format'), trace_id), writer)
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import asyncio
+from dotenv import load_dotenv
+from supabase import create_client, Client
+from langchain_openai import AzureOpenAIEmbeddings
+from _ingest import BatchEmbedder, load_workflows_csv, plan_sync, count_workflows, write_index_snapshot, publish_catalog_csv
+
+# Incremental catalog sync: re-embeds only rows whose content hash changed,
+# upserts them by link, and deletes rows that are no longer in the CSV.
+# Afterwards the CSV is published as the serving CSV (WORKFLOWS_CSV_PATH),
+# which is what tells running servers to rebuild their typeahead index.
+# Requires catalog_sync_setup.sql. An empty CSV is refused, and so is a plan
+# deleting more than SYNC_MAX_DELETE_FRACTION of the table unless
+# --allow-mass-delete is given.
+#
+#   python sync_workflows.py [path/to/templates.csv] [--dry-run] [--allow-mass-delete]
+
+load_dotenv()
+
+# --- Configuration from Environment Variables ---
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+AZURE_OPENAI_EMBEDDING_API_KEY = os.environ.get("AZURE_OPENAI_EMBEDDING_API_KEY")
+AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT")
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_n8n Templates 3000 - Templates.csv")
+
+if not all([SUPABASE_URL, SUPABASE_KEY, AZURE_OPENAI_EMBEDDING_API_KEY, AZURE_OPENAI_EMBEDDING_ENDPOINT]):
+    print("Error: Missing one or more required environment variables.")
+    exit(1)
+
+# --- Initialize Supabase Client ---
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# --- Initialize Azure OpenAI Embeddings ---
+embeddings_model = AzureOpenAIEmbeddings(
+    azure_deployment="text-embedding-3-large",
+    openai_api_version="2024-02-01",
+    azure_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
+    api_key=AZURE_OPENAI_EMBEDDING_API_KEY,
+    max_retries=0  # BatchEmbedder owns retries so it can see and adapt to 429s
+)
+
+PAGE_SIZE = 1000
+WRITE_CHUNK_SIZE = 50
+
+
+def fetch_catalog_state():
+    """Every row's id, link, hash and text fields -- but never the embeddings."""
+    rows = []
+    start = 0
+    while True:
+        response = (
+            supabase.table("n8n_workflows")
+            .select("id,name,description,link,content_hash")
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+async def upsert_workflows(rows):
+    written = 0
+    for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+        chunk = rows[start:start + WRITE_CHUNK_SIZE]
+        try:
+            response = await asyncio.to_thread(
+                supabase.table("n8n_workflows").upsert(chunk, on_conflict="link").execute
+            )
+            written += len(response.data or [])
+        except Exception as e:
+            print(f"Failed to upsert {len(chunk)} workflows starting with '{chunk[0]['name']}': {e}")
+    return written
+
+
+async def delete_workflows(ids):
+    deleted = 0
+    for start in range(0, len(ids), WRITE_CHUNK_SIZE):
+        chunk = ids[start:start + WRITE_CHUNK_SIZE]
+        try:
+            response = await asyncio.to_thread(
+                supabase.table("n8n_workflows").delete().in_("id", chunk).execute
+            )
+            deleted += len(response.data or [])
+        except Exception as e:
+            print(f"Failed to delete {len(chunk)} workflows: {e}")
+    return deleted
+
+
+async def sync_workflows(csv_file_path, dry_run=False, allow_mass_delete=False):
+    started = time.perf_counter()
+    csv_workflows = load_workflows_csv(csv_file_path)
+    print(f"Loaded {len(csv_workflows)} workflows from CSV.")
+
+    db_rows = await asyncio.to_thread(fetch_catalog_state)
+    print(f"Found {len(db_rows)} workflows in database.")
+
+    try:
+        to_embed, to_backfill, to_delete = plan_sync(csv_workflows, db_rows, allow_mass_delete=allow_mass_delete)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+    print(f"Plan: {len(to_embed)} new or changed, {len(to_backfill)} hashes to backfill, {len(to_delete)} to delete.")
+    if dry_run:
+        for workflow in to_embed[:20]:
+            print(f"  embed  '{workflow['name'][:60]}'")
+        return
+
+    # Unchanged legacy rows only need their hash recorded, no embedding call
+    backfilled = await upsert_workflows([
+        {key: workflow[key] for key in ("name", "description", "link", "content_hash")}
+        for workflow in to_backfill
+    ])
+
+    embedder = BatchEmbedder(embeddings_model)
+    upserted = 0
+    async for batch, vectors in embedder.embed(to_embed):
+        rows = [
+            {
+                "name": workflow["name"],
+                "description": workflow["description"],
+                "link": workflow["link"],
+                "content_hash": workflow["content_hash"],
+                "embedding": embedding
+            }
+            for workflow, embedding in zip(batch, vectors)
+        ]
+        upserted += await upsert_workflows(rows)
+        print(f"Upserted {upserted}/{len(to_embed)} changed workflows")
+
+    deleted = await delete_workflows(to_delete)
+
+    print(f"\nSync complete in {time.perf_counter() - started:.1f}s")
+    print(f"Embedded and upserted: {upserted}/{len(to_embed)} ({embedder.requests} embedding requests)")
+    print(f"Hashes backfilled: {backfilled}/{len(to_backfill)}")
+    print(f"Deleted: {deleted}/{len(to_delete)}")
+    for workflow, error in embedder.failed:
+        print(f"Failed to embed '{workflow['name'][:50]}': {error}")
+    print(f"Total workflows in database: {count_workflows(supabase)}")
+    await asyncio.to_thread(write_index_snapshot, supabase)
+    publish_catalog_csv(csv_file_path)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    asyncio.run(sync_workflows(
+        args[0] if args else DEFAULT_CSV_PATH,
+        dry_run="--dry-run" in sys.argv,
+        allow_mass_delete="--allow-mass-delete" in sys.argv
+    ))
@@ -0,0 +1,24 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from _typeahead import TYPEAHEAD_CACHE_CONTROL, typeahead_response
+from _serverless import send_json, send_preflight
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        send_preflight(self, 'GET, OPTIONS')
+
+    def do_GET(self):
+        try:
+            args = parse_qs(urlparse(self.path).query)
+            try:
+                body = typeahead_response(args.get('q', [''])[0], int(args.get('limit', ['8'])[0]))
+            except ValueError as e:
+                send_json(self, 400, {"error": str(e)}, 'GET, OPTIONS')
+                return
+            
+            # Answered from the in-memory index built from the templates CSV
+            send_json(self, 200, body, 'GET, OPTIONS', {'Cache-Control': TYPEAHEAD_CACHE_CONTROL})
+            
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            send_json(self, 500, {"error": str(e)}, 'GET, OPTIONS')
@@ -0,0 +1,30 @@
+-- =====================================================
+-- Incremental Catalog Sync Setup
+-- =====================================================
+-- Run this SQL in your Supabase SQL Editor before using api/sync_workflows.py
+-- It adds a content hash per workflow and makes the template URL the
+-- natural key, so changed rows can be upserted and removed rows deleted.
+
+-- 1. Hash of name + description + url, written by the sync script
+ALTER TABLE n8n_workflows ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- 2. Remove duplicate rows left by earlier name-based ingestion runs,
+--    keeping the oldest row for each link
+DELETE FROM n8n_workflows a
+USING n8n_workflows b
+WHERE a.link = b.link
+  AND a.id > b.id;
+
+-- 3. One row per template URL (required for upserts with on_conflict=link)
+CREATE UNIQUE INDEX IF NOT EXISTS n8n_workflows_link_key
+ON n8n_workflows (link);
+
+-- =====================================================
+-- Verification Queries (Optional - for testing)
+-- =====================================================
+
+-- Rows that have not been hashed yet (backfilled on the next sync)
+SELECT COUNT(*) AS unhashed_rows FROM n8n_workflows WHERE content_hash IS NULL;
+
+-- Total rows
+SELECT COUNT(*) AS total_workflows FROM n8n_workflows;
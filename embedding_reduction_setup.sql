@@ -0,0 +1,141 @@
+-- =====================================================
+-- Reduced-Dimension Embeddings + HNSW Index
+-- =====================================================
+-- Run this SQL in your Supabase SQL Editor (requires pgvector >= 0.7 for
+-- subvector() and l2_normalize()).
+--
+-- text-embedding-3-large is trained Matryoshka-style: its leading dimensions
+-- carry most of the signal, so a renormalized prefix is a good approximate
+-- embedding. We keep the full 3072-dim vector for exact scoring and add a
+-- 1024-dim prefix that fits under pgvector's 2000-dimension index limit.
+-- Run api/evaluate_embedding_dims.py to pick the prefix length.
+
+-- 1. Reduced embedding column (first 1024 dims, renormalized)
+ALTER TABLE n8n_workflows ADD COLUMN IF NOT EXISTS embedding_short vector(1024);
+
+-- 2. Keep embedding_short in sync with embedding on every insert/update,
+--    so the ingestion scripts do not need to know about it
+CREATE OR REPLACE FUNCTION n8n_workflows_set_embedding_short()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.embedding IS NULL THEN
+    NEW.embedding_short := NULL;
+  ELSE
+    NEW.embedding_short := l2_normalize(subvector(NEW.embedding, 1, 1024))::vector(1024);
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS n8n_workflows_embedding_short ON n8n_workflows;
+CREATE TRIGGER n8n_workflows_embedding_short
+BEFORE INSERT OR UPDATE OF embedding ON n8n_workflows
+FOR EACH ROW EXECUTE FUNCTION n8n_workflows_set_embedding_short();
+
+-- 3. Backfill existing rows
+UPDATE n8n_workflows
+SET embedding_short = l2_normalize(subvector(embedding, 1, 1024))::vector(1024)
+WHERE embedding IS NOT NULL AND embedding_short IS NULL;
+
+-- 4. HNSW index on the reduced column
+CREATE INDEX IF NOT EXISTS n8n_workflows_embedding_short_idx
+ON n8n_workflows
+USING hnsw (embedding_short vector_cosine_ops);
+
+-- 5. Keep the exact full-dimension search available under its own name
+DROP FUNCTION IF EXISTS match_workflows_exact(vector, double precision, integer);
+
+CREATE OR REPLACE FUNCTION match_workflows_exact(
+  query_embedding vector(3072),
+  match_threshold float DEFAULT 0.1,
+  match_count int DEFAULT 10
+)
+RETURNS TABLE (
+  id bigint,
+  name text,
+  description text,
+  link text,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    n8n_workflows.id,
+    n8n_workflows.name,
+    n8n_workflows.description,
+    n8n_workflows.link,
+    1 - (n8n_workflows.embedding <=> query_embedding) AS similarity
+  FROM n8n_workflows
+  WHERE 1 - (n8n_workflows.embedding <=> query_embedding) > match_threshold
+  ORDER BY n8n_workflows.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+-- 6. Two-stage match_workflows (same signature as before, so callers are unchanged):
+--    over-fetch candidates from the HNSW index on the reduced column, then
+--    rescore them exactly on the full 3072-dim vectors.
+DROP FUNCTION IF EXISTS match_workflows(vector, double precision, integer);
+DROP FUNCTION IF EXISTS match_workflows(vector, double precision, integer, integer);
+
+CREATE OR REPLACE FUNCTION match_workflows(
+  query_embedding vector(3072),
+  match_threshold float DEFAULT 0.1,
+  match_count int DEFAULT 10,
+  candidate_count int DEFAULT 100
+)
+RETURNS TABLE (
+  id bigint,
+  name text,
+  description text,
+  link text,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  query_short vector(1024) := l2_normalize(subvector(query_embedding, 1, 1024))::vector(1024);
+  -- hnsw.ef_search accepts at most 1000, so that is also the deepest candidate list
+  candidate_limit int := LEAST(GREATEST(candidate_count, match_count), 1000);
+BEGIN
+  -- ef_search must be at least the number of candidates we ask the index for
+  PERFORM set_config('hnsw.ef_search', LEAST(GREATEST(candidate_limit, 40), 1000)::text, true);
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT n8n_workflows.id
+    FROM n8n_workflows
+    ORDER BY n8n_workflows.embedding_short <=> query_short
+    LIMIT candidate_limit
+  )
+  SELECT
+    w.id,
+    w.name,
+    w.description,
+    w.link,
+    1 - (w.embedding <=> query_embedding) AS similarity
+  FROM n8n_workflows w
+  JOIN candidates c ON c.id = w.id
+  WHERE 1 - (w.embedding <=> query_embedding) > match_threshold
+  ORDER BY w.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+-- =====================================================
+-- Verification Queries (Optional - for testing)
+-- =====================================================
+
+-- Rows missing a reduced embedding (should be 0)
+SELECT COUNT(*) AS missing_short FROM n8n_workflows
+WHERE embedding IS NOT NULL AND embedding_short IS NULL;
+
+-- The candidate scan should use n8n_workflows_embedding_short_idx
+EXPLAIN
+SELECT id FROM n8n_workflows
+ORDER BY embedding_short <=> (SELECT embedding_short FROM n8n_workflows LIMIT 1)
+LIMIT 100;
@@ -4,6 +4,10 @@ import { Button } from "@/components/ui/button";
 import { Textarea } from "@/components/ui/textarea";
 import { Send, Loader2 } from "lucide-react";
 import { useState, useRef, useEffect, KeyboardEvent } from "react";
+import { prefetchQuery } from "@/lib/api";
+
+// Pause in typing after which the draft is sent to /query/prefetch
+const PREFETCH_DEBOUNCE_MS = 400;
 
 interface ChatInputProps {
   onSendMessage: (message: string) => void;
@@ -37,6 +41,13 @@ export function ChatInput({
     }
   };
 
+  // Warm the embedding and retrieval for the draft while the user is still typing
+  useEffect(() => {
+    if (disabled || !message.trim()) return;
+    const timer = setTimeout(() => prefetchQuery(message.trim()), PREFETCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [message, disabled]);
+
   // Auto-resize textarea
   useEffect(() => {
     const textarea = textareaRef.current;
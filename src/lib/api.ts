@@ -1,5 +1,7 @@
 export interface QueryRequest {
   query: string;
+  stream_format?: 'append';
+  client_id?: string;
 }
 
 export interface WorkflowResponse {
@@ -24,6 +26,28 @@ export interface Message {
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL || '/api';
 
+// Prefetch needs the long-running FastAPI backend (the dev proxy); the
+// serverless handlers keep no state between requests
+const PREFETCH_ENABLED = process.env.NODE_ENV === 'development' || process.env.NEXT_PUBLIC_QUERY_PREFETCH === '1';
+
+// Identifies this tab's drafts, so a newer draft replaces the older one on the server
+const CLIENT_ID = typeof crypto !== 'undefined' && 'randomUUID' in crypto
+  ? crypto.randomUUID()
+  : Math.random().toString(36).slice(2);
+
+export function prefetchQuery(query: string): void {
+  if (!PREFETCH_ENABLED || !query.trim()) return;
+  // Fire and forget: a failed prefetch only means the submit does the work itself
+  fetch(`${API_BASE_URL}/query/prefetch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ query, client_id: CLIENT_ID }),
+    keepalive: true,
+  }).catch(() => {});
+}
+
 export async function queryWorkflows(request: QueryRequest): Promise<QueryResponse> {
   const response = await fetch(`${API_BASE_URL}/query`, {
     method: 'POST',
@@ -50,7 +74,8 @@ export async function* streamWorkflows(request: QueryRequest): AsyncGenerator<{
     headers: {
       'Content-Type': 'application/json',
     },
-    body: JSON.stringify(request),
+    // Content arrives as raw `event: append` frames, so only control events need JSON parsing
+    body: JSON.stringify({ ...request, stream_format: 'append', client_id: CLIENT_ID }),
   });
 
   if (!response.ok) {
@@ -64,6 +89,8 @@ export async function* streamWorkflows(request: QueryRequest): AsyncGenerator<{
 
   const decoder = new TextDecoder();
   let buffer = '';
+  let eventName = '';
+  let dataLines: string[] = [];
 
   try {
     while (true) {
@@ -75,13 +102,24 @@ export async function* streamWorkflows(request: QueryRequest): AsyncGenerator<{
       buffer = lines.pop() || '';
 
       for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          try {
-            const data = JSON.parse(line.slice(6));
-            yield data;
-          } catch {
-            console.warn('Failed to parse SSE data:', line);
+        if (line.startsWith('event: ')) {
+          eventName = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+          dataLines.push(line.slice(6));
+        } else if (line === '' && dataLines.length > 0) {
+          // A blank line ends the event
+          const data = dataLines.join('\n');
+          if (eventName === 'append') {
+            yield { type: 'content', data };
+          } else {
+            try {
+              yield JSON.parse(data);
+            } catch {
+              console.warn('Failed to parse SSE data:', data);
+            }
           }
+          eventName = '';
+          dataLines = [];
         }
       }
     }
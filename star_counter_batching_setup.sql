@@ -0,0 +1,49 @@
+-- =====================================================
+-- Star Counter Write-Behind Batching Setup
+-- =====================================================
+-- Run this SQL in your Supabase SQL Editor after star_counter_setup.sql
+-- The API queues stars in memory and writes them in bulk with
+-- add_stars_batch(), so the total_stars row is updated once per flush
+-- instead of once per click.
+
+-- 1. Insert a batch of stars and bump the counter by the rows actually inserted
+--    stars: [{"user_ip": ..., "user_session": ..., "user_agent_string": ...}, ...]
+CREATE OR REPLACE FUNCTION add_stars_batch(stars JSONB)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+    new_count INTEGER;
+BEGIN
+    -- Stars already recorded (or repeated within the batch) are skipped
+    INSERT INTO user_stars (ip_address, session_id, user_agent)
+    SELECT s->>'user_ip', s->>'user_session', s->>'user_agent_string'
+    FROM jsonb_array_elements(stars) AS s
+    ON CONFLICT (ip_address, session_id) DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+
+    -- Only lock the counter row when there is something to add
+    IF inserted > 0 THEN
+        UPDATE site_stats
+        SET stat_value = stat_value + inserted, updated_at = NOW()
+        WHERE stat_name = 'total_stars'
+        RETURNING stat_value INTO new_count;
+    ELSE
+        SELECT stat_value INTO new_count FROM site_stats WHERE stat_name = 'total_stars';
+    END IF;
+
+    RETURN json_build_object(
+        'inserted', inserted,
+        'count', COALESCE(new_count, 63)
+    );
+END;
+$$;
+
+-- =====================================================
+-- Verification Queries (Optional - for testing)
+-- =====================================================
+
+-- An empty batch inserts nothing and returns the current count
+SELECT add_stars_batch('[]'::jsonb);
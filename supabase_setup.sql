@@ -36,6 +36,7 @@ $$;
 -- Note: Skipping index creation due to 2000 dimension limit
 -- The function will still work, just without index optimization
 -- You can create an index later if you switch to a smaller embedding model
+-- (embedding_reduction_setup.sql indexes a 1024-dim prefix and rescores on the full vector)
 
 -- CREATE INDEX IF NOT EXISTS n8n_workflows_embedding_idx 
 -- ON n8n_workflows 
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from _star_counter import StarCounter
+from _star_filter import StarMembership
+
+
+class MissingFunction(Exception):
+    code = "PGRST202"
+
+
+class FakeRpc:
+    """Star RPCs from star_counter_setup.sql, optionally without add_stars_batch."""
+
+    def __init__(self, batch_rpc=True, fail=False):
+        self.batch_rpc = batch_rpc
+        self.fail = fail
+        self.stars = set()
+        self.total = 10
+        self.calls = []
+
+    def rpc(self, name, params=None):
+        self.calls.append(name)
+        return type("Call", (), {"execute": lambda call: self._execute(name, params or {})})()
+
+    def _execute(self, name, params):
+        if name == "get_star_count":
+            data = self.total
+        elif name == "has_user_starred":
+            data = (params["user_ip"], params["user_session"]) in self.stars
+        elif self.fail:
+            raise RuntimeError("Supabase unavailable")
+        elif name == "add_stars_batch":
+            if not self.batch_rpc:
+                raise MissingFunction("Could not find the function public.add_stars_batch(stars)")
+            new = {(star["user_ip"], star["user_session"]) for star in params["stars"]} - self.stars
+            self.stars |= new
+            self.total += len(new)
+            data = {"inserted": len(new), "count": self.total}
+        elif name == "add_star":
+            key = (params["user_ip"], params["user_session"])
+            success = key not in self.stars
+            if success:
+                self.stars.add(key)
+                self.total += 1
+            data = {"success": success, "count": self.total}
+        return type("Response", (), {"data": data})()
+
+
+def _counter(client, **kwargs):
+    counter = StarCounter(client_factory=lambda: client, **kwargs)
+    counter.membership = StarMembership(capacity=100)
+    return counter
+
+
+def test_flush_falls_back_to_add_star_without_the_batch_function():
+    client = FakeRpc(batch_rpc=False)
+    counter = _counter(client)
+    counter.add("1.1.1.1", "s1")
+    counter.add("2.2.2.2", "s2")
+
+    assert counter.flush() == 2
+    assert client.stars == {("1.1.1.1", "s1"), ("2.2.2.2", "s2")}
+    assert counter.count() == 12
+    counter.add("3.3.3.3", "s3")
+    counter.flush()
+    assert client.calls.count("add_stars_batch") == 1
+
+
+def test_failed_flushes_are_retried_a_limited_number_of_times():
+    client = FakeRpc(fail=True)
+    counter = _counter(client, max_attempts=3)
+    counter.add("1.1.1.1", "s1")
+    assert counter.count() == 11
+
+    for _ in range(3):
+        counter.flush()
+    assert counter.stats()["pending"] == 0
+    assert counter.stats()["dropped"] == 1
+    assert counter.count() == 10
+
+
+def test_write_through_raises_when_the_star_is_not_written():
+    client = FakeRpc(fail=True)
+    counter = _counter(client)
+    with pytest.raises(RuntimeError):
+        counter.add("1.1.1.1", "s1", write_through=True)
+    assert counter.count() == 10
+
+    client.fail = False
+    assert counter.add("1.1.1.1", "s1", write_through=True) == {
+        "success": True, "message": "Star added successfully", "count": 11
+    }
+    assert ("1.1.1.1", "s1") in client.stars
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from _star_filter import StarMembership
+
+
+class _Query:
+    def __init__(self, rows):
+        self._rows = rows
+        self._min_id = None
+        self._limit = None
+
+    def select(self, columns):
+        return self
+
+    def gt(self, column, value):
+        self._min_id = value
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        rows = sorted((row for row in self._rows if row["id"] > self._min_id), key=lambda row: row["id"])
+        return type("Response", (), {"data": rows[:self._limit]})()
+
+
+class FakeSupabase:
+    """Just enough of the client for StarMembership's user_stars reads."""
+
+    def __init__(self):
+        self.rows = []
+        self.fail = False
+
+    def table(self, name):
+        if self.fail:
+            raise RuntimeError("user_stars unavailable")
+        return _Query(self.rows)
+
+    def star(self, ip, session):
+        self.rows.append({"id": len(self.rows) + 1, "ip_address": ip, "session_id": session})
+
+
+def test_star_added_by_another_instance_is_seen_after_the_trust_window():
+    supabase = FakeSupabase()
+    writer = StarMembership(capacity=100, trust_seconds=0.05)
+    reader = StarMembership(capacity=100, trust_seconds=0.05)
+    assert reader.check(supabase, "1.1.1.1", "s1") == "no"
+
+    # Another worker (or the star_add function) records the star
+    supabase.star("1.1.1.1", "s1")
+    writer.add("1.1.1.1", "s1")
+    time.sleep(0.1)
+
+    assert reader.check(supabase, "1.1.1.1", "s1") == "maybe"
+    assert reader.might_have_starred(supabase, "1.1.1.1", "s1")
+
+
+def test_stale_filter_is_not_trusted_while_another_check_syncs():
+    supabase = FakeSupabase()
+    membership = StarMembership(capacity=100, trust_seconds=0.05)
+    assert membership.check(supabase, "1.1.1.1", "s1") == "no"
+    time.sleep(0.1)
+
+    membership._sync_lock.acquire()
+    try:
+        assert membership.check(supabase, "1.1.1.1", "s1") == "unknown"
+    finally:
+        membership._sync_lock.release()
+
+
+def test_single_writer_trusts_a_fresh_miss():
+    supabase = FakeSupabase()
+    supabase.star("1.1.1.1", "s1")
+    membership = StarMembership(capacity=100, single_writer=True)
+
+    assert membership.check(supabase, "1.1.1.1", "s1") == "maybe"
+    assert membership.check(supabase, "2.2.2.2", "s2") == "no"
+    membership.add("2.2.2.2", "s2")
+    assert membership.check(supabase, "2.2.2.2", "s2") == "maybe"
+
+
+def test_miss_is_not_trusted_after_a_failed_sync():
+    supabase = FakeSupabase()
+    membership = StarMembership(capacity=100, sync_seconds=0.05, single_writer=True)
+    assert membership.check(supabase, "1.1.1.1", "s1") == "no"
+
+    supabase.star("1.1.1.1", "s1")
+    supabase.fail = True
+    time.sleep(0.1)
+
+    assert membership.check(supabase, "1.1.1.1", "s1") == "unknown"
+    assert membership.check(supabase, "1.1.1.1", "s1") == "unknown"
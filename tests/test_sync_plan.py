@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from _ingest import content_hash, load_workflows_csv, plan_sync
+
+
+def _workflow(i):
+    return {"name": f"Workflow {i}", "description": f"Does thing {i}", "link": f"https://n8n.io/workflows/{i}"}
+
+
+def _db_rows(count):
+    return [dict(_workflow(i), id=i, content_hash=content_hash(_workflow(i))) for i in range(count)]
+
+
+def test_empty_csv_aborts_instead_of_deleting_the_table(tmp_path):
+    csv_path = tmp_path / "templates.csv"
+    csv_path.write_text("name,description,url,score\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="no workflows"):
+        plan_sync(load_workflows_csv(csv_path), _db_rows(10))
+    with pytest.raises(ValueError, match="no workflows"):
+        plan_sync([], _db_rows(10), allow_mass_delete=True)
+
+
+def test_mass_delete_needs_explicit_permission():
+    csv_workflows = [_workflow(i) for i in range(3)]
+
+    with pytest.raises(ValueError, match="--allow-mass-delete"):
+        plan_sync(csv_workflows, _db_rows(10))
+    to_embed, to_backfill, to_delete = plan_sync(csv_workflows, _db_rows(10), allow_mass_delete=True)
+    assert (to_embed, to_backfill, sorted(to_delete)) == ([], [], list(range(3, 10)))
+
+
+def test_small_sync_plans_embeds_and_deletes():
+    csv_workflows = [_workflow(i) for i in range(1, 11)]
+
+    to_embed, to_backfill, to_delete = plan_sync(csv_workflows, _db_rows(10))
+    assert [workflow["link"] for workflow in to_embed] == [_workflow(10)["link"]]
+    assert to_backfill == []
+    assert to_delete == [0]